@@ -1,12 +1,13 @@
 from django.contrib import admin
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, DailyPoints, Leaderboard, TeamStanding, UserStats, Workout
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     """Admin interface for User model."""
-    list_display = ('id', 'name', 'email', 'team_id', 'created_at')
-    list_filter = ('team_id', 'created_at')
+    list_display = ('id', 'name', 'email', 'team', 'created_at')
+    list_filter = ('team', 'created_at')
+    list_select_related = ('team',)
     search_fields = ('name', 'email')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
@@ -25,9 +26,11 @@ class TeamAdmin(admin.ModelAdmin):
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
     """Admin interface for Activity model."""
-    list_display = ('id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at')
+    list_display = ('id', 'user', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at')
     list_filter = ('activity_type', 'date', 'created_at')
-    search_fields = ('user_id', 'activity_type')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__name', 'activity_type')
     ordering = ('-date', '-created_at')
     readonly_fields = ('created_at',)
     date_hierarchy = 'date'
@@ -36,13 +39,48 @@ class ActivityAdmin(admin.ModelAdmin):
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     """Admin interface for Leaderboard model."""
-    list_display = ('id', 'user_id', 'team_id', 'total_points', 'rank', 'updated_at')
-    list_filter = ('rank', 'team_id', 'updated_at')
-    search_fields = ('user_id', 'team_id')
+    list_display = ('id', 'user', 'team', 'total_points', 'rank', 'updated_at')
+    list_filter = ('rank', 'team', 'updated_at')
+    list_select_related = ('user', 'team')
+    raw_id_fields = ('user',)
+    search_fields = ('user__name', 'team__name')
     ordering = ('rank', '-total_points')
     readonly_fields = ('updated_at',)
 
 
+@admin.register(DailyPoints)
+class DailyPointsAdmin(admin.ModelAdmin):
+    """Admin interface for DailyPoints model."""
+    list_display = ('id', 'user', 'day', 'points', 'activity_count')
+    list_filter = ('day',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__name',)
+    ordering = ('-day', 'user')
+    date_hierarchy = 'day'
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    """Admin interface for UserStats model."""
+    list_display = ('id', 'user', 'activity_count', 'total_calories', 'current_streak', 'last_active_day', 'updated_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__name',)
+    ordering = ('user',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(TeamStanding)
+class TeamStandingAdmin(admin.ModelAdmin):
+    """Admin interface for TeamStanding model."""
+    list_display = ('id', 'team', 'total_points', 'member_count', 'average_points', 'rank', 'updated_at')
+    list_select_related = ('team',)
+    search_fields = ('team__name',)
+    ordering = ('rank',)
+    readonly_fields = ('updated_at',)
+
+
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
     """Admin interface for Workout model."""
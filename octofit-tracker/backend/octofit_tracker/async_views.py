@@ -0,0 +1,117 @@
+"""
+Async read path for the router resources.
+
+Under ASGI, Django runs every synchronous view in a thread of its own that is
+held for the whole request, including the time spent waiting on the database,
+and that opens and closes its own connection. Django 4.1's async ORM methods
+are thin wrappers over the same thread-sensitive machinery, and djongo has no
+async driver. The views here keep request handling on the event loop and hand
+only the query itself to a bounded pool of database threads whose
+connections persist between requests.
+
+Only JSON list and detail reads take this path. Anything else (the browsable
+API, other renderers, windowed leaderboards, invalid parameters, missing
+objects) is answered by the regular viewset, so responses are the same as on
+``/api/``. Viewsets with ETag/Last-Modified validators or a response cache
+(see caching.py) get them here too.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import caching
+from .caching import CachedResponseMixin, ConditionalGetMixin
+from .fastpath import represent
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'OCTOFIT_ASYNC_DB_THREADS', 32),
+    thread_name_prefix='octofit-db',
+)
+
+
+def run_query(func, *args, **kwargs):
+    """Run a blocking ORM call on the database thread pool."""
+    return sync_to_async(func, thread_sensitive=False, executor=_executor)(*args, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def _sync_view(viewset, action):
+    return viewset.as_view({'get': action})
+
+
+class AsyncReadView(View):
+    """
+    ``list`` (no ``pk``) and ``retrieve`` for ``viewset``, served asynchronously.
+
+    Requests carrying any of ``fallback_params`` go to the viewset.
+    """
+    viewset = None
+    fallback_params = ()
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, pk=None):
+        action = 'list' if pk is None else 'retrieve'
+        kwargs = {} if pk is None else {'pk': pk}
+        drf_request = Request(request)
+        view = self.viewset(request=drf_request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+
+        try:
+            renderer, media_type = view.perform_content_negotiation(drf_request)
+            drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, media_type
+            columns = view.fast_columns()
+            queryset = view.fast_queryset(columns) if columns is not None else None
+        except APIException:
+            columns = None
+        if (columns is None or not isinstance(renderer, JSONRenderer)
+                or any(param in drf_request.query_params for param in self.fallback_params)):
+            return await self.fallback(request, action, kwargs)
+
+        # Errors are answered by the viewset, through its exception handling.
+        try:
+            validators = None
+            if isinstance(view, ConditionalGetMixin):
+                validators = await run_query(view.validators, drf_request)
+                not_modified = get_conditional_response(request, *validators)
+                if not_modified is not None:
+                    return view.add_validators(not_modified, *validators)
+            key = data = None
+            if isinstance(view, CachedResponseMixin):
+                key = await run_query(view.cache_key, drf_request)
+                data = await run_query(cache.get, key)
+                caching.counters.record(hit=data is not None)
+            cached = data is not None
+            if not cached:
+                data = await self.read(view, queryset, columns, pk)
+                if key is not None:
+                    await run_query(cache.set, key, data, None)
+        except (APIException, ObjectDoesNotExist, TypeError, ValueError, ValidationError):
+            return await self.fallback(request, action, kwargs)
+
+        response = HttpResponse(renderer.render(data, media_type, {'request': drf_request, 'view': view}),
+                                content_type=media_type)
+        patch_vary_headers(response, ('Accept',))
+        if key is not None:
+            response['X-Cache'] = 'HIT' if cached else 'MISS'
+        if validators is not None:
+            view.add_validators(response, *validators)
+        return response
+
+    async def read(self, view, queryset, columns, pk):
+        if pk is not None:
+            return represent([await run_query(queryset.get, pk=pk)], columns)[0]
+        page = await run_query(view.paginate_queryset, queryset)
+        data = represent(page if page is not None else await run_query(list, queryset), columns)
+        return view.get_paginated_response(data).data if page is not None else data
+
+    async def fallback(self, request, action, kwargs):
+        return await sync_to_async(_sync_view(self.viewset, action))(request, **kwargs)
@@ -0,0 +1,254 @@
+"""
+Versioned caching.
+
+Every model in this app has a version counter in the cache that is bumped when
+a write to it commits. Cached responses are keyed on the versions of the models
+they were built from, so a write makes the old entries unreachable at once and
+nothing needs a TTL. Stale entries simply age out of the backend.
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class _Counters:
+    """Process-local hit/miss counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+counters = _Counters()
+
+PROCESS_LOCAL_WARNING = (
+    'The cache is local to each process, so the API server keeps serving responses cached before these '
+    'writes. Set OCTOFIT_CACHE_URL or OCTOFIT_CACHE_DIR for every process, or restart the server.'
+)
+
+
+def is_process_local():
+    """Whether version counters live in this process's memory, out of other processes' sight."""
+    return isinstance(caches['default'], LocMemCache)
+
+
+def bump(key):
+    """Advance a version counter."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Seed missing counters from the clock rather than 0, so a counter
+        # lost to eviction never returns to a version an old entry used.
+        cache.add(key, time.time_ns())
+
+
+# The (keys, models) bumped inside ``batched``, bumped once when it exits.
+_pending = ContextVar('octofit_cache_pending', default=None)
+
+
+def bump_on_commit(key):
+    """
+    Advance a version counter now and again when the transaction commits.
+
+    The first bump keeps this transaction from reading its own stale entries;
+    the second drops anything a concurrent reader cached from the
+    pre-commit state in between.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending[0].add(key)
+        return
+    bump(key)
+    transaction.on_commit(lambda: bump(key))
+
+
+def versions(keys):
+    """Return the current value of each version counter, creating missing ones."""
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        cache.add(key, time.time_ns())
+    if missing:
+        found.update(cache.get_many(missing))
+    return [str(found.get(key)) for key in keys]
+
+
+def digest(keys):
+    """A short fingerprint of the current versions of ``keys``."""
+    return hashlib.md5(':'.join(versions(keys)).encode('ascii')).hexdigest()
+
+
+def model_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def modified_key(model):
+    return f'modified:{model._meta.label_lower}'
+
+
+def touch(key):
+    """Move a modification time forward to the current second."""
+    now = int(time.time())
+    if (cache.get(key) or 0) < now:
+        cache.set(key, now, None)
+
+
+def bump_model(*models):
+    """Invalidate every cached response built from ``models`` on commit."""
+    pending = _pending.get()
+    if pending is not None:
+        pending[1].update(models)
+        return
+    for model in models:
+        bump_on_commit(model_key(model))
+        # Stamped again at commit, so a long transaction cannot leave the
+        # time earlier than the data it makes visible.
+        touch(modified_key(model))
+        transaction.on_commit(lambda key=modified_key(model): touch(key))
+
+
+@contextmanager
+def batched():
+    """Bump each counter and model written inside the block once, when it exits."""
+    if _pending.get() is not None:
+        yield
+        return
+    keys, models = pending = set(), set()
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        # Bumped even after an error: a needless bump only costs a cache miss.
+        _pending.reset(token)
+        for key in keys:
+            bump_on_commit(key)
+        bump_model(*models)
+
+
+def last_modified(models):
+    """Unix time of the latest write to any of ``models``, as far as this cache knows."""
+    keys = [modified_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, int(time.time()), None)
+    if len(found) < len(keys):
+        found = cache.get_many(keys)
+    return max(found.values(), default=int(time.time()))
+
+
+class VersionedViewMixin:
+    """
+    Base for viewset mixins keyed on model versions.
+
+    ``cache_models`` names the models a viewset's responses are built from and
+    defaults to the queryset's model.
+    """
+    cache_models = ()
+
+    def versioned_models(self, models=None):
+        return models or self.cache_models or (self.get_queryset().model,)
+
+
+class ConditionalGetMixin(VersionedViewMixin):
+    """
+    Answer ``list`` and ``retrieve`` with ETag and Last-Modified validators.
+
+    Both are derived from model versions held in the cache, so a request whose
+    ``If-None-Match`` or ``If-Modified-Since`` still matches gets a 304 before
+    any query runs or anything is serialized. Last-Modified only has whole
+    seconds, so it is left out while the last write is in the current second:
+    a later write in the same second would carry the same time.
+    """
+
+    def validators(self, request, models=None):
+        """``(etag, last_modified)`` for ``request``; ``last_modified`` is ``None`` within the current second."""
+        models = self.versioned_models(models)
+        fingerprint = digest([model_key(model) for model in models])
+        etag = quote_etag(hashlib.md5(
+            f'{fingerprint}:{request.accepted_renderer.format}:{request.get_full_path()}'.encode('utf-8')
+        ).hexdigest())
+        modified = last_modified(models)
+        return etag, (modified if modified < int(time.time()) else None)
+
+    @staticmethod
+    def add_validators(response, etag, modified):
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if modified is not None:
+                response['Last-Modified'] = http_date(modified)
+        return response
+
+    def conditional(self, request, build, models=None):
+        etag, modified = self.validators(request, models)
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = build()
+        return self.add_validators(response, etag, modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+class CachedResponseMixin(VersionedViewMixin):
+    """
+    Cache ``list`` and ``retrieve`` response data for a viewset.
+
+    The cache key combines the versions of ``cache_models`` with the full
+    request path, so any write to one of them is seen by the very next read.
+    """
+
+    def cache_key(self, request, models=None):
+        models = self.versioned_models(models)
+        fingerprint = digest([model_key(model) for model in models])
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        return f'response:{type(self).__name__}:{self.action}:{path}:{fingerprint}'
+
+    def cached(self, request, build, models=None):
+        """Serve ``build()``'s response data from the cache while ``models`` are unchanged."""
+        key = self.cache_key(request, models)
+        data = cache.get(key)
+        counters.record(hit=data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = build()
+        if response.status_code == 200:
+            cache.set(key, response.data, None)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
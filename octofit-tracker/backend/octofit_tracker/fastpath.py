@@ -0,0 +1,157 @@
+"""
+Fast read path for list actions.
+
+``ModelSerializer`` builds a model instance per row and then walks its field
+machinery for every attribute, which dominates CPU time on long lists. For
+serializers whose readable fields are all plain model columns, the same output
+can be produced from ``values()`` rows by applying each field's
+``to_representation`` directly, and skipping even that where the database
+already returns the representation's type. Primary keys of related rows and
+columns reached through foreign keys (``source='user.name'``) count as plain
+columns; the latter are joined in by ``values()``.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import timing
+
+
+def _identity(value):
+    return value
+
+
+# Serializer fields whose to_representation is a no-op for the Python type
+# the database driver already returns for the matching model field.
+_PASSTHROUGH = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.BooleanField: bool,
+}
+
+
+def _datetime_converter(field):
+    """
+    ``DateTimeField.to_representation`` with the timezone and format looked up
+    once rather than per value; anything unusual goes through the field.
+    """
+    to_representation = field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if tz is None or output_format is None or output_format.lower() != ISO_8601:
+        return lambda value: None if value is None else to_representation(value)
+
+    def convert(value):
+        if value is None or isinstance(value, str) or value.utcoffset() is None:
+            return None if value is None else to_representation(value)
+        try:
+            text = value.astimezone(tz).isoformat()
+        except OverflowError:
+            return to_representation(value)
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+def _converter(field):
+    if type(field) is serializers.DateTimeField:
+        return _datetime_converter(field)
+    expected = _PASSTHROUGH.get(type(field))
+    if expected is None:
+        to_representation = field.to_representation
+        return lambda value: None if value is None else to_representation(value)
+    if expected is float:
+        # Integers stored in float columns must still come out as floats.
+        return lambda value: value if value is None or type(value) is float else float(value)
+    return _identity
+
+
+def column_lookup(model, field):
+    """
+    The ``values()`` lookup that reads ``field`` straight off a row of
+    ``model``, or ``None`` if it cannot be read that way.
+    """
+    if field.source == '*':
+        return None
+    *path, last = field.source.split('.')
+    try:
+        for step in path:
+            relation = model._meta.get_field(step)
+            if not isinstance(relation, models.ForeignKey):
+                return None
+            model = relation.related_model
+        column = model._meta.get_field(last)
+    except FieldDoesNotExist:
+        return None
+    if not column.concrete:
+        return None
+    if isinstance(column, models.ForeignKey):
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            return '__'.join([*path, column.name]) if path else column.attname
+        return None
+    if column.is_relation or isinstance(field, serializers.RelatedField):
+        return None
+    return '__'.join([*path, last])
+
+
+def plain_fields(serializer):
+    """
+    Map readable field names to ``(lookup, converter)`` pairs, or return
+    ``None`` if any field is not a plain column.
+    """
+    model = serializer.Meta.model
+    columns = {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        lookup = column_lookup(model, field)
+        if lookup is None:
+            return None
+        # A related row's primary key comes back from values() as it is.
+        convert = _identity if isinstance(field, serializers.PrimaryKeyRelatedField) else _converter(field)
+        columns[name] = (lookup, convert)
+    return columns
+
+
+def represent(rows, columns):
+    """Turn ``values()`` rows into serializer-shaped dicts."""
+    items = tuple((name, lookup, convert) for name, (lookup, convert) in columns.items())
+    rows = list(rows)
+    with timing.measure('serialize'):
+        return [{name: convert(row[lookup]) for name, lookup, convert in items} for row in rows]
+
+
+class FastListMixin:
+    """
+    Serve ``list`` from ``values()`` rows instead of serializer instances.
+
+    The output is identical to the serializer's; viewsets whose serializer
+    has computed or related fields fall back to the normal path. Set
+    ``fast_list = False`` to switch it off.
+    """
+    fast_list = True
+
+    def fast_columns(self):
+        """Columns for the fast path, or ``None`` if the view cannot use it."""
+        return plain_fields(self.get_serializer()) if self.fast_list else None
+
+    def fast_queryset(self, columns):
+        # Keyset pagination reads its ordering fields off every row.
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        lookups = [lookup for lookup, _ in columns.values()]
+        return self.filter_queryset(self.get_queryset()).values(*dict.fromkeys([*lookups, *ordering]))
+
+    def list(self, request, *args, **kwargs):
+        columns = self.fast_columns()
+        if columns is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.fast_queryset(columns)
+        page = self.paginate_queryset(queryset)
+        data = represent(page if page is not None else queryset, columns)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
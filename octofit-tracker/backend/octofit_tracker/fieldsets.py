@@ -0,0 +1,93 @@
+"""
+Sparse fieldsets.
+
+``?fields=id,calories`` returns only the named fields and ``?exclude=distance``
+drops fields. The selection trims the serializer and is pushed down into the
+queryset with ``only()``, which djongo turns into a Mongo projection, so
+unwanted columns are neither fetched nor rendered. Only readable fields can be
+selected, so write-only fields such as ``password`` are never exposed.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .fastpath import column_lookup
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+def _model_field(model, path, name):
+    try:
+        for step in path:
+            model = model._meta.get_field(step).related_model
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+class SparseFieldsetMixin:
+    """Honour ``?fields=`` and ``?exclude=`` on the actions in ``sparse_actions``."""
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    sparse_actions = ('list', 'retrieve')
+
+    def sparse_fields(self):
+        """The requested field names in serializer order, or ``None`` for all of them."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        request = self.request
+        if request is None or request.method not in SAFE_METHODS or self.action not in self.sparse_actions:
+            return None
+        include = _split(request.query_params.get(self.fields_query_param))
+        exclude = _split(request.query_params.get(self.exclude_query_param))
+        if not include and not exclude:
+            return None
+
+        readable = [name for name, field in self.get_serializer_class()().fields.items() if not field.write_only]
+        errors = {}
+        for param, names in ((self.fields_query_param, include), (self.exclude_query_param, exclude)):
+            unknown = [name for name in names if name not in readable]
+            if unknown:
+                errors[param] = [f'Unknown field "{name}".' for name in unknown]
+        if errors:
+            raise ValidationError(errors)
+        selected = tuple(name for name in readable if (not include or name in include) and name not in exclude)
+        if not selected:
+            raise ValidationError({self.exclude_query_param: ['No fields left to return.']})
+        return selected
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.sparse_fields()
+        if fields is None or queryset.model is not self.get_serializer_class().Meta.model:
+            return queryset
+        serializer_fields = self.get_serializer_class()().fields
+        lookups = [column_lookup(queryset.model, serializer_fields[name]) for name in fields]
+        # Keyset pagination reads its ordering fields off every row.
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        # only() takes field names, and a related column needs its relation
+        # loaded, so 'user_id' becomes 'user' and 'user__name' brings 'user'.
+        names, relations = [], []
+        for lookup in (*filter(None, lookups), *ordering):
+            *path, last = lookup.split('__')
+            relations.extend('__'.join(path[:depth]) for depth in range(1, len(path) + 1))
+            field = _model_field(queryset.model, path, last)
+            if field is not None:
+                names.append('__'.join([*path, field.name]))
+        if queryset.query.select_related:
+            # Joins nobody asked for would be deferred and traversed at once.
+            queryset = queryset.select_related(None)
+            if relations:
+                queryset = queryset.select_related(*dict.fromkeys(relations))
+        return queryset.only(*dict.fromkeys([*relations, *names]))
@@ -0,0 +1,195 @@
+"""
+Write-behind ingestion of activities.
+
+With ``OCTOFIT_INGEST_QUEUE`` set to a file path, activity POSTs are
+validated, appended to a SQLite queue in that file and answered with 202; no
+row is written to the main database and none of the leaderboard, rollup or
+stats work runs inside the request. ``manage.py ingest_worker`` drains the
+queue: it takes a batch, inserts it with one ``bulk_create`` and applies the
+downstream updates once per batch, all in one transaction (group commit).
+Activities with an ``external_id`` are matched as in a direct write.
+
+An entry is acknowledged, i.e. deleted from the queue, only after the
+transaction holding it has committed. The same transaction advances an
+``IngestCheckpoint`` row, so entries that were applied but not yet
+acknowledged when a worker died are recognised and skipped on restart:
+every accepted activity is applied exactly once.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import metrics, upserts
+from .models import Activity, IngestCheckpoint, User
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS queue ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, enqueued_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+)
+
+
+class IngestQueue:
+    """
+    A durable FIFO of JSON payloads in a SQLite file.
+
+    Entry ids increase and are never reused, so "everything up to id N" is a
+    complete description of what has been applied. Each thread gets its own
+    connection; any number of processes may append while one worker drains.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.queue_id = self._connect().execute("SELECT value FROM meta WHERE key = 'queue_id'").fetchone()[0]
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # An accepted entry must survive a power cut, not just a crash.
+            connection.execute('PRAGMA synchronous=FULL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            # Identifies this queue file to the checkpoint, so a fresh file starts from zero.
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('queue_id', ?)", (str(uuid.uuid4()),))
+            self._local.connection = connection
+        return connection
+
+    def put(self, payloads):
+        """Append ``payloads`` in one transaction and return their ids."""
+        connection = self._connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [connection.execute('INSERT INTO queue (payload, enqueued_at) VALUES (?, ?)',
+                                      (payload, now)).lastrowid
+                   for payload in payloads]
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return ids
+
+    def take(self, limit):
+        """The oldest ``limit`` entries as ``(id, payload, enqueued_at)``, left in the queue."""
+        return self._connect().execute(
+            'SELECT id, payload, enqueued_at FROM queue ORDER BY id LIMIT ?', (limit,)).fetchall()
+
+    def ack(self, last_id):
+        """Drop every entry up to and including ``last_id``."""
+        self._connect().execute('DELETE FROM queue WHERE id <= ?', (last_id,))
+
+    def depth(self):
+        return self._connect().execute('SELECT COUNT(*) FROM queue').fetchone()[0]
+
+    def lag(self):
+        """Seconds the oldest waiting entry has been queued, or 0 when empty."""
+        oldest = self._connect().execute('SELECT MIN(enqueued_at) FROM queue').fetchone()[0]
+        return max(time.time() - oldest, 0.0) if oldest is not None else 0.0
+
+
+@lru_cache(maxsize=None)
+def _open(path):
+    return IngestQueue(path)
+
+
+def get_queue():
+    """The configured queue, or ``None`` when activities are written directly."""
+    path = getattr(settings, 'OCTOFIT_INGEST_QUEUE', None)
+    return _open(path) if path else None
+
+
+def encode(validated_data):
+    """Serialize an activity's validated data as a queue payload."""
+    row = {}
+    for name, value in validated_data.items():
+        field = Activity._meta.get_field(name)
+        if field.is_relation:
+            name, value = field.attname, value.pk
+        row[name] = value
+    return json.dumps(row, cls=DjangoJSONEncoder)
+
+
+def decode(payload):
+    """The unsaved ``Activity`` a payload describes."""
+    return Activity(**{
+        name: Activity._meta.get_field(name).to_python(value) for name, value in json.loads(payload).items()
+    })
+
+
+def enqueue(items):
+    """Queue activities from a list of validated data and return their tickets."""
+    tickets = get_queue().put([encode(item) for item in items])
+    accepted_total.inc(amount=len(tickets))
+    return tickets
+
+
+def apply_batch(queue, batch_size):
+    """
+    Apply up to ``batch_size`` entries in one transaction and acknowledge
+    them. Returns the number of entries taken off the queue.
+    """
+    batch = queue.take(batch_size)
+    if not batch:
+        return 0
+    last_id = batch[-1][0]
+    with transaction.atomic():
+        checkpoint, _ = IngestCheckpoint.objects.select_for_update().get_or_create(queue_id=queue.queue_id)
+        # Entries at or below the checkpoint were committed by a worker that
+        # died before acknowledging them.
+        fresh = [(decode(payload), enqueued_at) for entry_id, payload, enqueued_at in batch
+                 if entry_id > checkpoint.last_id]
+        users = {activity.user_id for activity, _ in fresh}
+        known = set(User.objects.filter(pk__in=users).values_list('pk', flat=True))
+        live = [activity for activity, _ in fresh if activity.user_id in known]
+        # A retried POST may have been queued twice; its key matches it up.
+        upserts.upsert(live)
+        checkpoint.last_id = max(checkpoint.last_id, last_id)
+        checkpoint.save()
+    queue.ack(last_id)
+
+    now = time.time()
+    for _, enqueued_at in fresh:
+        apply_lag.observe((), now - enqueued_at)
+    applied_total.inc(amount=len(live))
+    if len(live) < len(fresh):
+        # The user was deleted while the activity waited.
+        dropped_total.inc(amount=len(fresh) - len(live))
+        logger.warning('Dropped %d queued activities for deleted users', len(fresh) - len(live))
+    logger.info('Applied %d queued activities up to entry %d', len(live), last_id)
+    return len(batch)
+
+
+def _queue_gauge(read):
+    def collect():
+        queue = get_queue()
+        return {(): read(queue)} if queue is not None else {}
+    return collect
+
+
+accepted_total = metrics.Counter(
+    'octofit_ingest_accepted_total', 'Activities accepted into the ingestion queue.')
+applied_total = metrics.Counter(
+    'octofit_ingest_applied_total', 'Queued activities written by this worker.')
+dropped_total = metrics.Counter(
+    'octofit_ingest_dropped_total', 'Queued activities dropped because their user no longer exists.')
+apply_lag = metrics.Histogram(
+    'octofit_ingest_apply_lag_seconds', 'Time from acceptance to commit for queued activities.',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+queue_depth = metrics.Gauge(
+    'octofit_ingest_queue_depth', 'Activities accepted but not yet written.', _queue_gauge(IngestQueue.depth))
+queue_lag = metrics.Gauge(
+    'octofit_ingest_queue_lag_seconds', 'Age of the oldest activity waiting in the queue.',
+    _queue_gauge(IngestQueue.lag))
@@ -0,0 +1,252 @@
+"""
+Incrementally maintained leaderboard.
+
+Every activity is worth its calories in points. The board is a total order on
+``(total_points desc, user_id asc)`` with ranks 1..N, so when one user's total
+changes only the block of entries between their old and new position has to
+shift by one rank; nobody else is touched.
+
+Team standings are a rollup of the board kept the same way, ordered on
+``(total_points desc, team_id asc)``.
+
+Rank changes to a board run under its ``BoardLock`` row (see ``lock_board``):
+two writers shifting overlapping ranges, or both appending at ``count() + 1``,
+would otherwise leave duplicate or missing ranks.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from . import caching
+from .models import Activity, BoardLock, Leaderboard, TeamStanding, User
+
+
+def points_for(calories):
+    """Return the leaderboard points earned for an activity."""
+    return calories or 0
+
+
+def _team_for_user(user_id):
+    """Look up the team id of a user, or ``None`` if they have no team."""
+    return User.objects.filter(pk=user_id).values_list('team_id', flat=True).first()
+
+
+def lock_board(model):
+    """Lock the board of ``model`` until the current transaction ends."""
+    BoardLock.objects.select_for_update().get_or_create(board=model._meta.db_table)
+
+
+def _ranked_before(entry, key):
+    """Rows that order ahead of ``entry``."""
+    return (Q(total_points__gt=entry.total_points)
+            | Q(total_points=entry.total_points, **{f'{key}__lt': getattr(entry, key)}))
+
+
+def _ranked_after(entry, key):
+    """Rows that order behind ``entry``."""
+    return (Q(total_points__lt=entry.total_points)
+            | Q(total_points=entry.total_points, **{f'{key}__gt': getattr(entry, key)}))
+
+
+def _reposition(entry, key, old_rank):
+    """
+    Shift the rows between ``entry``'s old and new position and return its
+    new rank. ``entry`` itself is not saved.
+    """
+    others = type(entry).objects.exclude(pk=entry.pk)
+    shifted = others.filter(_ranked_after(entry, key), rank__lt=old_rank).update(rank=F('rank') + 1)
+    if shifted:
+        return old_rank - shifted
+    shifted = others.filter(_ranked_before(entry, key), rank__gt=old_rank).update(rank=F('rank') - 1)
+    return old_rank + shifted
+
+
+def close_gap(entry):
+    """Move every row ranked behind a deleted ``entry`` up by one."""
+    with transaction.atomic():
+        lock_board(type(entry))
+        type(entry).objects.filter(rank__gt=entry.rank).update(rank=F('rank') - 1)
+
+
+def apply_points(user_id, delta):
+    """Add ``delta`` points to a user and shift only the affected rank range."""
+    with transaction.atomic():
+        lock_board(Leaderboard)
+        entry = Leaderboard.objects.select_for_update().filter(user_id=user_id).first()
+        if entry is not None and not delta:
+            return entry
+        if entry is None:
+            entry = Leaderboard(
+                user_id=user_id,
+                team_id=_team_for_user(user_id),
+                rank=Leaderboard.objects.count() + 1,
+            )
+        old_rank = entry.rank
+        entry.total_points += delta
+        entry.rank = _reposition(entry, 'user_id', old_rank)
+        entry.save()
+    return entry
+
+
+def record_activity_change(old, new):
+    """
+    Apply an activity write to the board.
+
+    ``old`` and ``new`` are the activity before and after the write; either
+    is ``None`` for a create or delete respectively.
+    """
+    old_user, old_points = (old.user_id, points_for(old.calories)) if old else (None, 0)
+    new_user, new_points = (new.user_id, points_for(new.calories)) if new else (None, 0)
+    if old_user == new_user:
+        apply_points(new_user, new_points - old_points)
+        return
+    if old_user is not None:
+        apply_points(old_user, -old_points)
+    if new_user is not None:
+        apply_points(new_user, new_points)
+
+
+def record_bulk_create(activities):
+    """Apply a batch of newly inserted activities with one update per user."""
+    totals = {}
+    for activity in activities:
+        totals[activity.user_id] = totals.get(activity.user_id, 0) + points_for(activity.calories)
+    for user_id, delta in totals.items():
+        apply_points(user_id, delta)
+
+
+def compute_standings():
+    """
+    Recompute every user's total and rank from scratch.
+
+    Returns a list of ``(user_id, total_points, rank)`` tuples in rank order.
+    Users already on the board with no remaining activities keep a zero row.
+    """
+    totals = {user_id: 0 for user_id in Leaderboard.objects.values_list('user_id', flat=True)}
+    for row in Activity.objects.values('user_id').annotate(calories=Sum('calories')).order_by():
+        totals[row['user_id']] = points_for(row['calories'])
+    ordered = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+    return [(user_id, points, rank) for rank, (user_id, points) in enumerate(ordered, start=1)]
+
+
+def rebuild():
+    """Rewrite the whole board from the activities table. Used for recovery."""
+    count = _rebuild_users()
+    rebuild_teams()
+    caching.bump_model(Leaderboard)
+    return count
+
+
+def _rebuild_users():
+    with transaction.atomic():
+        lock_board(Leaderboard)
+        standings = compute_standings()
+        existing = {entry.user_id: entry for entry in Leaderboard.objects.all()}
+        to_update, to_create = [], []
+        for user_id, points, rank in standings:
+            entry = existing.get(user_id)
+            if entry is None:
+                to_create.append(Leaderboard(
+                    user_id=user_id,
+                    team_id=_team_for_user(user_id),
+                    total_points=points,
+                    rank=rank,
+                ))
+            elif entry.total_points != points or entry.rank != rank:
+                entry.total_points = points
+                entry.rank = rank
+                to_update.append(entry)
+        Leaderboard.objects.bulk_update(to_update, ['total_points', 'rank'], batch_size=1000)
+        Leaderboard.objects.bulk_create(to_create, batch_size=1000)
+    return len(standings)
+
+
+def _average(total_points, member_count):
+    return total_points / member_count if member_count else 0.0
+
+
+def apply_team_change(team_id, points=0, members=0):
+    """Adjust a team's rollup by a points and membership delta."""
+    if team_id is None or not (points or members):
+        return None
+    with transaction.atomic():
+        lock_board(TeamStanding)
+        standing = TeamStanding.objects.select_for_update().filter(team_id=team_id).first()
+        if standing is None:
+            standing = TeamStanding(team_id=team_id, rank=TeamStanding.objects.count() + 1)
+        old_rank = standing.rank
+        standing.total_points += points
+        standing.member_count += members
+        standing.average_points = _average(standing.total_points, standing.member_count)
+        if points or standing.pk is None:
+            standing.rank = _reposition(standing, 'team_id', old_rank)
+        standing.save()
+    caching.bump_model(TeamStanding)
+    return standing
+
+
+def record_standing_change(old, new):
+    """
+    Roll a leaderboard row change up into team standings.
+
+    ``old`` and ``new`` are ``(team_id, total_points)`` pairs for the row
+    before and after the write; either is ``None`` for a create or delete.
+    """
+    old_team, old_points = old if old else (None, 0)
+    new_team, new_points = new if new else (None, 0)
+    if old_team == new_team:
+        apply_team_change(new_team, points=new_points - old_points)
+        return
+    apply_team_change(old_team, points=-old_points)
+    apply_team_change(new_team, points=new_points)
+
+
+def record_membership_change(user_id, old_team, new_team):
+    """Move a user between teams: member counts and their board row follow."""
+    if old_team == new_team:
+        return
+    apply_team_change(old_team, members=-1)
+    apply_team_change(new_team, members=1)
+    if user_id is not None:
+        for entry in Leaderboard.objects.filter(user_id=user_id):
+            entry.team_id = new_team
+            entry.save()
+
+
+def compute_team_standings():
+    """
+    Recompute every team rollup from the board and the users table.
+
+    Returns ``(team_id, total_points, member_count, rank)`` tuples in rank order.
+    """
+    totals = {team_id: [0, 0] for team_id in TeamStanding.objects.values_list('team_id', flat=True)}
+    for row in Leaderboard.objects.values('team_id').annotate(points=Sum('total_points')).order_by():
+        totals.setdefault(row['team_id'], [0, 0])[0] = row['points'] or 0
+    for row in User.objects.values('team_id').annotate(members=Count('id')).order_by():
+        totals.setdefault(row['team_id'], [0, 0])[1] = row['members']
+    totals.pop(None, None)
+    ordered = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    return [
+        (team_id, points, members, rank)
+        for rank, (team_id, (points, members)) in enumerate(ordered, start=1)
+    ]
+
+
+def rebuild_teams():
+    """Rewrite every team rollup from scratch. Used for recovery."""
+    with transaction.atomic():
+        lock_board(TeamStanding)
+        standings = compute_team_standings()
+        existing = {standing.team_id: standing for standing in TeamStanding.objects.all()}
+        to_update, to_create = [], []
+        for team_id, points, members, rank in standings:
+            standing = existing.get(team_id) or TeamStanding(team_id=team_id)
+            standing.total_points = points
+            standing.member_count = members
+            standing.average_points = _average(points, members)
+            standing.rank = rank
+            (to_create if standing.pk is None else to_update).append(standing)
+        TeamStanding.objects.bulk_update(
+            to_update, ['total_points', 'member_count', 'average_points', 'rank'], batch_size=1000)
+        TeamStanding.objects.bulk_create(to_create, batch_size=1000)
+    caching.bump_model(TeamStanding)
+    return len(standings)
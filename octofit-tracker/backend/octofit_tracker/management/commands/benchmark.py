@@ -0,0 +1,480 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from octofit_tracker import caching, leaderboard, rollups, stats
+from octofit_tracker.fastpath import FastListMixin
+from octofit_tracker.models import Activity, Leaderboard, Team, User, Workout
+from octofit_tracker.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from octofit_tracker.serializers import ActivitySerializer
+from octofit_tracker.urls import router
+
+from .populate_db import TEAMS, WORKOUTS, generate_activities, hero_for
+
+# Request bodies for the POST routes of the routes scenario, keyed by route
+# name; each takes the iteration number, so unique fields stay unique, and the
+# ids of the seeded users.
+ROUTE_PAYLOADS = {
+    'user-list': lambda i, users: {'name': f'Bench {i}', 'email': f'bench{i}@octofit.com', 'password': 'bench'},
+    'team-list': lambda i, users: {'name': f'Bench Team {i}', 'description': 'Benchmark'},
+    'activity-list': lambda i, users: {'user_id': users[i % len(users)], 'activity_type': 'Running',
+                                       'duration': 30, 'distance': 5.0, 'calories': 300,
+                                       'date': str(date.today())},
+    'activity-bulk': lambda i, users: [{'user_id': users[j % len(users)], 'activity_type': 'Running',
+                                        'duration': 30, 'distance': 5.0, 'calories': 300 + j,
+                                        'date': str(date.today())}
+                                       for j in range(100)],
+    'workout-list': lambda i, users: {'name': f'Bench {i}', 'description': 'Benchmark', 'difficulty': 'beginner',
+                                      'duration': 30, 'category': 'Core'},
+}
+
+# Query strings for the filtered variants of list routes.
+# Callable values are given the sample rows of ``route_cases``.
+LIST_VARIANTS = {
+    'user-list': [
+        {'fields': 'id,name'},
+        {'team_id': lambda sample: sample['team'].pk},
+        {'ordering': '-created_at'},
+    ],
+    'activity-list': [
+        {'page_size': 1000},
+        {'fields': 'id,activity_type,calories,date'},
+        {'user_id': lambda sample: sample['user'].pk},
+        {'activity_type': lambda sample: sample['activity'].activity_type},
+        {'user_id': lambda sample: sample['user'].pk, 'date_from': lambda sample: sample['activity'].date},
+        {'ordering': 'date'},
+    ],
+    'activity-export': [{'format': 'csv'}],
+    'leaderboard-list': [
+        {'window': 'week'},
+        {'window': 'rolling30'},
+        {'team_id': lambda sample: sample['team'].pk},
+    ],
+    'leaderboard-top': [{'k': 100}],
+    'leaderboard-around': [{'radius': 50}],
+}
+
+# URL arguments for routes that take something other than the sample's pk.
+ROUTE_ARGS = {
+    'leaderboard-around': lambda sample: [sample['user'].pk],
+}
+
+# Only the read and create actions are benchmarked.
+ROUTE_ACTIONS = {'list', 'create', 'retrieve'}
+
+
+class Command(BaseCommand):
+    help = 'Run API performance benchmarks; all writes are rolled back afterwards'
+
+    scenarios = ('routes', 'ingest', 'export', 'cache', 'serialize', 'encode', 'concurrency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', nargs='*',
+                            help=f'Scenarios to run, any of {", ".join(self.scenarios)} (default: all)')
+        parser.add_argument('--rows', type=int, default=500,
+                            help='Number of rows each scenario works with')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='In-flight requests for the concurrency scenario')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='WSGI worker threads for the concurrency scenario')
+        parser.add_argument('--query-delay', type=float, default=200,
+                            help='Milliseconds added to every query in the concurrency scenario')
+        parser.add_argument('--iterations', type=int, default=30,
+                            help='Requests per route in the routes scenario')
+        parser.add_argument('--json', metavar='PATH',
+                            help='Write the results to PATH as JSON')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='Flag regressions against the JSON results of an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Relative slowdown that counts as a regression (default 0.25)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenario']) - set(self.scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.results = {}
+        for name in options['scenario'] or self.scenarios:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name}'))
+            self.scenario = self.results.setdefault(name, {})
+            with transaction.atomic():
+                getattr(self, f'bench_{name}')(options)
+                transaction.set_rollback(True)
+
+        run = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('rows', 'iterations', 'concurrency', 'threads', 'query_delay')},
+            'results': self.results,
+        }
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(run, output, indent=2)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                regressions = compare(json.load(baseline)['results'], self.results, options['threshold'])
+            for message in regressions:
+                self.stdout.write(self.style.ERROR(f'  REGRESSION {message}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(f'  no regressions against {options["compare"]}'))
+
+    def report(self, label, count, seconds, unit='rows'):
+        self.stdout.write(f'  {label:<28} {count:>8} {unit:<4}  {seconds:8.3f}s  {count / seconds:10.0f} {unit}/s')
+        self.scenario[label] = {'count': count, 'seconds': round(seconds, 6), 'rate': round(count / seconds, 3),
+                                'unit': unit}
+        return count / seconds
+
+    def make_users(self, count):
+        """Create ``count`` users spread over five teams and return their ``(user_id, team_id)`` pairs."""
+        teams = [Team.objects.create(name=f'Bench Team {i}', description='Benchmark') for i in range(5)]
+        User.objects.bulk_create([
+            User(name=f'Bench {i}', email=f'bench{i}@bench.octofit.com', password='bench', team=teams[i % 5])
+            for i in range(count)
+        ], batch_size=1000)
+        return list(User.objects.filter(email__endswith='@bench.octofit.com').order_by('pk')
+                    .values_list('pk', 'team_id'))
+
+    def activity_payloads(self, rows):
+        users = [user_id for user_id, _ in self.make_users(50)]
+        today = str(date.today())
+        return [
+            {
+                'user_id': users[i % len(users)],
+                'activity_type': 'Running',
+                'duration': 30,
+                'distance': 5.0,
+                'calories': 300 + i % 7,
+                'date': today,
+            }
+            for i in range(rows)
+        ]
+
+    def seed(self, rows):
+        """Load ``rows`` activities spread over a realistic set of users, teams and workouts."""
+        teams = [Team.objects.create(**team) for team in TEAMS]
+        users = max(rows // 20, len(TEAMS))
+        User.objects.bulk_create(
+            User(team=teams[team], **profile) for team, profile in map(hero_for, range(users)))
+        today = date.today()
+        activities = []
+        for index, user_id in enumerate(User.objects.order_by('pk').values_list('pk', flat=True)):
+            for activity in generate_activities(0, index, user_id, max(rows // users, 1), today):
+                activity.pop('created_at')
+                activities.append(Activity(**activity))
+        Activity.objects.bulk_create(activities, batch_size=1000)
+        Workout.objects.bulk_create(Workout(**workout) for workout in WORKOUTS)
+        leaderboard.rebuild()
+        rollups.rebuild()
+        stats.rebuild()
+
+    def route_cases(self):
+        """Yield ``(label, method, url, params, payload)`` for every benchmarked router route."""
+        sample = {
+            'user': User.objects.order_by('pk').first(),
+            'team': Team.objects.order_by('pk').first(),
+            'activity': Activity.objects.order_by('pk').first(),
+            'leaderboard': Leaderboard.objects.order_by('rank').first(),
+            'workout': Workout.objects.order_by('pk').first(),
+        }
+        for _, viewset, basename in router.registry:
+            extra = {action.__name__ for action in viewset.get_extra_actions()}
+            for route in router.get_routes(viewset):
+                name = route.name.format(basename=basename)
+                if name in ROUTE_ARGS:
+                    args = ROUTE_ARGS[name](sample)
+                else:
+                    args = [sample[basename].pk] if route.detail else []
+                url = reverse(name, args=args)
+                for method, action in route.mapping.items():
+                    if action not in ROUTE_ACTIONS | extra or not hasattr(viewset, action):
+                        continue
+                    if method == 'get':
+                        yield f'GET {name}', method, url, {}, None
+                        for variant in LIST_VARIANTS.get(name, []):
+                            params = {key: value(sample) if callable(value) else value
+                                      for key, value in variant.items()}
+                            query = '&'.join(f'{key}={value}' for key, value in params.items())
+                            yield f'GET {name}?{query}', method, url, params, None
+                    else:
+                        yield f'{method.upper()} {name}', method, url, {}, ROUTE_PAYLOADS[name]
+
+    def bench_routes(self, options):
+        """Latency percentiles, throughput, query count and peak memory for every router route."""
+        self.seed(options['rows'])
+        users = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(f'  {"route":<56} {"p50":>8} {"p95":>8} {"p99":>8} {"rows/s":>10} {"queries":>8} '
+                          f'{"peak":>8}')
+        for label, method, url, params, payload in self.route_cases():
+            send = getattr(self.client, method)
+            latencies, rows, queries, statuses = [], 0, 0, set()
+
+            def request(i):
+                cache.clear()
+                if payload is None:
+                    return send(url, params)
+                return send(url, payload(i, users), format='json')
+
+            def count(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            for i in range(options['iterations']):
+                with connection.execute_wrapper(count):
+                    start = time.perf_counter()
+                    response = request(i)
+                    rows += response_rows(response)
+                    latencies.append(time.perf_counter() - start)
+                statuses.add(response.status_code)
+
+            tracemalloc.start()
+            response_rows(request(options['iterations']))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            p50, p95, p99 = percentiles(latencies)
+            record = {
+                'p50_ms': round(p50 * 1000, 3), 'p95_ms': round(p95 * 1000, 3), 'p99_ms': round(p99 * 1000, 3),
+                'rows_per_sec': round(rows / sum(latencies), 1), 'queries': round(queries / len(latencies), 2),
+                'peak_kb': round(peak / 1024, 1), 'statuses': sorted(statuses),
+            }
+            self.scenario[label] = record
+            line = (f'  {label:<56} {record["p50_ms"]:7.2f}ms {record["p95_ms"]:7.2f}ms {record["p99_ms"]:7.2f}ms '
+                    f'{record["rows_per_sec"]:10.0f} {record["queries"]:8.1f} {peak / 1e6:6.1f}MB')
+            failed = [code for code in statuses if code >= 400]
+            self.stdout.write(self.style.ERROR(f'{line}  HTTP {failed}') if failed else line)
+
+    def bench_ingest(self, options):
+        """One POST per activity versus a single /api/activities/bulk/ request."""
+        payloads = self.activity_payloads(options['rows'])
+
+        start = time.perf_counter()
+        for payload in payloads:
+            self.client.post(reverse('activity-list'), payload, format='json')
+        single = self.report('one POST per activity', len(payloads), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = self.client.post(reverse('activity-bulk'), payloads, format='json')
+        bulk = self.report('bulk POST', len(payloads), time.perf_counter() - start)
+
+        if response.status_code != 201:
+            self.stderr.write(f'  bulk request failed with {response.status_code}')
+        self.stdout.write(self.style.SUCCESS(f'  speedup: {bulk / single:.1f}x'))
+
+    def bench_export(self, options):
+        """Stream the activity export at two table sizes and compare peak memory."""
+        payloads = self.activity_payloads(options['rows'] * 10)
+        Activity.objects.bulk_create([Activity(**payload) for payload in payloads[:options['rows']]], batch_size=1000)
+        for _ in range(2):
+            total = Activity.objects.count()
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = self.client.get(reverse('activity-export'))
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.report('export (ndjson)', total, elapsed)
+            self.stdout.write(f'  {"":<28} {size / 1e6:8.1f} MB body, peak {peak / 1e6:.1f} MB traced')
+            Activity.objects.bulk_create([Activity(**payload) for payload in payloads[options['rows']:]], batch_size=1000)
+
+    def bench_cache(self, options):
+        """Leaderboard reads with a cold cache on every request versus a warm cache."""
+        members = self.make_users(options['rows'])
+        Leaderboard.objects.bulk_create([
+            Leaderboard(user_id=user_id, team_id=team_id, total_points=i, rank=options['rows'] - i)
+            for i, (user_id, team_id) in enumerate(members)
+        ], batch_size=1000)
+        requests = 200
+        url = reverse('leaderboard-list')
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            cache.clear()
+            self.client.get(url)
+        cold = self.report('uncached GET', requests, time.perf_counter() - start, unit='reqs')
+
+        caching.counters.reset()
+        start = time.perf_counter()
+        for _ in range(requests):
+            self.client.get(url)
+        warm = self.report('cached GET', requests, time.perf_counter() - start, unit='reqs')
+
+        self.stdout.write(f'  counters: {caching.counters.snapshot()}')
+        self.stdout.write(self.style.SUCCESS(f'  speedup: {warm / cold:.1f}x'))
+
+    def bench_serialize(self, options):
+        """Unpaginated leaderboard list through ModelSerializer versus the values() fast path."""
+        rows = options['rows'] * 200
+        members = self.make_users(rows)
+        Leaderboard.objects.bulk_create([
+            Leaderboard(user_id=user_id, team_id=team_id, total_points=i, rank=rows - i)
+            for i, (user_id, team_id) in enumerate(members)
+        ], batch_size=1000)
+        url = reverse('leaderboard-list')
+
+        cache.clear()
+        with mock.patch.object(FastListMixin, 'fast_list', False):
+            start = time.perf_counter()
+            slow = self.client.get(url)
+            serializer = self.report('ModelSerializer', rows, time.perf_counter() - start)
+
+        cache.clear()
+        start = time.perf_counter()
+        fast = self.client.get(url)
+        values = self.report('values() fast path', rows, time.perf_counter() - start)
+
+        if fast.content != slow.content:
+            self.stderr.write('  fast path output differs from the serializer output')
+        self.stdout.write(self.style.SUCCESS(f'  speedup: {values / serializer:.1f}x'))
+
+    def bench_encode(self, options):
+        """Encode ActivitySerializer output with each renderer."""
+        rows = options['rows'] * 100
+        Activity.objects.bulk_create([Activity(**payload) for payload in self.activity_payloads(rows)],
+                                     batch_size=1000)
+        data = ActivitySerializer(Activity.objects.all(), many=True).data
+        renderers = [('JSONRenderer', JSONRenderer())]
+        if orjson:
+            renderers.append(('ORJSONRenderer', ORJSONRenderer()))
+        if msgpack:
+            renderers.append(('MessagePackRenderer', MessagePackRenderer()))
+
+        baseline = None
+        for label, renderer in renderers:
+            start = time.perf_counter()
+            body = renderer.render(data)
+            rate = self.report(label, len(data), time.perf_counter() - start)
+            baseline = baseline or rate
+            self.stdout.write(f'  {"":<28} {len(body) / 1e6:8.1f} MB body, {rate / baseline:.1f}x')
+
+    def bench_concurrency(self, options):
+        """Slow queries with many requests in flight: WSGI threads, sync views under ASGI, async views."""
+        delay = options['query_delay'] / 1000
+        requests = options['concurrency'] * 4
+        execute = CursorWrapper._execute
+
+        def slow_execute(cursor, *args):
+            time.sleep(delay)
+            return execute(cursor, *args)
+
+        with mock.patch.object(CursorWrapper, '_execute', slow_execute):
+            wsgi = get_wsgi_application()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as pool:
+                statuses = list(pool.map(lambda _: wsgi_get(wsgi, '/api/activities/'), range(requests)))
+            threaded = self.report(f'WSGI, {options["threads"]} threads', requests, time.perf_counter() - start,
+                                   unit='reqs')
+            self.check_statuses(statuses)
+
+            asgi = get_asgi_application()
+            for label, path in (('ASGI, sync viewset', '/api/activities/'),
+                                ('ASGI, async view', '/api/async/activities/')):
+                start = time.perf_counter()
+                statuses = asyncio.run(asgi_burst(asgi, path, requests, options['concurrency']))
+                rate = self.report(label, requests, time.perf_counter() - start, unit='reqs')
+                self.check_statuses(statuses)
+        self.stdout.write(self.style.SUCCESS(f'  async view vs WSGI: {rate / threaded:.1f}x'))
+
+    def check_statuses(self, statuses):
+        failed = [status for status in statuses if status != 200]
+        if failed:
+            self.stderr.write(f'  {len(failed)} requests failed, e.g. with {failed[0]}')
+
+
+def wsgi_get(application, path):
+    """GET ``path`` from a WSGI application and return the status code."""
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_HOST': 'localhost'}
+    setup_testing_defaults(environ)
+    statuses = []
+    result = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+    try:
+        b''.join(result)
+    finally:
+        result.close()
+    return statuses[0]
+
+
+async def asgi_burst(application, path, requests, concurrency):
+    """GET ``path`` ``requests`` times with ``concurrency`` in flight and return the status codes."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def get():
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'root_path': '', 'query_string': b'',
+            'headers': [(b'host', b'localhost')], 'server': ('localhost', 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async with limit:
+            await application(scope, receive, send)
+        return messages[0]['status']
+
+    return await asyncio.gather(*(get() for _ in range(requests)))
+
+
+def response_rows(response):
+    """Number of rows a response carried, consuming streamed bodies."""
+    if getattr(response, 'streaming', False):
+        lines = b''.join(response.streaming_content).count(b'\n')
+        header = response['Content-Type'].startswith('text/csv')
+        return max(lines - header, 0)
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return len(data['results'])
+    if isinstance(data, list):
+        return len(data)
+    return 1 if response.status_code < 400 else 0
+
+
+def percentiles(samples):
+    """p50, p95 and p99 of ``samples``."""
+    if len(samples) < 2:
+        return samples * 3
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def compare(baseline, current, threshold):
+    """Describe every result in ``current`` that is worse than ``baseline`` by more than ``threshold``."""
+    regressions = []
+    for scenario, results in current.items():
+        for label, record in results.items():
+            before = baseline.get(scenario, {}).get(label)
+            if before is None:
+                continue
+            if 'p95_ms' in record:
+                if record['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                    regressions.append(f'{label}: p95 {before["p95_ms"]:.2f}ms -> {record["p95_ms"]:.2f}ms')
+                if record['queries'] > before['queries']:
+                    regressions.append(f'{label}: queries {before["queries"]} -> {record["queries"]}')
+                if record['peak_kb'] > before['peak_kb'] * (1 + threshold):
+                    regressions.append(f'{label}: peak {before["peak_kb"]:.0f}kB -> {record["peak_kb"]:.0f}kB')
+            elif record['rate'] < before['rate'] / (1 + threshold):
+                regressions.append(f'{scenario} / {label}: {before["rate"]:.0f} -> {record["rate"]:.0f} '
+                                   f'{record["unit"]}/s')
+    return regressions
@@ -0,0 +1,40 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import caching, ingest
+
+
+class Command(BaseCommand):
+    help = 'Apply activities accepted into the ingestion queue, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Most activities written per transaction')
+        parser.add_argument('--poll-interval', type=float, default=0.2,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of waiting for more')
+
+    def handle(self, *args, **options):
+        queue = ingest.get_queue()
+        if queue is None:
+            raise CommandError('OCTOFIT_INGEST_QUEUE is not set')
+        if caching.is_process_local():
+            self.stderr.write(self.style.WARNING(caching.PROCESS_LOCAL_WARNING))
+        stopping = []
+        # Finish the batch in hand, then exit.
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.append(True))
+
+        applied = 0
+        while not stopping:
+            taken = ingest.apply_batch(queue, options['batch_size'])
+            applied += taken
+            if taken:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f'Applied {applied} queued activities'))
@@ -1,18 +1,289 @@
-from django.core.management.base import BaseCommand
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime, timedelta
+from itertools import islice
+from multiprocessing import Pool
 import random
 from pymongo import MongoClient
 
+from octofit_tracker import caching, leaderboard, rollups, stats
+
+
+MONGO_HOST = 'localhost'
+MONGO_PORT = 27017
+DB_NAME = 'octofit_db'
+
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'CrossFit']
+DISTANCE_TYPES = {'Running', 'Cycling', 'Swimming'}
+SYNCED_COLLECTIONS = ['teams', 'users', 'workouts', 'activities']
+
+TEAMS = [
+    {'name': 'Team Marvel', 'description': 'Earth\'s Mightiest Heroes unite for fitness supremacy!'},
+    {'name': 'Team DC', 'description': 'Justice League members competing for ultimate strength!'},
+]
+
+# The first heroes of each team keep their classic identities; any further
+# users requested with --users are numbered recruits.
+HEROES = [
+    [
+        {'name': 'Iron Man', 'email': 'ironman@marvel.com', 'password': 'stark123'},
+        {'name': 'Captain America', 'email': 'captainamerica@marvel.com', 'password': 'shield123'},
+        {'name': 'Thor', 'email': 'thor@marvel.com', 'password': 'hammer123'},
+        {'name': 'Black Widow', 'email': 'blackwidow@marvel.com', 'password': 'spy123'},
+        {'name': 'Hulk', 'email': 'hulk@marvel.com', 'password': 'smash123'},
+        {'name': 'Spider-Man', 'email': 'spiderman@marvel.com', 'password': 'web123'},
+    ],
+    [
+        {'name': 'Superman', 'email': 'superman@dc.com', 'password': 'krypton123'},
+        {'name': 'Batman', 'email': 'batman@dc.com', 'password': 'gotham123'},
+        {'name': 'Wonder Woman', 'email': 'wonderwoman@dc.com', 'password': 'amazon123'},
+        {'name': 'The Flash', 'email': 'flash@dc.com', 'password': 'speed123'},
+        {'name': 'Aquaman', 'email': 'aquaman@dc.com', 'password': 'ocean123'},
+        {'name': 'Green Lantern', 'email': 'greenlantern@dc.com', 'password': 'willpower123'},
+    ],
+]
+
+WORKOUTS = [
+    {
+        'name': 'Superhero Strength Training',
+        'description': 'Build power like Thor with compound lifts and explosive movements.',
+        'difficulty': 'advanced',
+        'duration': 60,
+        'category': 'Strength'
+    },
+    {
+        'name': 'Spider-Sense Cardio',
+        'description': 'Enhance your agility and endurance with interval training.',
+        'difficulty': 'intermediate',
+        'duration': 45,
+        'category': 'Cardio'
+    },
+    {
+        'name': 'Black Widow Flexibility Flow',
+        'description': 'Master flexibility and balance through dynamic stretching.',
+        'difficulty': 'beginner',
+        'duration': 30,
+        'category': 'Flexibility'
+    },
+    {
+        'name': 'Captain America Circuit',
+        'description': 'Full-body workout combining strength and cardio.',
+        'difficulty': 'intermediate',
+        'duration': 50,
+        'category': 'Circuit Training'
+    },
+    {
+        'name': 'Flash Speed Training',
+        'description': 'Sprint intervals and plyometrics for explosive speed.',
+        'difficulty': 'advanced',
+        'duration': 40,
+        'category': 'Speed'
+    },
+    {
+        'name': 'Hulk Smash Heavy Lifting',
+        'description': 'Maximum strength development with heavy compound movements.',
+        'difficulty': 'advanced',
+        'duration': 70,
+        'category': 'Strength'
+    },
+    {
+        'name': 'Wonder Woman Warrior Workout',
+        'description': 'Combat-inspired training for functional fitness.',
+        'difficulty': 'intermediate',
+        'duration': 55,
+        'category': 'Functional'
+    },
+    {
+        'name': 'Aquaman Swim Session',
+        'description': 'Pool-based cardio and resistance training.',
+        'difficulty': 'beginner',
+        'duration': 45,
+        'category': 'Swimming'
+    },
+    {
+        'name': 'Batman Dark Knight Conditioning',
+        'description': 'Mixed martial arts and tactical fitness training.',
+        'difficulty': 'advanced',
+        'duration': 60,
+        'category': 'MMA'
+    },
+    {
+        'name': 'Green Lantern Willpower Core',
+        'description': 'Core strengthening and mental focus exercises.',
+        'difficulty': 'beginner',
+        'duration': 35,
+        'category': 'Core'
+    },
+]
+
+
+def chunked(iterable, size):
+    """Yield lists of at most ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def hero_for(index):
+    """Return the profile of the ``index``-th user; users alternate between teams."""
+    team, slot = index % len(TEAMS), index // len(TEAMS)
+    if slot < len(HEROES[team]):
+        return team, HEROES[team][slot]
+    return team, {
+        'name': f'Recruit {index + 1}',
+        'email': f'recruit{index + 1}@octofit.com',
+        'password': f'recruit{index + 1}',
+    }
+
+
+def generate_activities(seed, index, user_id, per_user, today):
+    """
+    Yield the activities of one user.
+
+    Each user draws from its own RNG seeded by ``(seed, index)``, so the output
+    does not depend on how users are split across workers.
+    """
+    rng = random.Random(f'{seed}:{index}')
+    count = per_user if per_user is not None else rng.randint(5, 10)
+    for _ in range(count):
+        activity_type = rng.choice(ACTIVITY_TYPES)
+        duration = rng.randint(20, 120)
+        distance = round(rng.uniform(2.0, 20.0), 2) if activity_type in DISTANCE_TYPES else None
+        calories = duration * rng.randint(5, 10)
+        yield {
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'duration': duration,
+            'distance': distance,
+            'calories': calories,
+            'date': today - timedelta(days=rng.randint(0, 30)),
+            'created_at': datetime.now(),
+        }
+
+
+def activity_id_block(per_user):
+    """Ids reserved per user, so workers can number activities without coordinating."""
+    return per_user if per_user is not None else 10
+
+
+def advance_id_counter(db, collection, last_id):
+    """Move djongo's auto-increment counter for ``collection`` past ``last_id``."""
+    db['__schema__'].update_one({'name': collection}, {'$max': {'auto.seq': last_id}})
+
+
+def feed_entries(present, synced):
+    """
+    Merge two ascending id streams into ``(object_id, deleted)`` feed entries:
+    one for every ``present`` id and a tombstone for every ``synced`` id that
+    is no longer present.
+    """
+    synced = iter(synced)
+    gone = next(synced, None)
+    for object_id in present:
+        while gone is not None and gone < object_id:
+            yield gone, True
+            gone = next(synced, None)
+        if gone == object_id:
+            gone = next(synced, None)
+        yield object_id, False
+    while gone is not None:
+        yield gone, True
+        gone = next(synced, None)
+
+
+def rewrite_change_feed(db, batch_size):
+    """
+    Replace the sync feed (see octofit_tracker.sync) after the collections
+    were rewritten behind the ORM's back: an entry for every row now present
+    and a tombstone for every previously synced row that is gone, all with
+    ids above the old ones so existing sync tokens pick them up. Ids are
+    streamed from sorted cursors, so memory does not grow with the data.
+    """
+    newest = db.changes.find_one({}, {'id': 1}, sort=[('id', -1)])
+    last_id = newest['id'] if newest else 0
+    next_id = last_id
+    for collection in SYNCED_COLLECTIONS:
+        present = (
+            document['id']
+            for document in db[collection].find({}, {'id': 1}).sort('id', 1).batch_size(batch_size)
+        )
+        # Only the old entries: the new ones are inserted while this is read.
+        synced = (
+            document['object_id']
+            for document in db.changes.find(
+                {'collection': collection, 'deleted': False, 'id': {'$lte': last_id}}, {'object_id': 1}
+            ).sort('object_id', 1).batch_size(batch_size)
+        )
+        for chunk in chunked(feed_entries(present, synced), batch_size):
+            db.changes.insert_many([
+                {'id': next_id + number, 'collection': collection, 'object_id': object_id, 'deleted': deleted,
+                 'recorded_at': datetime.now()}
+                for number, (object_id, deleted) in enumerate(chunk, start=1)
+            ])
+            next_id += len(chunk)
+    db.changes.delete_many({'id': {'$lte': last_id}})
+    advance_id_counter(db, 'changes', next_id)
+
+
+def insert_activities(job):
+    """Generate and insert the activities for a contiguous block of users."""
+    seed, first_index, user_ids, per_user, batch_size, today = job
+    block = activity_id_block(per_user)
+    client = MongoClient(MONGO_HOST, MONGO_PORT)
+    try:
+        db = client[DB_NAME]
+        stream = (
+            dict(activity, id=(first_index + offset) * block + number + 1)
+            for offset, user_id in enumerate(user_ids)
+            for number, activity in enumerate(
+                generate_activities(seed, first_index + offset, user_id, per_user, today))
+        )
+        inserted = 0
+        for chunk in chunked(stream, batch_size):
+            db.activities.insert_many(chunk, ordered=False)
+            inserted += len(chunk)
+        return inserted
+    finally:
+        client.close()
+
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=12,
+                            help='Number of users to create (default: 12)')
+        parser.add_argument('--activities-per-user', type=int, default=None,
+                            help='Activities per user (default: 5-10 at random)')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Seed for the random generator; the same seed yields the same data')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating and inserting activities in parallel')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Documents per insert_many call')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        per_user = options['activities_per_user']
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        workers = options['workers']
+        batch_size = options['batch_size']
+        if users < 0 or (per_user is not None and per_user < 0):
+            raise CommandError('--users and --activities-per-user must not be negative')
+        if workers < 1 or batch_size < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+
+        if caching.is_process_local():
+            self.stderr.write(self.style.WARNING(caching.PROCESS_LOCAL_WARNING))
         self.stdout.write(self.style.SUCCESS('Starting database population...'))
+        self.stdout.write(f'Using seed {seed}')
 
         # Connect to MongoDB directly
-        client = MongoClient('localhost', 27017)
-        db = client['octofit_db']
+        client = MongoClient(MONGO_HOST, MONGO_PORT)
+        db = client[DB_NAME]
 
         # Clear existing data
         self.stdout.write('Clearing existing data...')
@@ -21,200 +292,103 @@ class Command(BaseCommand):
         db.activities.delete_many({})
         db.leaderboard.delete_many({})
         db.workouts.delete_many({})
+        # Derived rows are keyed by user and team ids, which are reused below.
+        db.team_standings.delete_many({})
+        db.daily_points.delete_many({})
+        db.user_stats.delete_many({})
+
+        # Every document gets the integer id the ORM knows it by, and
+        # references use those ids, as rows written through Django would.
 
         # Create Teams
         self.stdout.write('Creating teams...')
-        team_marvel_result = db.teams.insert_one({
-            'name': 'Team Marvel',
-            'description': 'Earth\'s Mightiest Heroes unite for fitness supremacy!',
-            'created_at': datetime.now()
-        })
-        team_marvel_id = team_marvel_result.inserted_id
-
-        team_dc_result = db.teams.insert_one({
-            'name': 'Team DC',
-            'description': 'Justice League members competing for ultimate strength!',
-            'created_at': datetime.now()
-        })
-        team_dc_id = team_dc_result.inserted_id
+        team_ids = list(range(1, len(TEAMS) + 1))
+        db.teams.insert_many([
+            dict(team, id=team_id, created_at=datetime.now()) for team_id, team in zip(team_ids, TEAMS)
+        ])
+        advance_id_counter(db, 'teams', len(team_ids))
 
         # Create Users (Superheroes)
         self.stdout.write('Creating users...')
-        marvel_heroes = [
-            {'name': 'Iron Man', 'email': 'ironman@marvel.com', 'password': 'stark123'},
-            {'name': 'Captain America', 'email': 'captainamerica@marvel.com', 'password': 'shield123'},
-            {'name': 'Thor', 'email': 'thor@marvel.com', 'password': 'hammer123'},
-            {'name': 'Black Widow', 'email': 'blackwidow@marvel.com', 'password': 'spy123'},
-            {'name': 'Hulk', 'email': 'hulk@marvel.com', 'password': 'smash123'},
-            {'name': 'Spider-Man', 'email': 'spiderman@marvel.com', 'password': 'web123'},
-        ]
-
-        dc_heroes = [
-            {'name': 'Superman', 'email': 'superman@dc.com', 'password': 'krypton123'},
-            {'name': 'Batman', 'email': 'batman@dc.com', 'password': 'gotham123'},
-            {'name': 'Wonder Woman', 'email': 'wonderwoman@dc.com', 'password': 'amazon123'},
-            {'name': 'The Flash', 'email': 'flash@dc.com', 'password': 'speed123'},
-            {'name': 'Aquaman', 'email': 'aquaman@dc.com', 'password': 'ocean123'},
-            {'name': 'Green Lantern', 'email': 'greenlantern@dc.com', 'password': 'willpower123'},
-        ]
-
-        marvel_user_ids = []
-        for hero in marvel_heroes:
-            result = db.users.insert_one({
-                'name': hero['name'],
-                'email': hero['email'],
-                'password': hero['password'],
-                'team_id': str(team_marvel_id),
-                'created_at': datetime.now()
-            })
-            marvel_user_ids.append(result.inserted_id)
-
-        dc_user_ids = []
-        for hero in dc_heroes:
-            result = db.users.insert_one({
-                'name': hero['name'],
-                'email': hero['email'],
-                'password': hero['password'],
-                'team_id': str(team_dc_id),
-                'created_at': datetime.now()
-            })
-            dc_user_ids.append(result.inserted_id)
-
-        all_user_ids = marvel_user_ids + dc_user_ids
+        user_ids = list(range(1, users + 1))
+        user_teams = {}
+        profiles = (hero_for(index) for index in range(users))
+        for chunk in chunked(zip(user_ids, profiles), batch_size):
+            documents = [
+                dict(hero, id=user_id, team_id=team_ids[team], created_at=datetime.now())
+                for user_id, (team, hero) in chunk
+            ]
+            db.users.insert_many(documents)
+            user_teams.update((document['id'], document['team_id']) for document in documents)
+        advance_id_counter(db, 'users', users)
 
         # Create Activities
-        self.stdout.write('Creating activities...')
-        activity_types = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'CrossFit']
-        
-        for user_id in all_user_ids:
-            # Create 5-10 activities per user
-            num_activities = random.randint(5, 10)
-            for i in range(num_activities):
-                activity_type = random.choice(activity_types)
-                duration = random.randint(20, 120)
-                distance = round(random.uniform(2.0, 20.0), 2) if activity_type in ['Running', 'Cycling', 'Swimming'] else None
-                calories = duration * random.randint(5, 10)
-                days_ago = random.randint(0, 30)
-                activity_date = datetime.now() - timedelta(days=days_ago)
-                
-                db.activities.insert_one({
-                    'user_id': str(user_id),
-                    'activity_type': activity_type,
-                    'duration': duration,
-                    'distance': distance,
-                    'calories': calories,
-                    'date': activity_date,
-                    'created_at': datetime.now()
-                })
+        self.stdout.write(f'Creating activities with {workers} worker(s)...')
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        block = max(1, -(-len(user_ids) // (workers * 4)))
+        jobs = [
+            (seed, start, user_ids[start:start + block], per_user, batch_size, today)
+            for start in range(0, len(user_ids), block)
+        ]
+        if workers == 1:
+            created = sum(map(insert_activities, jobs))
+        else:
+            with Pool(workers) as pool:
+                created = sum(pool.imap_unordered(insert_activities, jobs))
+        advance_id_counter(db, 'activities', users * activity_id_block(per_user))
+        self.stdout.write(f'  inserted {created} activities')
 
         # Create Leaderboard entries
+        # Totals come from one server-side aggregation rather than a query per
+        # user; ordering matches octofit_tracker.leaderboard (points desc, user id asc).
         self.stdout.write('Creating leaderboard...')
-        leaderboard_data = []
-        for user_id in all_user_ids:
-            user = db.users.find_one({'_id': user_id})
-            activities = list(db.activities.find({'user_id': str(user_id)}))
-            total_points = sum(activity['calories'] for activity in activities)
-            
-            leaderboard_data.append({
-                'user_id': str(user_id),
-                'team_id': user['team_id'],
-                'total_points': total_points,
-                'rank': 0,  # Will update after sorting
+        totals = {
+            row['_id']: row['total_points']
+            for row in db.activities.aggregate([
+                {'$group': {'_id': '$user_id', 'total_points': {'$sum': '$calories'}}},
+            ], allowDiskUse=True)
+        }
+        standings = sorted(user_ids, key=lambda user_id: (-totals.get(user_id, 0), user_id))
+        entries = (
+            {
+                'id': rank,
+                'user_id': user_id,
+                'team_id': user_teams[user_id],
+                'total_points': totals.get(user_id, 0),
+                'rank': rank,
                 'updated_at': datetime.now()
-            })
-
-        # Sort by total points and assign ranks
-        leaderboard_data.sort(key=lambda x: x['total_points'], reverse=True)
-        for idx, entry in enumerate(leaderboard_data):
-            entry['rank'] = idx + 1
-            db.leaderboard.insert_one(entry)
+            }
+            for rank, user_id in enumerate(standings, start=1)
+        )
+        for chunk in chunked(entries, batch_size):
+            db.leaderboard.insert_many(chunk, ordered=False)
+        advance_id_counter(db, 'leaderboard', users)
 
         # Create Workouts
         self.stdout.write('Creating workouts...')
-        workouts = [
-            {
-                'name': 'Superhero Strength Training',
-                'description': 'Build power like Thor with compound lifts and explosive movements.',
-                'difficulty': 'advanced',
-                'duration': 60,
-                'category': 'Strength'
-            },
-            {
-                'name': 'Spider-Sense Cardio',
-                'description': 'Enhance your agility and endurance with interval training.',
-                'difficulty': 'intermediate',
-                'duration': 45,
-                'category': 'Cardio'
-            },
-            {
-                'name': 'Black Widow Flexibility Flow',
-                'description': 'Master flexibility and balance through dynamic stretching.',
-                'difficulty': 'beginner',
-                'duration': 30,
-                'category': 'Flexibility'
-            },
-            {
-                'name': 'Captain America Circuit',
-                'description': 'Full-body workout combining strength and cardio.',
-                'difficulty': 'intermediate',
-                'duration': 50,
-                'category': 'Circuit Training'
-            },
-            {
-                'name': 'Flash Speed Training',
-                'description': 'Sprint intervals and plyometrics for explosive speed.',
-                'difficulty': 'advanced',
-                'duration': 40,
-                'category': 'Speed'
-            },
-            {
-                'name': 'Hulk Smash Heavy Lifting',
-                'description': 'Maximum strength development with heavy compound movements.',
-                'difficulty': 'advanced',
-                'duration': 70,
-                'category': 'Strength'
-            },
-            {
-                'name': 'Wonder Woman Warrior Workout',
-                'description': 'Combat-inspired training for functional fitness.',
-                'difficulty': 'intermediate',
-                'duration': 55,
-                'category': 'Functional'
-            },
-            {
-                'name': 'Aquaman Swim Session',
-                'description': 'Pool-based cardio and resistance training.',
-                'difficulty': 'beginner',
-                'duration': 45,
-                'category': 'Swimming'
-            },
-            {
-                'name': 'Batman Dark Knight Conditioning',
-                'description': 'Mixed martial arts and tactical fitness training.',
-                'difficulty': 'advanced',
-                'duration': 60,
-                'category': 'MMA'
-            },
-            {
-                'name': 'Green Lantern Willpower Core',
-                'description': 'Core strengthening and mental focus exercises.',
-                'difficulty': 'beginner',
-                'duration': 35,
-                'category': 'Core'
-            },
-        ]
+        db.workouts.insert_many([
+            dict(workout, id=workout_id, created_at=datetime.now())
+            for workout_id, workout in enumerate(WORKOUTS, start=1)
+        ])
+        advance_id_counter(db, 'workouts', len(WORKOUTS))
+
+        self.stdout.write('Recording the sync feed...')
+        rewrite_change_feed(db, batch_size)
 
-        for workout_data in workouts:
-            workout_data['created_at'] = datetime.now()
-            db.workouts.insert_one(workout_data)
+        self.stdout.write('Rebuilding team standings, daily buckets and user stats...')
+        leaderboard.rebuild_teams()
+        rollups.rebuild()
+        stats.rebuild()
+        # Everything was rewritten behind the ORM's back.
+        caching.bump_model(*apps.get_app_config('octofit_tracker').get_models())
 
         self.stdout.write(self.style.SUCCESS(f'Successfully populated database!'))
         self.stdout.write(self.style.SUCCESS(f'Created:'))
         self.stdout.write(f'  - {db.teams.count_documents({})} teams')
         self.stdout.write(f'  - {db.users.count_documents({})} users')
-        self.stdout.write(f'  - {db.activities.count_documents({})} activities')
+        self.stdout.write(f'  - {db.activities.estimated_document_count()} activities')
         self.stdout.write(f'  - {db.leaderboard.count_documents({})} leaderboard entries')
         self.stdout.write(f'  - {db.workouts.count_documents({})} workouts')
-        
+
         # Close MongoDB connection
         client.close()
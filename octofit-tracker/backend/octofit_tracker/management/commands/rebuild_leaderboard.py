@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import caching, leaderboard, rollups, stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the leaderboard, team standings, daily buckets and user stats from the activities table'
+
+    def handle(self, *args, **kwargs):
+        if caching.is_process_local():
+            self.stderr.write(self.style.WARNING(caching.PROCESS_LOCAL_WARNING))
+        self.stdout.write('Rebuilding leaderboard...')
+        count = leaderboard.rebuild()
+        rollups.rebuild()
+        stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Leaderboard rebuilt with {count} entries'))
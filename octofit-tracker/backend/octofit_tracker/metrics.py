@@ -0,0 +1,190 @@
+"""
+Process-local metrics in the Prometheus text format.
+
+Every thread records into a shard of its own, so counting a request takes no
+lock. The registry lock is only taken when a thread records for the first
+time, when a thread exits and its shard is folded into the totals, and when
+``/metrics`` is scraped. Each process keeps its own numbers; a scraper sums
+them across workers.
+"""
+import threading
+import weakref
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class _ShardOwner:
+    """Lives in a thread's local storage; folds the shard away once the thread is gone."""
+
+    def __init__(self, registry, shard):
+        weakref.finalize(self, registry._retire, shard)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._live = {}
+        self._retired = {}
+        self._metrics = []
+
+    def shard(self):
+        """The calling thread's ``{(name, labels): value}`` store."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            self._local.owner = _ShardOwner(self, shard)
+            with self._lock:
+                self._live[id(shard)] = shard
+            return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._live.pop(id(shard), None)
+            _merge(self._retired, shard)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Totals across all threads, past and present."""
+        with self._lock:
+            totals = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._retired.items()}
+            for shard in list(self._live.values()):
+                _merge(totals, shard.copy())
+        return totals
+
+    def exposition(self):
+        """Render every registered metric in the Prometheus text format."""
+        totals = self.snapshot()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            collect = getattr(metric, 'collect', None)
+            if collect is not None:
+                series = sorted(collect().items())
+            else:
+                series = sorted((key[1], value) for key, value in totals.items() if key[0] == metric.name)
+            for labels, value in series:
+                lines.extend(metric.samples(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(target, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = target.get(key)
+            target[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def inc(self, labels=(), amount=1):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def samples(self, labels, value):
+        yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def observe(self, labels, value):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket plus +Inf, then the sum and the count.
+            counts = shard[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def samples(self, labels, counts):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), counts):
+            cumulative += count
+            le = bound if isinstance(bound, str) else _format_value(float(bound))
+            yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", le)])} {cumulative}'
+        yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(float(counts[-2]))}'
+        yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {counts[-1]}'
+
+
+class Gauge:
+    """
+    A value read when ``/metrics`` is scraped: ``collect()`` returns
+    ``{labels: value}`` and nothing is recorded in between.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=(), registry=None):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.collect = collect
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def samples(self, labels, value):
+        yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+REGISTRY = Registry()
+
+requests_total = Counter(
+    'octofit_http_requests_total', 'HTTP requests by view, action and status.', ('view', 'method', 'status'))
+errors_total = Counter(
+    'octofit_http_errors_total', 'HTTP responses with a 4xx or 5xx status.', ('view', 'status'))
+request_duration = Histogram(
+    'octofit_http_request_duration_seconds', 'Time spent handling a request.', ('view',))
+response_size = Histogram(
+    'octofit_http_response_size_bytes', 'Size of non-streaming response bodies.', ('view',), buckets=SIZE_BUCKETS)
+db_queries_total = Counter(
+    'octofit_db_queries_total', 'Database queries run while handling requests.', ('view',))
+db_query_seconds_total = Counter(
+    'octofit_db_query_seconds_total', 'Time spent in database queries while handling requests.', ('view',))
+db_connections_total = Counter(
+    'octofit_db_connections_total', 'Database connections opened.', ('alias', 'vendor'))
+
+
+def view_label(view_func, method):
+    """``UserViewSet.list`` style name for a resolved view."""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    viewset = getattr(view_func, 'view_initkwargs', {}).get('viewset')
+    name = f'{cls.__name__}[{viewset.__name__}]' if viewset else cls.__name__
+    return f'{name}.{actions.get(method.lower(), method.lower())}'
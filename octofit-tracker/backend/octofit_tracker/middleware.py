@@ -0,0 +1,157 @@
+"""
+Per-request instrumentation.
+"""
+import asyncio
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, profiling, timing
+
+logger = logging.getLogger('octofit_tracker.performance')
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI.
+
+    Subclasses implement ``__call__`` for the synchronous chain and
+    ``__acall__`` for the asynchronous one; Django picks the mode from
+    ``get_response``, so neither costs a thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # What django.utils.deprecation.MiddlewareMixin does to be seen as async.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Record request, error, latency, size and query metrics per view and action.
+
+    Must come before ``ServerTimingMiddleware``, whose query counts it reads.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, perf_counter() - start)
+        return response
+
+    def record(self, request, response, elapsed):
+        view = getattr(request, 'metrics_view', 'unmatched')
+        status = str(response.status_code)
+        metrics.requests_total.inc((view, request.method, status))
+        if response.status_code >= 400:
+            metrics.errors_total.inc((view, status))
+        metrics.request_duration.observe((view,), elapsed)
+        if not response.streaming:
+            metrics.response_size.observe((view,), len(response.content))
+        server_timing = getattr(request, 'server_timing', None)
+        if server_timing is not None:
+            metrics.db_queries_total.inc((view,), server_timing['queries'])
+            metrics.db_query_seconds_total.inc((view,), server_timing.get('db', 0.0))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = metrics.view_label(view_func, request.method)
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """
+    Report database, serializer and render time in a ``Server-Timing`` header.
+
+    Every query on every connection is counted and timed, including those
+    run on worker threads (see timing.py). Serializer time is
+    collected by the serializers and the fast list path, and render time is
+    the time spent turning the response data into bytes. With
+    ``OCTOFIT_SLOW_REQUEST_MS`` or ``OCTOFIT_MAX_QUERIES`` set, requests over
+    either limit are logged to ``octofit_tracker.performance``. The header is
+    sent when ``OCTOFIT_SERVER_TIMING`` is true.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timings, token = timing.begin()
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.end(token)
+        return self.report(request, response, timings, perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings, token = timing.begin()
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.end(token)
+        return self.report(request, response, timings, perf_counter() - start)
+
+    def report(self, request, response, timings, total):
+        queries = timings.get('queries', 0)
+        request.server_timing = dict(timings, queries=queries, total=total)
+
+        if getattr(settings, 'OCTOFIT_SERVER_TIMING', False):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings.get("db", 0.0) * 1000:.3f};desc="{queries} queries"',
+                f'serialize;dur={timings.get("serialize", 0.0) * 1000:.3f}',
+                f'render;dur={timings.get("render", 0.0) * 1000:.3f}',
+                f'total;dur={total * 1000:.3f}',
+            ])
+
+        slow_ms = getattr(settings, 'OCTOFIT_SLOW_REQUEST_MS', None)
+        max_queries = getattr(settings, 'OCTOFIT_MAX_QUERIES', None)
+        if (slow_ms is not None and total * 1000 > slow_ms) or (max_queries is not None and queries > max_queries):
+            logger.warning(
+                '%s %s took %.1f ms with %d queries (db %.1f ms, serialize %.1f ms, render %.1f ms)',
+                request.method, request.get_full_path(), total * 1000, queries, timings.get('db', 0.0) * 1000,
+                timings.get('serialize', 0.0) * 1000, timings.get('render', 0.0) * 1000,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        start = perf_counter()
+        response.add_post_render_callback(lambda rendered: timing.add('render', perf_counter() - start))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that ask for it with ``X-Profile: 1`` or ``?profile=1``.
+
+    Only active when ``OCTOFIT_PROFILE_DIR`` is set; otherwise Django drops it
+    from the chain at startup. The profile covers the view, including
+    rendering, and its handle is returned in ``X-Profile-Id``. See
+    ``octofit_tracker/profiling.py`` for the files written.
+    """
+
+    def __init__(self, get_response):
+        self.directory = getattr(settings, 'OCTOFIT_PROFILE_DIR', None)
+        if not self.directory:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.headers.get('X-Profile') != '1' and request.GET.get('profile') != '1':
+            return self.get_response(request)
+        with profiling.RequestProfile(self.directory) as profile:
+            response = self.get_response(request)
+        response['X-Profile-Id'] = profile.handle
+        logger.info('Profiled %s %s as %s', request.method, request.get_full_path(), profile.handle)
+        return response
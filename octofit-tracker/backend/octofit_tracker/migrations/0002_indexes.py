@@ -0,0 +1,104 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+# Djongo does not reliably translate index DDL into MongoDB indexes, so on
+# that backend the same indexes are also created through the driver.
+MONGO_INDEXES = {
+    'activities': [
+        ('activities_user_date_idx', [('user_id', 1), ('date', 1)]),
+        ('activities_date_id_idx', [('date', 1), ('id', 1)]),
+    ],
+    'users': [
+        ('users_team_id_idx', [('team_id', 1)]),
+        ('users_created_id_idx', [('created_at', 1), ('id', 1)]),
+    ],
+    'leaderboard': [
+        ('leaderboard_user_id_idx', [('user_id', 1)]),
+        ('leaderboard_rank_idx', [('rank', 1)]),
+        ('leaderboard_team_rank_idx', [('team_id', 1), ('rank', 1)]),
+    ],
+}
+
+
+def create_mongo_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    db = schema_editor.connection.connection
+    for collection, indexes in MONGO_INDEXES.items():
+        for name, keys in indexes:
+            try:
+                db[collection].create_index(keys, name=name, background=True)
+            except OperationFailure as exc:
+                # 85/86: an equivalent index already exists under another name.
+                if exc.code not in (85, 86):
+                    raise
+
+
+def drop_mongo_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    db = schema_editor.connection.connection
+    for collection, indexes in MONGO_INDEXES.items():
+        for name, _ in indexes:
+            try:
+                db[collection].drop_index(name)
+            except OperationFailure:
+                pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='user_id',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='rank',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='team_id',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='user_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='team_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user_id', 'date'], name='activities_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['date', 'id'], name='activities_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['team_id', 'rank'], name='leaderboard_team_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='users_created_id_idx'),
+        ),
+        migrations.RunPython(create_mongo_indexes, drop_mongo_indexes),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team_id', models.CharField(max_length=100, unique=True)),
+                ('total_points', models.IntegerField(default=0)),
+                ('member_count', models.IntegerField(default=0)),
+                ('average_points', models.FloatField(default=0)),
+                ('rank', models.IntegerField(db_index=True, default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'team_standings',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0003_team_standings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPoints',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('activity_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily points',
+                'db_table': 'daily_points',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailypoints',
+            index=models.Index(fields=['day', 'user_id'], name='daily_points_day_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypoints',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day'), name='daily_points_user_day_uniq'),
+        ),
+    ]
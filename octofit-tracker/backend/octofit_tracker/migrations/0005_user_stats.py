@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0004_daily_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100, unique=True)),
+                ('activity_count', models.IntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('total_calories', models.IntegerField(default=0)),
+                ('by_type', models.JSONField(default=dict)),
+                ('weekly', models.JSONField(default=dict)),
+                ('last_active_day', models.DateField(blank=True, null=True)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User stats',
+                'db_table': 'user_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,193 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import octofit_tracker.models
+
+
+# (model, legacy field, new field, target model, nullable, table)
+REFERENCES = [
+    ('user', 'team_id', 'team', 'team', True, 'users'),
+    ('activity', 'user_id', 'user', 'user', False, 'activities'),
+    ('leaderboard', 'user_id', 'user', 'user', False, 'leaderboard'),
+    ('leaderboard', 'team_id', 'team', 'team', True, 'leaderboard'),
+    ('dailypoints', 'user_id', 'user', 'user', False, 'daily_points'),
+    ('userstats', 'user_id', 'user', 'user', False, 'user_stats'),
+    ('teamstanding', 'team_id', 'team', 'team', False, 'team_standings'),
+]
+
+
+def _known_ids(model, schema_editor):
+    """Map every string a row may have been referenced by to the row's primary key."""
+    known = {str(pk): str(pk) for pk in model.objects.values_list('pk', flat=True)}
+    if schema_editor.connection.vendor == 'djongo':
+        # populate_db used to reference documents by their Mongo ObjectId.
+        db = schema_editor.connection.connection
+        for document in db[model._meta.db_table].find({'id': {'$exists': True}}, {'_id': 1, 'id': 1}):
+            known[str(document['_id'])] = str(document['id'])
+    return known
+
+
+def resolve_references(apps, schema_editor):
+    """
+    Rewrite every reference as the referenced row's primary key.
+
+    References that match no row cannot become foreign keys: nullable ones
+    are cleared and rows that depend on them are deleted. The derived tables
+    can be rebuilt afterwards with ``manage.py rebuild_leaderboard``.
+    """
+    known = {
+        target: _known_ids(apps.get_model('octofit_tracker', target), schema_editor)
+        for target in ('user', 'team')
+    }
+    for model_name, field, _, target, nullable, _ in REFERENCES:
+        model = apps.get_model('octofit_tracker', model_name)
+        values = model.objects.values_list(field, flat=True).distinct().order_by()
+        for value in list(values):
+            resolved = known[target].get(str(value).strip()) if value not in (None, '') else None
+            if resolved == value:
+                continue
+            rows = model.objects.filter(**{field: value})
+            if resolved is not None:
+                rows.update(**{field: resolved})
+            elif nullable:
+                rows.update(**{field: None})
+            else:
+                rows.delete()
+
+
+def store_integer_references(apps, schema_editor):
+    """MongoDB keeps whatever type was written, so convert the ids in place."""
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo import UpdateOne
+
+    db = schema_editor.connection.connection
+    for _, column, _, _, _, table in REFERENCES:
+        updates = [
+            UpdateOne({'_id': document['_id']}, {'$set': {column: int(document[column])}})
+            for document in db[table].find({column: {'$type': 'string'}}, {column: 1})
+            if document[column].isdigit()
+        ]
+        if updates:
+            db[table].bulk_write(updates, ordered=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0005_user_stats'),
+    ]
+
+    operations = [
+        # Unresolvable team references are cleared below.
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='team_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(resolve_references, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaderboard',
+            name='leaderboard_team_rank_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='dailypoints',
+            name='daily_points_day_user_idx',
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailypoints',
+            name='daily_points_user_day_uniq',
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='team_id',
+            new_name='team',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='members', to='octofit_tracker.team'),
+        ),
+        migrations.RenameField(
+            model_name='activity',
+            old_name='user_id',
+            new_name='user',
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='user',
+            field=models.ForeignKey(on_delete=octofit_tracker.models.CASCADE_FROM_OWNER, related_name='activities', to='octofit_tracker.user'),
+        ),
+        migrations.RenameField(
+            model_name='leaderboard',
+            old_name='user_id',
+            new_name='user',
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='octofit_tracker.user'),
+        ),
+        migrations.RenameField(
+            model_name='leaderboard',
+            old_name='team_id',
+            new_name='team',
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='octofit_tracker.team'),
+        ),
+        migrations.RenameField(
+            model_name='dailypoints',
+            old_name='user_id',
+            new_name='user',
+        ),
+        migrations.AlterField(
+            model_name='dailypoints',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='octofit_tracker.user'),
+        ),
+        migrations.RenameField(
+            model_name='userstats',
+            old_name='user_id',
+            new_name='user',
+        ),
+        migrations.AlterField(
+            model_name='userstats',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='octofit_tracker.user'),
+        ),
+        migrations.RenameField(
+            model_name='teamstanding',
+            old_name='team_id',
+            new_name='team',
+        ),
+        migrations.AlterField(
+            model_name='teamstanding',
+            name='team',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='octofit_tracker.team'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'date'], name='activities_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['team', 'rank'], name='leaderboard_team_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailypoints',
+            index=models.Index(fields=['day', 'user'], name='daily_points_day_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypoints',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='daily_points_user_day_uniq'),
+        ),
+        migrations.RunPython(store_integer_references, migrations.RunPython.noop),
+    ]
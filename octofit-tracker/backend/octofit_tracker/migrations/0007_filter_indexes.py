@@ -0,0 +1,81 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+# As in 0002, the indexes are also created through the driver on djongo.
+MONGO_INDEXES = {
+    'activities': [
+        ('activities_user_date_id_idx', [('user_id', 1), ('date', 1), ('id', 1)]),
+        ('activities_type_date_id_idx', [('activity_type', 1), ('date', 1), ('id', 1)]),
+    ],
+    'users': [
+        ('users_team_created_id_idx', [('team_id', 1), ('created_at', 1), ('id', 1)]),
+    ],
+}
+# Superseded by activities_user_date_id_idx.
+MONGO_DROPPED = [('activities', 'activities_user_date_idx', [('user_id', 1), ('date', 1)])]
+
+
+def create_mongo_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    db = schema_editor.connection.connection
+    for collection, indexes in MONGO_INDEXES.items():
+        for name, keys in indexes:
+            try:
+                db[collection].create_index(keys, name=name, background=True)
+            except OperationFailure as exc:
+                # 85/86: an equivalent index already exists under another name.
+                if exc.code not in (85, 86):
+                    raise
+    for collection, name, _ in MONGO_DROPPED:
+        try:
+            db[collection].drop_index(name)
+        except OperationFailure:
+            pass
+
+
+def drop_mongo_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    db = schema_editor.connection.connection
+    for collection, name, keys in MONGO_DROPPED:
+        db[collection].create_index(keys, name=name, background=True)
+    for collection, indexes in MONGO_INDEXES.items():
+        for name, _ in indexes:
+            try:
+                db[collection].drop_index(name)
+            except OperationFailure:
+                pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0006_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'date', 'id'], name='activities_user_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['activity_type', 'date', 'id'], name='activities_type_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['team', 'created_at', 'id'], name='users_team_created_id_idx'),
+        ),
+        migrations.RunPython(create_mongo_indexes, drop_mongo_indexes),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+# As in 0002, the indexes are also created through the driver on djongo.
+MONGO_INDEXES = [
+    ('changes_collection_object_idx', [('collection', 1), ('object_id', 1)]),
+    ('changes_collection_seq_idx', [('collection', 1), ('id', 1)]),
+]
+# Collection name in the feed -> model.
+SYNCED = {'teams': 'Team', 'users': 'User', 'workouts': 'Workout', 'activities': 'Activity'}
+
+
+def create_mongo_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    db = schema_editor.connection.connection
+    for name, keys in MONGO_INDEXES:
+        try:
+            db['changes'].create_index(keys, name=name, background=True)
+        except OperationFailure as exc:
+            # 85/86: an equivalent index already exists under another name.
+            if exc.code not in (85, 86):
+                raise
+
+
+def record_existing_rows(apps, schema_editor):
+    """One entry per existing row, so syncing from 0 fetches everything."""
+    Change = apps.get_model('octofit_tracker', 'Change')
+    for collection, model_name in SYNCED.items():
+        model = apps.get_model('octofit_tracker', model_name)
+        pks = model.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=5000)
+        Change.objects.bulk_create(
+            (Change(collection=collection, object_id=pk) for pk in pks), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0008_ingest_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'changes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['collection', 'object_id'], name='changes_collection_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['collection', 'id'], name='changes_collection_seq_idx'),
+        ),
+        migrations.RunPython(create_mongo_indexes, migrations.RunPython.noop),
+        migrations.RunPython(record_existing_rows, migrations.RunPython.noop),
+    ]
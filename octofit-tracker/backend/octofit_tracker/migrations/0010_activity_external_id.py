@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+MONGO_INDEX = 'activities_user_external_id_uniq'
+
+
+def create_mongo_index(apps, schema_editor):
+    """As in 0002, through the driver on djongo; only documents with a key take part."""
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    schema_editor.connection.connection['activities'].create_index(
+        [('user_id', 1), ('external_id', 1)], name=MONGO_INDEX, unique=True,
+        partialFilterExpression={'external_id': {'$type': 'string'}})
+
+
+def drop_mongo_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'djongo':
+        return
+    from pymongo.errors import OperationFailure
+
+    try:
+        schema_editor.connection.connection['activities'].drop_index(MONGO_INDEX)
+    except OperationFailure:
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0009_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='activity',
+            constraint=models.UniqueConstraint(condition=models.Q(('external_id__isnull', False)), fields=('user', 'external_id'), name='activities_user_external_id_uniq'),
+        ),
+        migrations.RunPython(create_mongo_index, drop_mongo_index),
+    ]
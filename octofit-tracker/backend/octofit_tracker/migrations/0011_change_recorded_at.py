@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0010_activity_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
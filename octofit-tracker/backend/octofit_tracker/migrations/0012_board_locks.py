@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0011_change_recorded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'db_table': 'board_locks',
+            },
+        ),
+    ]
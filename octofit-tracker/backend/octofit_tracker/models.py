@@ -1,15 +1,32 @@
 from django.db import models
+from django.utils import timezone
+
+
+def CASCADE_FROM_OWNER(collector, field, sub_objs, using):
+    """
+    ``CASCADE`` that marks every row it deletes with ``_owner_deleted``.
+
+    Signal handlers use the mark to skip bookkeeping for rows that go away
+    together with the user they belong to.
+    """
+    for obj in sub_objs:
+        obj._owner_deleted = True
+    models.CASCADE(collector, field, sub_objs, using)
 
 
 class User(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     password = models.CharField(max_length=200)
-    team_id = models.CharField(max_length=100, null=True, blank=True)
+    team = models.ForeignKey('Team', on_delete=models.SET_NULL, null=True, blank=True, related_name='members')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='users_created_id_idx'),
+            models.Index(fields=['team', 'created_at', 'id'], name='users_team_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -28,36 +45,159 @@ class Team(models.Model):
 
 
 class Activity(models.Model):
-    user_id = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=CASCADE_FROM_OWNER, related_name='activities')
     activity_type = models.CharField(max_length=100)
     duration = models.IntegerField()  # in minutes
     distance = models.FloatField(null=True, blank=True)  # in km
     calories = models.IntegerField()
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Client-chosen key; writing the same one twice for a user updates the row.
+    # The constraint below needs partial index support (see upserts.py).
+    external_id = models.CharField(max_length=100, null=True, blank=True)
 
     class Meta:
         db_table = 'activities'
         verbose_name_plural = 'Activities'
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='activities_user_date_id_idx'),
+            models.Index(fields=['activity_type', 'date', 'id'], name='activities_type_date_id_idx'),
+            models.Index(fields=['date', 'id'], name='activities_date_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'external_id'], condition=models.Q(external_id__isnull=False),
+                                    name='activities_user_external_id_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.activity_type} - {self.duration} mins"
 
 
 class Leaderboard(models.Model):
-    user_id = models.CharField(max_length=100)
-    team_id = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    team = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     total_points = models.IntegerField(default=0)
-    rank = models.IntegerField(default=0)
+    rank = models.IntegerField(default=0, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'leaderboard'
+        indexes = [
+            models.Index(fields=['team', 'rank'], name='leaderboard_team_rank_idx'),
+        ]
 
     def __str__(self):
         return f"Rank {self.rank} - User {self.user_id}"
 
 
+class DailyPoints(models.Model):
+    """Points a user earned on one day; the bucket windowed leaderboards sum."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    points = models.IntegerField(default=0)
+    activity_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'daily_points'
+        verbose_name_plural = 'Daily points'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_points_user_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user'], name='daily_points_day_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - User {self.user_id}: {self.points}"
+
+
+class UserStats(models.Model):
+    """Running summary of a user's activities, updated on every activity write."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='+')
+    activity_count = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0)  # in minutes
+    total_distance = models.FloatField(default=0)  # in km
+    total_calories = models.IntegerField(default=0)
+    by_type = models.JSONField(default=dict)  # activity type -> totals
+    weekly = models.JSONField(default=dict)  # ISO Monday -> totals
+    last_active_day = models.DateField(null=True, blank=True)
+    current_streak = models.IntegerField(default=0)  # in days
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_stats'
+        verbose_name_plural = 'User stats'
+
+    def __str__(self):
+        return f"Stats for user {self.user_id}"
+
+
+class TeamStanding(models.Model):
+    """Per-team rollup of the leaderboard, maintained as users score points."""
+    team = models.OneToOneField(Team, on_delete=models.CASCADE, related_name='+')
+    total_points = models.IntegerField(default=0)
+    member_count = models.IntegerField(default=0)
+    average_points = models.FloatField(default=0)
+    rank = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'team_standings'
+
+    def __str__(self):
+        return f"Rank {self.rank} - Team {self.team_id}"
+
+
+class BoardLock(models.Model):
+    """
+    One row per ranked board. Writers lock it before assigning or shifting
+    ranks, so concurrent changes to one board never interleave.
+    """
+    board = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        db_table = 'board_locks'
+
+    def __str__(self):
+        return self.board
+
+
+class Change(models.Model):
+    """
+    The latest change to one row of a synced collection. The id is the
+    change sequence: each write replaces the row's entry with a higher one.
+    """
+    collection = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    # When the id was allocated; the feed holds entries back until they are
+    # old enough that every lower id has committed (see sync.py).
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'changes'
+        indexes = [
+            models.Index(fields=['collection', 'object_id'], name='changes_collection_object_idx'),
+            models.Index(fields=['collection', 'id'], name='changes_collection_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {'delete' if self.deleted else 'upsert'} {self.collection}/{self.object_id}"
+
+
+class IngestCheckpoint(models.Model):
+    """Highest ingestion queue entry applied, committed with the activities it covers."""
+    queue_id = models.CharField(max_length=36, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ingest_checkpoints'
+
+    def __str__(self):
+        return f"Queue {self.queue_id} at {self.last_id}"
+
+
 class Workout(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
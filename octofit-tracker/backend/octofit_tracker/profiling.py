@@ -0,0 +1,101 @@
+"""
+On-demand request profiles.
+
+A profiled request is run under cProfile and leaves two files behind in
+``OCTOFIT_PROFILE_DIR``: ``<handle>.pstats`` for ``python -m pstats`` or
+snakeviz, and ``<handle>.collapsed`` in the folded-stack format read by
+flamegraph.pl and speedscope.
+
+cProfile records caller/callee pairs rather than whole stacks, so the folded
+stacks are rebuilt from the call graph: a function's time is shared out
+between the paths that reach it in proportion to the time each of its callers
+spent in it. That is exact for trees and a close estimate where a function is
+called from several places.
+"""
+import cProfile
+import os
+import pstats
+import time
+import uuid
+
+# Stacks worth less than this many microseconds are left out of the flamegraph.
+MIN_MICROSECONDS = 1
+MAX_DEPTH = 200
+
+
+def new_handle():
+    return f'{time.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:12]}'
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        # Built-ins: cProfile reports them as ('~', 0, '<built-in method ...>').
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def collapsed_stacks(stats):
+    """
+    Fold a ``pstats.Stats`` into ``{stack: microseconds}``, where ``stack`` is
+    a ``;``-joined path from the outermost call.
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+    roots = [func for func, entry in raw.items() if not entry[4]]
+
+    stacks = {}
+
+    def walk(func, path, share):
+        # ``share`` is the fraction of func's total time spent under ``path``.
+        _, _, own, cumulative, _ = raw[func]
+        path = path + (_label(func),)
+        micros = round(own * share * 1e6)
+        if micros >= MIN_MICROSECONDS:
+            stack = ';'.join(path)
+            stacks[stack] = stacks.get(stack, 0) + micros
+        if len(path) >= MAX_DEPTH:
+            return
+        for callee, from_here in callees.get(func, ()):
+            total = raw[callee][3]
+            if callee == func or total <= 0 or _label(callee) in path:
+                continue
+            portion = share * from_here / total
+            if portion * total * 1e6 >= MIN_MICROSECONDS:
+                walk(callee, path, portion)
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return stacks
+
+
+def save(profiler, directory, handle):
+    """Write ``profiler``'s pstats and folded stacks to ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, handle)
+    profiler.dump_stats(f'{base}.pstats')
+    stacks = collapsed_stacks(pstats.Stats(f'{base}.pstats'))
+    with open(f'{base}.collapsed', 'w', encoding='utf-8') as out:
+        for stack, micros in sorted(stacks.items()):
+            out.write(f'{stack} {micros}\n')
+    return base
+
+
+class RequestProfile:
+    """Profile the calling thread for the duration of a ``with`` block."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.handle = new_handle()
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        save(self.profiler, self.directory, self.handle)
@@ -0,0 +1,116 @@
+"""
+Response renderers beyond the DRF defaults.
+
+orjson and msgpack are optional. Without orjson ``ORJSONRenderer`` behaves
+exactly like DRF's ``JSONRenderer``; the MessagePack classes are only wired
+into the settings when msgpack is installed.
+"""
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def join_lines(lines, batch_size=500):
+    """Group rendered lines into larger chunks for a streaming response."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, one object per line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.lines(data if isinstance(data, list) else [data])).encode(self.charset)
+
+    def lines(self, rows, fields=None):
+        for row in rows:
+            yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """Comma-separated values with a header row."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return ''.join(self.lines(rows, fields)).encode(self.charset)
+
+    def lines(self, rows, fields):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(['' if row[name] is None else row[name] for name in fields])
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` backed by orjson.
+
+    Dates and datetimes are encoded natively (UTC as ``Z``); anything orjson
+    does not know goes through DRF's encoder. Indented output, as asked for by
+    the browsable API or an ``indent=`` media type parameter, and an
+    ``ensure_ascii`` or non-compact configuration use the stock renderer.
+    orjson writes NaN and infinities as ``null`` where DRF raises, so float
+    input is validated as finite (see ``FiniteFloatField``) and never gets
+    this far.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        # Match JSONRenderer: keep the output a strict JavaScript subset.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack, for clients that would rather not parse JSON."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_default(obj):
+    # Dates, decimals, lazy strings and the like get their JSON representation.
+    return JSONEncoder().default(obj)
@@ -0,0 +1,157 @@
+"""
+Daily point buckets and the time-windowed leaderboards built from them.
+
+Every activity write adjusts one ``DailyPoints`` row per (user, day), so a
+window of up to 31 days is answered by summing at most 31 buckets per user
+instead of scanning raw activities.
+
+Window results are cached. Each day has a version counter in the cache that is
+bumped whenever a write to that day commits, and a window's cache key includes
+the versions of all of its days and of the users table (for the names), so a
+cached window goes stale exactly when a write lands inside it or a user
+changes, and never otherwise.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
+
+from . import caching
+from .leaderboard import points_for
+from .models import Activity, DailyPoints, User
+
+WINDOWS = ('day', 'week', 'month', 'rolling30')
+
+_to_date = models.DateField().to_python
+
+
+def window_bounds(window, as_of):
+    """Return the inclusive ``(start, end)`` days of a window ending ``as_of``."""
+    if window == 'day':
+        return as_of, as_of
+    if window == 'week':
+        return as_of - timedelta(days=as_of.weekday()), as_of
+    if window == 'month':
+        return as_of.replace(day=1), as_of
+    if window == 'rolling30':
+        return as_of - timedelta(days=29), as_of
+    raise ValueError(f'Unknown window {window!r}')
+
+
+def _version_key(day):
+    return f'rollups:day:{day.isoformat()}'
+
+
+def apply_points(user_id, day, points, activities):
+    """Adjust one user's bucket for one day; empty buckets are removed."""
+    if not (points or activities):
+        return
+    bucket = DailyPoints.objects.filter(user_id=user_id, day=day)
+    with transaction.atomic():
+        if not bucket.update(points=F('points') + points, activity_count=F('activity_count') + activities):
+            try:
+                with transaction.atomic():
+                    DailyPoints.objects.create(user_id=user_id, day=day, points=points, activity_count=activities)
+            except IntegrityError:
+                bucket.update(points=F('points') + points, activity_count=F('activity_count') + activities)
+        if activities < 0:
+            bucket.filter(activity_count__lte=0).delete()
+    caching.bump_on_commit(_version_key(day))
+
+
+def _apply_totals(totals):
+    for (user_id, day), (points, activities) in totals.items():
+        apply_points(user_id, day, points, activities)
+    caching.bump_model(DailyPoints)
+
+
+def record_activity_change(old, new):
+    """
+    Apply an activity write to the daily buckets.
+
+    ``old`` and ``new`` are the activity before and after the write; either
+    is ``None`` for a create or delete respectively.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    if old is not None:
+        bucket = totals[(old.user_id, _to_date(old.date))]
+        bucket[0] -= points_for(old.calories)
+        bucket[1] -= 1
+    if new is not None:
+        bucket = totals[(new.user_id, _to_date(new.date))]
+        bucket[0] += points_for(new.calories)
+        bucket[1] += 1
+    _apply_totals(totals)
+
+
+def record_bulk_create(activities):
+    """Apply a batch of newly inserted activities with one update per bucket."""
+    totals = defaultdict(lambda: [0, 0])
+    for activity in activities:
+        bucket = totals[(activity.user_id, _to_date(activity.date))]
+        bucket[0] += points_for(activity.calories)
+        bucket[1] += 1
+    _apply_totals(totals)
+
+
+def _rank(rows):
+    return [
+        {'rank': rank, 'user_id': row['user_id'], 'user_name': row['user_name'], 'total_points': row['total_points']}
+        for rank, row in enumerate(rows, start=1)
+    ]
+
+
+def window_standings(window, as_of):
+    """Ranked ``{rank, user_id, user_name, total_points}`` rows for a window, cached until it changes."""
+    start, end = window_bounds(window, as_of)
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    digest = caching.digest(
+        ['rollups:generation', caching.model_key(User)] + [_version_key(day) for day in days])
+    key = f'rollups:window:{start.isoformat()}:{end.isoformat()}:{digest}'
+
+    standings = cache.get(key)
+    if standings is None:
+        standings = _rank(
+            DailyPoints.objects.filter(day__range=(start, end))
+            .values('user_id', user_name=F('user__name'))
+            .annotate(total_points=Sum('points'))
+            .order_by('-total_points', 'user_id')
+        )
+        cache.set(key, standings, None)
+    return standings
+
+
+def compute_window(start, end):
+    """Rank a window straight from raw activities. Used to check the buckets."""
+    return _rank(
+        Activity.objects.filter(date__range=(start, end))
+        .values('user_id', user_name=F('user__name'))
+        .annotate(total_points=Sum('calories'))
+        .order_by('-total_points', 'user_id')
+    )
+
+
+def rebuild():
+    """Rewrite every daily bucket from the activities table. Used for recovery."""
+    rows = (
+        Activity.objects.values('user_id', 'date')
+        .annotate(points=Sum('calories'), activities=Count('id'))
+        .order_by()
+    )
+    buckets = (
+        DailyPoints(user_id=row['user_id'], day=row['date'], points=row['points'] or 0,
+                    activity_count=row['activities'])
+        for row in rows.iterator()
+    )
+    with transaction.atomic():
+        DailyPoints.objects.all().delete()
+        while True:
+            batch = list(islice(buckets, 1000))
+            if not batch:
+                break
+            DailyPoints.objects.bulk_create(batch)
+    caching.bump_on_commit('rollups:generation')
+    caching.bump_model(DailyPoints)
@@ -1,33 +1,133 @@
+import math
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from . import timing
+from .models import User, Team, Activity, Leaderboard, TeamStanding, Workout
+
+
+class SparseFieldsMixin:
+    """Accept a ``fields`` argument naming the subset of fields to render."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TimedSerializerMixin:
+    """Add the time spent representing each instance to the request's serializer timer."""
+
+    def to_representation(self, instance):
+        with timing.measure('serialize'):
+            return super().to_representation(instance)
+
+
+class RelatedIdField(serializers.PrimaryKeyRelatedField):
+    """
+    A foreign key read and written as the related row's primary key.
+
+    ``preload(values)`` fetches the rows for a whole batch in one query, so
+    validating many items does not look each one up separately.
+    """
+    _preloaded = None
+
+    def preload(self, values):
+        pk_field = self.get_queryset().model._meta.pk
+        pks = set()
+        for value in values:
+            try:
+                pks.add(pk_field.to_python(value))
+            except (DjangoValidationError, TypeError, ValueError):
+                pass
+        pks.discard(None)
+        self._preloaded = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self._preloaded is not None and not isinstance(data, bool):
+            try:
+                found = self._preloaded.get(self.get_queryset().model._meta.pk.to_python(data))
+            except (DjangoValidationError, TypeError, ValueError):
+                found = None
+            if found is not None:
+                return found
+        return super().to_internal_value(data)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class FiniteFloatField(serializers.FloatField):
+    """
+    A ``FloatField`` that rejects NaN and infinities, which ``float()``
+    accepts from form and MessagePack input but JSON cannot represent.
+    """
+    default_error_messages = {'non_finite': 'A finite number is required.'}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('non_finite')
+        return value
+
+
+class UserSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    team_id = RelatedIdField(source='team', queryset=Team.objects.all(), allow_null=True, required=False)
+
     class Meta:
         model = User
         fields = ['id', 'name', 'email', 'password', 'team_id', 'created_at']
         extra_kwargs = {'password': {'write_only': True}}
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Team
         fields = ['id', 'name', 'description', 'created_at']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    user_id = RelatedIdField(source='user', queryset=User.objects.all())
+    distance = FiniteFloatField(allow_null=True, required=False)
+
     class Meta:
         model = Activity
-        fields = ['id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at']
+        fields = ['id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at',
+                  'external_id']
+        extra_kwargs = {'external_id': {'allow_blank': False}}
+
+    def validate(self, attrs):
+        # Creates match on the key instead (see upserts.py); an update must
+        # not move a row onto another row's key.
+        if self.instance is not None:
+            user = attrs.get('user', self.instance.user)
+            external_id = attrs.get('external_id', self.instance.external_id)
+            if external_id is not None and Activity.objects.filter(
+                    user=user, external_id=external_id).exclude(pk=self.instance.pk).exists():
+                raise serializers.ValidationError(
+                    {'external_id': ['This user already has an activity with this key.']})
+        return attrs
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    user_id = RelatedIdField(source='user', queryset=User.objects.all())
+    user_name = serializers.CharField(source='user.name', read_only=True)
+    team_id = RelatedIdField(source='team', queryset=Team.objects.all(), allow_null=True, required=False)
+    team_name = serializers.CharField(source='team.name', read_only=True, allow_null=True)
+
     class Meta:
         model = Leaderboard
-        fields = ['id', 'user_id', 'team_id', 'total_points', 'rank', 'updated_at']
+        fields = ['id', 'user_id', 'user_name', 'team_id', 'team_name', 'total_points', 'rank', 'updated_at']
+
+
+class TeamStandingSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    team_id = RelatedIdField(source='team', read_only=True)
+    team_name = serializers.CharField(source='team.name', read_only=True)
+
+    class Meta:
+        model = TeamStanding
+        fields = ['team_id', 'team_name', 'total_points', 'member_count', 'average_points', 'rank', 'updated_at']
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['id', 'name', 'description', 'difficulty', 'duration', 'category', 'created_at']
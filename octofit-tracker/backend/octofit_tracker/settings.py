@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.middleware.MetricsMiddleware',
+    'octofit_tracker.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'octofit_tracker.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'octofit_tracker.urls'
@@ -101,6 +105,92 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Responses are cached under per-model version counters (see
+# octofit_tracker/caching.py), so entries never need a TTL. Every process that
+# writes (the API server, ingest_worker, rebuild_leaderboard, populate_db)
+# must bump the counters the server reads: set OCTOFIT_CACHE_URL to a Redis
+# URL, or OCTOFIT_CACHE_DIR to share a cache between processes on one host.
+# The in-memory default is only correct for a single process; the commands
+# warn when they run with it.
+
+OCTOFIT_CACHE_URL = os.environ.get('OCTOFIT_CACHE_URL')
+OCTOFIT_CACHE_DIR = os.environ.get('OCTOFIT_CACHE_DIR')
+if OCTOFIT_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': OCTOFIT_CACHE_URL,
+        }
+    }
+elif OCTOFIT_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': OCTOFIT_CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'octofit',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
+# Django REST framework
+# orjson-backed JSON is the default; MessagePack is offered to clients that
+# ask for application/msgpack when msgpack is installed.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'octofit_tracker.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'octofit_tracker.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('octofit_tracker.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('octofit_tracker.parsers.MessagePackParser')
+
+
+# Performance instrumentation
+# Server-Timing headers break each response down into database, serializer
+# and render time. Requests slower than OCTOFIT_SLOW_REQUEST_MS or running more
+# than OCTOFIT_MAX_QUERIES queries are logged to octofit_tracker.performance;
+# both limits are off when None.
+# With OCTOFIT_PROFILE_DIR set, requests sent with an "X-Profile: 1" header or
+# ?profile=1 are run under cProfile and their profiles saved there; leave it
+# unset outside staging.
+
+OCTOFIT_SERVER_TIMING = DEBUG
+OCTOFIT_SLOW_REQUEST_MS = None
+OCTOFIT_MAX_QUERIES = None
+OCTOFIT_PROFILE_DIR = os.environ.get('OCTOFIT_PROFILE_DIR')
+
+# Write-behind ingestion
+# With OCTOFIT_INGEST_QUEUE set to a file path, activity POSTs are queued
+# there and answered with 202; run "manage.py ingest_worker" to write them.
+# Unset, activities are written during the request.
+
+OCTOFIT_INGEST_QUEUE = os.environ.get('OCTOFIT_INGEST_QUEUE')
+
+# Sync feed
+# /api/sync/ only hands out changes recorded at least this many seconds ago,
+# so a transaction still open behind a newer change cannot be skipped; it
+# must exceed the longest write transaction plus clock skew between hosts.
+
+OCTOFIT_SYNC_LAG = float(os.environ.get('OCTOFIT_SYNC_LAG', 5))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
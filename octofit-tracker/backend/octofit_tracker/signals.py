@@ -0,0 +1,157 @@
+"""
+Model signal handlers that keep derived data in step with activity writes.
+"""
+from django.apps import apps
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import caching, leaderboard, metrics, rollups, stats, sync, timing
+from .models import (
+    Activity, BoardLock, Change, DailyPoints, IngestCheckpoint, Leaderboard, Team, TeamStanding, User, UserStats,
+)
+
+
+# Fields of an activity that derived data depends on.
+ACTIVITY_FIELDS = ('user_id', 'activity_type', 'duration', 'distance', 'calories', 'date')
+
+
+def activities_bulk_created(activities):
+    """Fan out a ``bulk_create`` batch, which bypasses model signals."""
+    leaderboard.record_bulk_create(activities)
+    rollups.record_bulk_create(activities)
+    stats.record_bulk_create(activities)
+    sync.record(Activity, [activity.pk for activity in activities])
+    caching.bump_model(Activity)
+
+
+@receiver(pre_save, sender=Activity)
+def remember_previous_activity(sender, instance, raw=False, **kwargs):
+    """Stash the stored version of an activity so post_save can diff it."""
+    instance._previous = None
+    if raw or instance.pk is None:
+        return
+    values = Activity.objects.filter(pk=instance.pk).values(*ACTIVITY_FIELDS).first()
+    if values is not None:
+        instance._previous = Activity(pk=instance.pk, **values)
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous', None)
+    leaderboard.record_activity_change(previous, instance)
+    rollups.record_activity_change(previous, instance)
+    stats.record_activity_change(previous, instance)
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    if getattr(instance, '_owner_deleted', False):
+        # The user's board row, buckets and summary are deleted with them.
+        return
+    leaderboard.record_activity_change(instance, None)
+    rollups.record_activity_change(instance, None)
+    stats.record_activity_change(instance, None)
+
+
+@receiver(pre_save, sender=Leaderboard)
+def remember_previous_standing(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if raw or instance.pk is None:
+        return
+    instance._previous = (
+        Leaderboard.objects.filter(pk=instance.pk).values_list('team_id', 'total_points').first()
+    )
+
+
+@receiver(post_save, sender=Leaderboard)
+def standing_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous', None)
+    leaderboard.record_standing_change(previous, (instance.team_id, instance.total_points))
+
+
+@receiver(post_delete, sender=Leaderboard)
+def standing_deleted(sender, instance, **kwargs):
+    # Board rows go when their user is deleted.
+    leaderboard.close_gap(instance)
+    leaderboard.record_standing_change((instance.team_id, instance.total_points), None)
+
+
+@receiver(post_delete, sender=TeamStanding)
+def team_standing_deleted(sender, instance, **kwargs):
+    leaderboard.close_gap(instance)
+    caching.bump_model(TeamStanding)
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_team(sender, instance, raw=False, **kwargs):
+    instance._previous_team = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_team = User.objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous_team', None)
+    leaderboard.record_membership_change(instance.pk, previous, instance.team_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    leaderboard.record_membership_change(None, instance.team_id, None)
+
+
+def record_sync_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync.record(sender, [instance.pk])
+
+
+def record_sync_tombstone(sender, instance, **kwargs):
+    sync.record(sender, [instance.pk], deleted=True)
+
+
+# Only synced models: Change itself must keep fast deletes, since every
+# record() prunes the entries it replaces.
+for model, _ in sync.COLLECTIONS.values():
+    post_save.connect(record_sync_change, sender=model)
+    post_delete.connect(record_sync_tombstone, sender=model)
+
+
+@receiver(pre_delete, sender=Team)
+def record_members_leaving(sender, instance, **kwargs):
+    """Deleting a team clears its members' team with a bulk update, which sends no signals."""
+    members = list(User.objects.filter(team=instance).values_list('pk', flat=True))
+    if members:
+        sync.record(User, members)
+        caching.bump_model(User)
+
+
+def bump_cache_version(sender, **kwargs):
+    """Invalidate cached responses built from the model that was written."""
+    caching.bump_model(sender)
+
+
+# Connected per model: a post_delete receiver without a sender would turn off
+# fast deletes everywhere. Derived and bookkeeping models are bulk written and
+# bump their own versions where they are written.
+for model in apps.get_app_config('octofit_tracker').get_models():
+    if model not in (BoardLock, Change, DailyPoints, IngestCheckpoint, TeamStanding, UserStats):
+        post_save.connect(bump_cache_version, sender=model)
+        post_delete.connect(bump_cache_version, sender=model)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    metrics.db_connections_total.inc((connection.alias, connection.vendor))
+
+
+@receiver(connection_created)
+def time_connection_queries(sender, connection, **kwargs):
+    timing.install(connection)
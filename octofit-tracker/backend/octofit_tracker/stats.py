@@ -0,0 +1,233 @@
+"""
+Per-user activity summaries.
+
+A ``UserStats`` row per user carries running totals, a per-activity-type
+breakdown, per-week totals and the current streak. Each activity write applies
+its delta to the summary, so reading a user's stats is a single row lookup no
+matter how long their history is.
+
+Streaks are kept as ``(last_active_day, current_streak)``. Appending a newer
+day extends or restarts the run in O(1); only edits that can split or join the
+current run fall back to walking the user's daily buckets, which costs
+O(streak length).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.db import models, transaction
+from django.db.models import Count, Sum
+
+from . import caching
+from .models import Activity, DailyPoints, UserStats
+
+TREND_WEEKS = 12
+
+_to_date = models.DateField().to_python
+
+_TOTALS = ('activities', 'duration', 'distance', 'calories')
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _contribution(activity, sign):
+    return {
+        'activities': sign,
+        'duration': sign * (activity.duration or 0),
+        'distance': sign * (activity.distance or 0),
+        'calories': sign * (activity.calories or 0),
+    }
+
+
+def _add(target, key, delta):
+    """Add ``delta`` totals into ``target[key]``, dropping it once it is empty."""
+    current = target.get(key) or dict.fromkeys(_TOTALS, 0)
+    for name in _TOTALS:
+        current[name] = current[name] + delta[name]
+    current['distance'] = round(current['distance'], 6)
+    if current['activities'] <= 0:
+        target.pop(key, None)
+    else:
+        target[key] = current
+
+
+def _streak_ending(user_id, day):
+    """Length of the run of active days ending on ``day``, from the daily buckets."""
+    length = 0
+    expected = day
+    days = (DailyPoints.objects.filter(user_id=user_id, day__lte=day)
+            .order_by('-day').values_list('day', flat=True))
+    for active in days.iterator():
+        if active != expected:
+            break
+        length += 1
+        expected -= timedelta(days=1)
+    return length
+
+
+def _recompute_streak(summary):
+    last = (DailyPoints.objects.filter(user_id=summary.user_id)
+            .order_by('-day').values_list('day', flat=True).first())
+    summary.last_active_day = last
+    summary.current_streak = _streak_ending(summary.user_id, last) if last else 0
+
+
+def _update_streak(summary, day, added):
+    last, streak = summary.last_active_day, summary.current_streak
+    if added:
+        if last is None or day > last + timedelta(days=1):
+            summary.last_active_day, summary.current_streak = day, 1
+        elif day == last + timedelta(days=1):
+            summary.last_active_day, summary.current_streak = day, streak + 1
+        elif day == last - timedelta(days=streak):
+            # Backfilled the day just before the run; it may join an older run.
+            _recompute_streak(summary)
+        return
+    if last is None or DailyPoints.objects.filter(user_id=summary.user_id, day=day).exists():
+        return
+    if last - timedelta(days=streak) < day <= last:
+        # The removed day was part of the current run.
+        _recompute_streak(summary)
+
+
+def _apply(user_id, changes):
+    """Apply ``[(activity, sign), ...]`` for one user to their summary."""
+    with transaction.atomic():
+        summary, _ = UserStats.objects.select_for_update().get_or_create(user_id=user_id)
+        for activity, sign in changes:
+            delta = _contribution(activity, sign)
+            summary.activity_count += delta['activities']
+            summary.total_duration += delta['duration']
+            summary.total_distance = round(summary.total_distance + delta['distance'], 6)
+            summary.total_calories += delta['calories']
+            day = _to_date(activity.date)
+            _add(summary.by_type, activity.activity_type, delta)
+            _add(summary.weekly, _week_start(day).isoformat(), delta)
+            _update_streak(summary, day, sign > 0)
+        summary.save()
+
+
+def record_activity_change(old, new):
+    """
+    Apply an activity write to the author's summary.
+
+    ``old`` and ``new`` are the activity before and after the write; either
+    is ``None`` for a create or delete respectively. Must run after the
+    daily buckets have been updated, since streaks are derived from them.
+    """
+    changes = defaultdict(list)
+    if old is not None:
+        changes[old.user_id].append((old, -1))
+    if new is not None:
+        changes[new.user_id].append((new, 1))
+    for user_id, user_changes in changes.items():
+        _apply(user_id, user_changes)
+    caching.bump_model(UserStats)
+
+
+def record_bulk_create(activities):
+    """Apply a batch of newly inserted activities with one update per user."""
+    changes = defaultdict(list)
+    for activity in sorted(activities, key=lambda activity: _to_date(activity.date)):
+        changes[activity.user_id].append((activity, 1))
+    for user_id, user_changes in changes.items():
+        _apply(user_id, user_changes)
+    caching.bump_model(UserStats)
+
+
+def summary_for(user_id, as_of):
+    """Return the stats document for a user as of a day."""
+    summary = UserStats.objects.filter(user_id=user_id).first() or UserStats(user_id=user_id)
+    return _document(summary, as_of)
+
+
+def _document(summary, as_of):
+    this_week = _week_start(as_of)
+    weeks = [this_week - timedelta(weeks=offset) for offset in range(TREND_WEEKS - 1, -1, -1)]
+    active = summary.last_active_day is not None and summary.last_active_day >= as_of - timedelta(days=1)
+    return {
+        'user_id': summary.user_id,
+        'activity_count': summary.activity_count,
+        'total_duration': summary.total_duration,
+        'total_distance': summary.total_distance,
+        'total_calories': summary.total_calories,
+        'by_type': dict(sorted(summary.by_type.items())),
+        'weekly': [
+            dict(summary.weekly.get(week.isoformat()) or dict.fromkeys(_TOTALS, 0), week_start=week)
+            for week in weeks
+        ],
+        'current_streak': summary.current_streak if active else 0,
+        'last_active_day': summary.last_active_day,
+    }
+
+
+def compute_summary(user_id, as_of):
+    """Build the same document by aggregating raw activities. Used to check summaries."""
+    activities = Activity.objects.filter(user_id=user_id)
+    summary = UserStats(user_id=user_id)
+    totals = activities.aggregate(
+        count=Count('id'), duration=Sum('duration'), distance=Sum('distance'), calories=Sum('calories'))
+    summary.activity_count = totals['count']
+    summary.total_duration = totals['duration'] or 0
+    summary.total_distance = round(totals['distance'] or 0, 6)
+    summary.total_calories = totals['calories'] or 0
+    for activity in activities.only('activity_type', 'duration', 'distance', 'calories', 'date'):
+        delta = _contribution(activity, 1)
+        _add(summary.by_type, activity.activity_type, delta)
+        _add(summary.weekly, _week_start(activity.date).isoformat(), delta)
+    days = set(activities.values_list('date', flat=True))
+    if days:
+        summary.last_active_day = max(days)
+        while summary.last_active_day - timedelta(days=summary.current_streak) in days:
+            summary.current_streak += 1
+    return _document(summary, as_of)
+
+
+def _summary_from(user_id, rows):
+    """Build a summary from a user's per-(type, day) totals, in day order."""
+    summary = UserStats(user_id=user_id)
+    days = []
+    for row in rows:
+        delta = {name: row[name] or 0 for name in _TOTALS}
+        summary.activity_count += delta['activities']
+        summary.total_duration += delta['duration']
+        summary.total_distance = round(summary.total_distance + delta['distance'], 6)
+        summary.total_calories += delta['calories']
+        _add(summary.by_type, row['activity_type'], delta)
+        _add(summary.weekly, _week_start(row['date']).isoformat(), delta)
+        days.append(row['date'])
+    summary.last_active_day = days[-1]
+    active = set(days)
+    while summary.last_active_day - timedelta(days=summary.current_streak) in active:
+        summary.current_streak += 1
+    return summary
+
+
+def rebuild(batch_size=1000):
+    """
+    Rewrite every summary from the activities table. Used for recovery.
+
+    One grouped aggregate, streamed in user order, feeds batched inserts, so
+    the number of queries does not grow with the number of users.
+    """
+    rows = (
+        Activity.objects.values('user_id', 'activity_type', 'date')
+        .annotate(activities=Count('id'), duration=Sum('duration'), distance=Sum('distance'),
+                  calories=Sum('calories'))
+        .order_by('user_id', 'date')
+    )
+    summaries = (
+        _summary_from(user_id, group)
+        for user_id, group in groupby(rows.iterator(), key=itemgetter('user_id'))
+    )
+    with transaction.atomic():
+        UserStats.objects.all().delete()
+        while True:
+            batch = list(islice(summaries, batch_size))
+            if not batch:
+                break
+            UserStats.objects.bulk_create(batch)
+    caching.bump_model(UserStats)
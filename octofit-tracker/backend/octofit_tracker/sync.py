@@ -0,0 +1,124 @@
+"""
+Change feed for client sync.
+
+Every write to a synced collection records a ``Change`` whose id is taken
+from one database sequence. A row keeps a single entry: a new write inserts
+a fresh entry and drops the row's older one, and a delete leaves a
+tombstone. ``/api/sync/?since=<token>`` reads the entries above the token
+off the primary key, so a sync costs in proportion to the rows changed since
+the token, not to the size of the collections, and the token it hands back
+is the highest id it returned.
+
+Ids are allocated when a write happens but become visible when its
+transaction commits, so a lower id can appear after a higher one has been
+read. The feed therefore only hands out entries recorded at least
+``OCTOFIT_SYNC_LAG`` seconds ago, and stops at the first younger one.
+Guarantee: a client that follows the tokens sees every change whose
+transaction committed within ``OCTOFIT_SYNC_LAG`` seconds of the write (and
+whose writer's clock is within that of the server's). Changes from longer
+transactions can be skipped.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from itertools import takewhile
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Activity, Change, Team, User, Workout
+from .serializers import ActivitySerializer, TeamSerializer, UserSerializer, WorkoutSerializer
+
+# Collection name -> (model, serializer for upserted rows)
+COLLECTIONS = {
+    'activities': (Activity, ActivitySerializer),
+    'users': (User, UserSerializer),
+    'teams': (Team, TeamSerializer),
+    'workouts': (Workout, WorkoutSerializer),
+}
+COLLECTION_NAMES = {model: name for name, (model, _) in COLLECTIONS.items()}
+
+# (model, pk) -> deleted, for the writes held back by ``batched``.
+_pending = ContextVar('octofit_sync_pending', default=None)
+
+
+def record(model, pks, deleted=False):
+    """Record a write (or with ``deleted``, a delete) of the ``model`` rows ``pks``."""
+    collection = COLLECTION_NAMES.get(model)
+    pks = [pk for pk in pks if pk is not None]
+    if collection is None or not pks:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        for pk in pks:
+            pending[model, pk] = deleted
+        return
+    changes = [Change(collection=collection, object_id=pk, deleted=deleted) for pk in pks]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Change.objects.bulk_create(changes)
+        else:
+            for change in changes:
+                change.save()
+        # Inserting first keeps the newest id in place, so it is never reissued.
+        Change.objects.filter(collection=collection, object_id__in=pks,
+                              id__lt=min(change.id for change in changes)).delete()
+
+
+@contextmanager
+def batched():
+    """
+    Hold the changes recorded inside the block and write them together when
+    it exits without an error, one entry per row with its last state.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    groups = {}
+    for (model, pk), deleted in pending.items():
+        groups.setdefault((model, deleted), []).append(pk)
+    for (model, deleted), pks in groups.items():
+        record(model, pks, deleted)
+
+
+def changes_since(since, collections=None, limit=1000):
+    """
+    Up to ``limit`` settled changes after the token ``since``, grouped by
+    collection as ``{'updated': [...], 'deleted': [...]}``, with the token to
+    resume from and whether more settled changes are waiting.
+    """
+    names = list(collections or COLLECTIONS)
+    entries = Change.objects.filter(id__gt=since).order_by('id')
+    if collections:
+        entries = entries.filter(collection__in=names)
+    entries = entries.values_list('id', 'collection', 'object_id', 'deleted', 'recorded_at')[:limit + 1]
+    # Lower ids may still be uncommitted behind a recent entry.
+    settled_before = timezone.now() - timedelta(seconds=settings.OCTOFIT_SYNC_LAG)
+    entries = list(takewhile(lambda entry: entry[4] <= settled_before, entries))
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    result = {}
+    for name in names:
+        model, serializer_class = COLLECTIONS[name]
+        mine = [(object_id, deleted) for _, collection, object_id, deleted, _ in entries if collection == name]
+        rows = model.objects.in_bulk([object_id for object_id, deleted in mine if not deleted])
+        # A row deleted since the entry was read has a tombstone further on.
+        updated = [rows[object_id] for object_id, deleted in mine if object_id in rows]
+        result[name] = {
+            'updated': serializer_class(updated, many=True).data,
+            'deleted': [object_id for object_id, deleted in mine if deleted],
+        }
+    return {
+        'since': str(since),
+        'next': str(entries[-1][0] if entries else since),
+        'more': more,
+        'changes': result,
+    }
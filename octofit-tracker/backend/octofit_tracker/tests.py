@@ -1,9 +1,58 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.deletion import Collector
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
-from rest_framework import status
-from django.urls import reverse
-from .models import User, Team, Activity, Leaderboard, Workout
-from datetime import date
+from rest_framework import serializers, status
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from . import caching, ingest, leaderboard, metrics, profiling, rollups, stats, sync, upserts
+from .fastpath import FastListMixin, plain_fields
+from .middleware import MetricsMiddleware, ServerTimingMiddleware
+from .models import (
+    User, Team, Activity, BoardLock, Change, DailyPoints, IngestCheckpoint, Leaderboard, TeamStanding, UserStats,
+    Workout,
+)
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer, msgpack
+from .serializers import ActivitySerializer, TeamStandingSerializer, UserSerializer
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+import asyncio
+import contextlib
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def member(key, team=None):
+    """Return the id of the test user called ``key``, creating them on first use."""
+    user, _ = User.objects.get_or_create(
+        email=f'{key}@example.com', defaults={'name': key, 'password': 'pw', 'team': team})
+    return user.pk
 
 
 class UserModelTest(TestCase):
@@ -52,7 +101,7 @@ class ActivityModelTest(TestCase):
 
     def setUp(self):
         self.activity = Activity.objects.create(
-            user_id="user123",
+            user_id=member("user123"),
             activity_type="Running",
             duration=30,
             distance=5.0,
@@ -62,7 +111,7 @@ class ActivityModelTest(TestCase):
 
     def test_activity_creation(self):
         """Test that an activity can be created successfully."""
-        self.assertEqual(self.activity.user_id, "user123")
+        self.assertEqual(self.activity.user.name, "user123")
         self.assertEqual(self.activity.activity_type, "Running")
         self.assertEqual(self.activity.duration, 30)
         self.assertEqual(self.activity.distance, 5.0)
@@ -77,23 +126,24 @@ class LeaderboardModelTest(TestCase):
     """Test cases for Leaderboard model."""
 
     def setUp(self):
+        self.team = Team.objects.create(name="team456")
         self.leaderboard = Leaderboard.objects.create(
-            user_id="user123",
-            team_id="team456",
+            user_id=member("user123"),
+            team=self.team,
             total_points=1500,
             rank=1
         )
 
     def test_leaderboard_creation(self):
         """Test that a leaderboard entry can be created successfully."""
-        self.assertEqual(self.leaderboard.user_id, "user123")
-        self.assertEqual(self.leaderboard.team_id, "team456")
+        self.assertEqual(self.leaderboard.user.name, "user123")
+        self.assertEqual(self.leaderboard.team_id, self.team.pk)
         self.assertEqual(self.leaderboard.total_points, 1500)
         self.assertEqual(self.leaderboard.rank, 1)
 
     def test_leaderboard_str(self):
         """Test the string representation of a leaderboard entry."""
-        self.assertEqual(str(self.leaderboard), "Rank 1 - User user123")
+        self.assertEqual(str(self.leaderboard), f"Rank 1 - User {self.leaderboard.user_id}")
 
 
 class WorkoutModelTest(TestCase):
@@ -125,11 +175,12 @@ class UserAPITest(APITestCase):
 
     def setUp(self):
         self.client = APIClient()
+        self.team = Team.objects.create(name='team123')
         self.user_data = {
             'name': 'API Test User',
             'email': 'apitest@example.com',
             'password': 'testpassword',
-            'team_id': 'team123'
+            'team_id': self.team.pk
         }
 
     def test_create_user(self):
@@ -138,13 +189,14 @@ class UserAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(User.objects.count(), 1)
         self.assertEqual(User.objects.get().name, 'API Test User')
+        self.assertEqual(User.objects.get().team, self.team)
 
     def test_get_users_list(self):
         """Test retrieving list of users."""
         User.objects.create(**self.user_data)
         response = self.client.get(reverse('user-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
 
 class TeamAPITest(APITestCase):
@@ -176,7 +228,7 @@ class ActivityAPITest(APITestCase):
     def setUp(self):
         self.client = APIClient()
         self.activity_data = {
-            'user_id': 'user123',
+            'user_id': member('user123'),
             'activity_type': 'Swimming',
             'duration': 60,
             'distance': 2.0,
@@ -193,7 +245,7 @@ class ActivityAPITest(APITestCase):
     def test_get_activities_list(self):
         """Test retrieving list of activities."""
         Activity.objects.create(
-            user_id='user123',
+            user_id=member('user123'),
             activity_type='Swimming',
             duration=60,
             distance=2.0,
@@ -204,22 +256,339 @@ class ActivityAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class ActivityBulkAPITest(APITestCase):
+    """Test cases for the bulk activity ingestion endpoint."""
+
+    def payload(self, user='user123', calories=100, **overrides):
+        data = {
+            'user_id': member(user),
+            'activity_type': 'Running',
+            'duration': 30,
+            'distance': 5.0,
+            'calories': calories,
+            'date': str(date.today())
+        }
+        data.update(overrides)
+        return data
+
+    def test_bulk_create_json_array(self):
+        """Test that a JSON array is written in one batch."""
+        items = [self.payload(calories=100), self.payload('user456', calories=200)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Activity.objects.count(), 2)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "activities"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([r['data']['calories'] for r in response.data['results']], [100, 200])
+
+    def test_bulk_create_reports_errors_in_input_order(self):
+        """Test that invalid items are reported per item without blocking valid ones."""
+        items = [self.payload(), self.payload(calories='lots'), self.payload('user456')]
+        response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 400, 201])
+        self.assertIn('calories', response.data['results'][1]['errors'])
+        self.assertEqual(Activity.objects.count(), 2)
+
+    def test_bulk_create_ndjson(self):
+        """Test that newline-delimited JSON is accepted."""
+        body = '\n'.join(json.dumps(self.payload(calories=c)) for c in (10, 20, 30)) + '\n'
+        response = self.client.post(reverse('activity-bulk'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+
+    def test_bulk_create_updates_leaderboard(self):
+        """Test that bulk ingestion feeds the leaderboard like single creates."""
+        items = [self.payload('u1', 100), self.payload('u2', 50), self.payload('u1', 25)]
+        self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(
+            list(Leaderboard.objects.order_by('rank').values_list('user_id', 'total_points', 'rank')),
+            leaderboard.compute_standings()
+        )
+
+    def test_bulk_rejects_non_list_body(self):
+        """Test that a single object is rejected."""
+        response = self.client.post(reverse('activity-bulk'), self.payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityUpsertTest(APITestCase):
+    """Test cases for idempotent activity writes keyed by external_id."""
+
+    def setUp(self):
+        self.user_id = member('upsert')
+
+    def payload(self, external_id, **fields):
+        return dict({'user_id': self.user_id, 'activity_type': 'Running', 'duration': 30, 'calories': 200,
+                     'date': date.today().isoformat(), 'external_id': external_id}, **fields)
+
+    def points(self):
+        return Leaderboard.objects.get(user_id=self.user_id).total_points
+
+    def test_retry_is_a_no_op(self):
+        """Test that posting the same keyed activity twice stores it once and writes nothing the second time."""
+        first = self.client.post(reverse('activity-list'), self.payload('watch-1'), format='json')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.post(reverse('activity-list'), self.payload('watch-1'), format='json')
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['id'], first.data['id'])
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(self.points(), 200)
+        writes = [query for query in queries if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(writes, [])
+
+    def test_changed_retry_updates_in_place(self):
+        """Test that a keyed write with new values updates the row and the derived data."""
+        first = self.client.post(reverse('activity-list'), self.payload('watch-1'), format='json')
+        response = self.client.post(reverse('activity-list'), self.payload('watch-1', calories=350), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], first.data['id'])
+        self.assertEqual(Activity.objects.get().calories, 350)
+        self.assertEqual(self.points(), 350)
+
+    def test_keys_are_per_user_and_optional(self):
+        """Test that the same key under another user, and unkeyed activities, are always new rows."""
+        other = member('upsert-other')
+        for payload in (self.payload('watch-1'), self.payload('watch-1', user_id=other),
+                        self.payload(None), self.payload(None)):
+            response = self.client.post(reverse('activity-list'), payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, payload)
+        self.assertEqual(Activity.objects.count(), 4)
+        response = self.client.post(reverse('activity-list'), self.payload(''), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_upserts(self):
+        """Test that a bulk retry matches stored and repeated keys and inserts only new ones."""
+        self.client.post(reverse('activity-list'), self.payload('a'), format='json')
+        items = [self.payload('a'), self.payload('b'), self.payload('b', calories=300), self.payload(None)]
+        response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 201, 200, 201])
+        self.assertEqual(response.data['results'][1]['data']['id'], response.data['results'][2]['data']['id'])
+        self.assertEqual(Activity.objects.count(), 3)
+        self.assertEqual(Activity.objects.get(external_id='b').calories, 300)
+        self.assertEqual(self.points(), 700)
+        response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 200, 200, 201])
+        self.assertEqual(Activity.objects.count(), 4)
+
+    def test_update_cannot_take_another_key(self):
+        """Test that editing an activity onto a key the user already has is a 400."""
+        self.client.post(reverse('activity-list'), self.payload('a'), format='json')
+        other = self.client.post(reverse('activity-list'), self.payload('b'), format='json').data['id']
+        response = self.client.patch(reverse('activity-detail', args=[other]), {'external_id': 'a'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('external_id', response.data)
+
+    def test_lost_race_matches_the_winner(self):
+        """Test that a key inserted by another request after the lookup is matched on the retry."""
+        winner = Activity.objects.create(user_id=self.user_id, activity_type='Running', duration=30, calories=200,
+                                         date=date.today(), external_id='raced')
+        lookup, lookups = Activity.objects.filter, []
+
+        def before_the_winner_committed(*args, **kwargs):
+            if 'external_id__in' in kwargs:
+                lookups.append(kwargs)
+                if len(lookups) == 1:
+                    return lookup(pk=None)
+            return lookup(*args, **kwargs)
+
+        with mock.patch.object(Activity.objects, 'filter', side_effect=before_the_winner_committed):
+            response = self.client.post(reverse('activity-list'), self.payload('raced'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], winner.pk)
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(Activity.objects.filter(external_id='raced').count(), 1)
+        self.assertEqual(self.points(), 200)
+
+    def test_queued_duplicates_apply_once(self):
+        """Test that a keyed activity queued twice is written once by the ingestion worker."""
+        path = os.path.join(tempfile.mkdtemp(), 'queue.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with override_settings(OCTOFIT_INGEST_QUEUE=path):
+            for _ in range(2):
+                response = self.client.post(reverse('activity-list'), self.payload('queued'), format='json')
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            ingest.apply_batch(ingest.get_queue(), 10)
+        self.assertEqual(Activity.objects.filter(external_id='queued').count(), 1)
+        self.assertEqual(self.points(), 200)
+
+    def test_bulk_retry_records_and_bumps_once(self):
+        """Test that a bulk write updating many rows records the sync feed and bumps each cache once."""
+        items = [self.payload(f'watch-{i}') for i in range(20)]
+        self.client.post(reverse('activity-bulk'), items, format='json')
+        changed = [dict(item, calories=300) for item in items]
+        with mock.patch.object(caching, 'bump', wraps=caching.bump) as bumps, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('activity-bulk'), changed, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual({result['status'] for result in response.data['results']}, {200})
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "changes"')]
+        self.assertEqual(len(inserts), 1)
+        bumped = [call.args[0] for call in bumps.call_args_list]
+        self.assertEqual(len(bumped), len(set(bumped)))
+        self.assertIn(caching.model_key(Activity), bumped)
+        self.assertEqual(self.points(), 20 * 300)
+
+    def test_backends_without_partial_indexes_fail_the_checks(self):
+        """Test that the system checks reject a database that cannot create the partial key index."""
+        self.assertEqual(upserts.check_key_index(), [])
+        with mock.patch.object(connection.features, 'supports_partial_indexes', False):
+            errors = upserts.check_key_index()
+        self.assertEqual([error.id for error in errors], ['octofit_tracker.E001'])
+
+
+class ConcurrentUpsertTest(TransactionTestCase):
+    """Test cases for keyed activity writes racing each other."""
+
+    def setUp(self):
+        self.user_id = member('racer')
+        self.payload = {'user_id': self.user_id, 'activity_type': 'Running', 'duration': 30, 'calories': 200,
+                        'date': date.today().isoformat(), 'external_id': 'watch-9'}
+
+    def post_in_parallel(self, count, turn=None):
+        """POST the payload from ``count`` threads at once and return the statuses."""
+        barrier = threading.Barrier(count)
+        statuses = []
+
+        def post():
+            try:
+                barrier.wait()
+                with turn or contextlib.nullcontext():
+                    statuses.append(APIClient().post(reverse('activity-list'), self.payload, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def assertStoredOnce(self, statuses):
+        self.assertEqual(sorted(statuses), [200] * (len(statuses) - 1) + [201])
+        self.assertEqual(Activity.objects.filter(external_id='watch-9').count(), 1)
+        self.assertEqual(Leaderboard.objects.get(user_id=self.user_id).total_points, 200)
+
+    def test_retries_that_all_missed_the_lookup_store_one_row(self):
+        """Test that parallel retries which all looked the key up before any committed leave exactly one row."""
+        # SQLite takes one writer at a time, so the requests take turns at the
+        # database; every one of them still misses the key on its first lookup,
+        # as if they had all read before the first insert committed.
+        lookup, missed = Activity.objects.filter, threading.local()
+
+        def stale_first_lookup(*args, **kwargs):
+            if 'external_id__in' in kwargs and not getattr(missed, 'once', False):
+                missed.once = True
+                return lookup(pk=None)
+            return lookup(*args, **kwargs)
+
+        with mock.patch.object(Activity.objects, 'filter', side_effect=stale_first_lookup), \
+                mock.patch.object(upserts, '_upsert', wraps=upserts._upsert) as attempts:
+            statuses = self.post_in_parallel(8, turn=threading.Lock())
+        self.assertStoredOnce(statuses)
+        # Every request but the first hit the unique index and matched on its retry.
+        self.assertEqual(attempts.call_count, 8 + 7)
+
+    @skipUnless(connection.vendor != 'sqlite', 'SQLite fails concurrent writers with "database is locked"')
+    def test_simultaneous_retries_store_one_row(self):
+        """Test that truly simultaneous posts of one keyed activity leave exactly one row."""
+        self.assertStoredOnce(self.post_in_parallel(8))
+
+
+class ActivityExportAPITest(APITestCase):
+    """Test cases for the streaming activity export."""
+
+    def setUp(self):
+        today = date.today()
+        Activity.objects.bulk_create([
+            Activity(
+                user_id=member(f'user{i}'),
+                activity_type='Running' if i % 2 else 'Yoga',
+                duration=30 + i,
+                distance=5.0 if i % 2 else None,
+                calories=100 * i,
+                date=today - timedelta(days=i)
+            )
+            for i in range(5)
+        ])
+        self.url = reverse('activity-export')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_streams_ndjson_by_default(self):
+        """Test that the export streams one JSON object per activity."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['date'], str(date.today() - timedelta(days=4)))
+        self.assertEqual(set(rows[0]), {'id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date',
+                                        'created_at', 'external_id'})
+
+    def test_export_matches_serializer_output(self):
+        """Test that exported rows match what the list endpoint returns."""
+        listed = {row['id']: dict(row) for row in self.client.get(reverse('activity-list')).data['results']}
+        exported = [json.loads(line) for line in self.content(self.client.get(self.url)).splitlines()]
+        for row in exported:
+            self.assertEqual(row, json.loads(json.dumps(listed[row['id']])))
+
+    def test_export_csv(self):
+        """Test that ?format=csv streams a header and one line per activity."""
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], 'id,user_id,activity_type,duration,distance,calories,date,created_at,external_id')
+        self.assertEqual(len(lines), 6)
+
+    def test_export_since(self):
+        """Test that ?since= keeps only activities on or after the date."""
+        since = date.today() - timedelta(days=1)
+        response = self.client.get(self.url, {'since': str(since)})
+        self.assertEqual(len(self.content(response).splitlines()), 2)
+
+    def test_export_rejects_invalid_since(self):
+        """Test that an unparseable date is a 400."""
+        response = self.client.get(self.url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_defers_query_until_streamed(self):
+        """Test that no rows are fetched before the body is consumed."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(len(self.content(response).splitlines()), 5)
+
+
 class LeaderboardAPITest(APITestCase):
     """Test cases for Leaderboard API endpoints."""
 
     def setUp(self):
         self.client = APIClient()
         self.leaderboard_data = {
-            'user_id': 'user123',
-            'team_id': 'team456',
+            'user_id': member('user123'),
+            'team_id': Team.objects.create(name='team456').pk,
             'total_points': 2000,
             'rank': 1
         }
 
-    def test_create_leaderboard_entry(self):
-        """Test creating a leaderboard entry via API."""
+    def test_leaderboard_is_read_only(self):
+        """Test that leaderboard entries cannot be created, edited or deleted via API."""
         response = self.client.post(reverse('leaderboard-list'), self.leaderboard_data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        entry = Leaderboard.objects.create(**dict(self.leaderboard_data, total_points=100))
+        url = reverse('leaderboard-detail', args=[entry.pk])
+        for method in (self.client.put, self.client.patch, self.client.delete):
+            response = method(url, {'total_points': 2000, 'rank': 1}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        entry.refresh_from_db()
+        self.assertEqual((entry.total_points, entry.rank), (100, 1))
 
     def test_get_leaderboard_list(self):
         """Test retrieving leaderboard."""
@@ -254,6 +623,2033 @@ class WorkoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class LeaderboardEngineTest(TestCase):
+    """Test cases for the incrementally maintained leaderboard."""
+
+    def setUp(self):
+        for key in ('u1', 'u2', 'u3'):
+            member(key)
+
+    def board(self):
+        return list(Leaderboard.objects.order_by('rank').values_list('user__name', 'total_points', 'rank'))
+
+    def assertMatchesRecompute(self):
+        self.assertEqual(list(Leaderboard.objects.order_by('rank').values_list('user_id', 'total_points', 'rank')),
+                         leaderboard.compute_standings())
+
+    def create_activity(self, user, calories):
+        return Activity.objects.create(
+            user_id=member(user),
+            activity_type='Running',
+            duration=30,
+            calories=calories,
+            date=date.today()
+        )
+
+    def test_create_activity_updates_board(self):
+        """Test that creating activities adds points and ranks users."""
+        self.create_activity('u1', 100)
+        self.create_activity('u2', 300)
+        self.create_activity('u1', 50)
+        self.assertEqual(self.board(), [('u2', 300, 1), ('u1', 150, 2)])
+
+    def test_ties_break_on_user_id(self):
+        """Test that equal totals are ordered by user id."""
+        self.create_activity('u2', 100)
+        self.create_activity('u1', 100)
+        self.assertEqual(self.board(), [('u1', 100, 1), ('u2', 100, 2)])
+
+    def test_update_and_delete_activity(self):
+        """Test that editing or deleting an activity moves the user back."""
+        activity = self.create_activity('u1', 500)
+        self.create_activity('u2', 200)
+        activity.calories = 100
+        activity.save()
+        self.assertEqual(self.board(), [('u2', 200, 1), ('u1', 100, 2)])
+        activity.user_id = member('u3')
+        activity.save()
+        self.assertEqual(self.board(), [('u2', 200, 1), ('u3', 100, 2), ('u1', 0, 3)])
+        activity.delete()
+        self.assertMatchesRecompute()
+
+    def test_api_create_updates_board(self):
+        """Test that posting an activity through the API updates the board."""
+        response = self.client.post(reverse('activity-list'), {
+            'user_id': member('u1'),
+            'activity_type': 'Cycling',
+            'duration': 45,
+            'calories': 400,
+            'date': str(date.today())
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.board(), [('u1', 400, 1)])
+
+    def test_failed_fan_out_rolls_back_the_write(self):
+        """Test that an API write whose derived-data update fails leaves the activity and board untouched."""
+        activity = self.create_activity('u1', 100)
+        url = reverse('activity-detail', args=[activity.pk])
+        with mock.patch.object(stats, 'record_activity_change', side_effect=RuntimeError('stats down')):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(url, {'calories': 500}, content_type='application/json')
+            with self.assertRaises(RuntimeError):
+                self.client.delete(url)
+        activity.refresh_from_db()
+        self.assertEqual(activity.calories, 100)
+        self.assertEqual(self.board(), [('u1', 100, 1)])
+        self.assertEqual(UserStats.objects.get(user_id=member('u1')).total_calories, 100)
+
+    def test_rank_changes_lock_the_board(self):
+        """Test that assigning and shifting ranks first takes the board's lock row."""
+        with mock.patch.object(leaderboard, 'lock_board', wraps=leaderboard.lock_board) as lock:
+            activity = self.create_activity('u1', 100)
+            activity.delete()
+        self.assertEqual(lock.call_args_list[0], mock.call(Leaderboard))
+        self.assertEqual(list(BoardLock.objects.values_list('board', flat=True)), ['leaderboard'])
+
+    def test_team_rank_changes_lock_the_team_board(self):
+        """Test that a new team standing takes the team board's lock before it is ranked."""
+        team = Team.objects.create(name='Locked', description='')
+        with mock.patch.object(leaderboard, 'lock_board', wraps=leaderboard.lock_board) as lock:
+            leaderboard.apply_team_change(team.pk, points=100, members=1)
+            leaderboard.rebuild_teams()
+        self.assertEqual(lock.call_args_list, [mock.call(TeamStanding)] * 2)
+        self.assertEqual(TeamStanding.objects.get(team=team).rank, 1)
+
+    def test_random_writes_match_full_recompute(self):
+        """Test that the incremental board always equals a full recompute."""
+        rng = random.Random(42)
+        users = [f'u{i}' for i in range(8)]
+        activities = []
+        for _ in range(150):
+            op = rng.random()
+            if op < 0.5 or not activities:
+                activities.append(self.create_activity(rng.choice(users), rng.randint(0, 50) * 10))
+            elif op < 0.8:
+                activity = rng.choice(activities)
+                activity.calories = rng.randint(0, 50) * 10
+                if rng.random() < 0.3:
+                    activity.user_id = member(rng.choice(users))
+                activity.save()
+            else:
+                activities.pop(rng.randrange(len(activities))).delete()
+            self.assertMatchesRecompute()
+
+    def test_rebuild_command_repairs_board(self):
+        """Test that the rebuild command restores a corrupted board."""
+        self.create_activity('u1', 100)
+        self.create_activity('u2', 200)
+        Leaderboard.objects.update(total_points=0, rank=0)
+        call_command('rebuild_leaderboard', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.board(), [('u2', 200, 1), ('u1', 100, 2)])
+
+
+class TeamStandingTest(APITestCase):
+    """Test cases for the materialized team standings."""
+
+    def setUp(self):
+        self.teams = {name: Team.objects.create(name=name) for name in ('t1', 't2', 't3')}
+        self.users = [
+            User.objects.create(name=f'User {i}', email=f'u{i}@example.com', password='pw',
+                                team=self.teams.get(team))
+            for i, team in enumerate(['t1', 't1', 't2', None])
+        ]
+
+    def standings(self, key='team__name'):
+        return list(TeamStanding.objects.order_by('rank').values_list(
+            key, 'total_points', 'member_count', 'rank'))
+
+    def log(self, user, calories):
+        return Activity.objects.create(
+            user=user, activity_type='Running', duration=30, calories=calories, date=date.today())
+
+    def test_points_and_members_roll_up(self):
+        """Test that team totals and averages follow member activity."""
+        self.log(self.users[0], 100)
+        self.log(self.users[1], 300)
+        self.log(self.users[2], 350)
+        self.assertEqual(self.standings(), [('t1', 400, 2, 1), ('t2', 350, 1, 2)])
+        self.assertEqual(TeamStanding.objects.get(team__name='t1').average_points, 200)
+
+    def test_team_change_moves_points(self):
+        """Test that switching a user's team moves their points and membership."""
+        self.log(self.users[0], 500)
+        self.log(self.users[2], 100)
+        user = self.users[0]
+        user.team = self.teams['t2']
+        user.save()
+        self.assertEqual(self.standings(), [('t2', 600, 2, 1), ('t1', 0, 1, 2)])
+        self.assertEqual(Leaderboard.objects.get(user=user).team.name, 't2')
+
+    def test_random_writes_match_full_recompute(self):
+        """Test that incremental team rollups always equal a full recompute."""
+        rng = random.Random(7)
+        activities = []
+        for _ in range(80):
+            op = rng.random()
+            if op < 0.6 or not activities:
+                activities.append(self.log(rng.choice(self.users), rng.randint(1, 40) * 10))
+            elif op < 0.8:
+                user = rng.choice(self.users)
+                user.team = self.teams.get(rng.choice(['t1', 't2', 't3', None]))
+                user.save()
+            else:
+                activities.pop(rng.randrange(len(activities))).delete()
+            self.assertEqual(self.standings('team_id'), leaderboard.compute_team_standings())
+
+    def test_team_leaderboard_endpoint(self):
+        """Test that /api/teams/leaderboard/ serves standings in rank order."""
+        self.log(self.users[2], 50)
+        self.log(self.users[0], 20)
+        response = self.client.get(reverse('team-leaderboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['team_name'] for row in response.data], ['t2', 't1'])
+        self.assertEqual(response.data[0]['team_id'], self.teams['t2'].pk)
+        self.assertEqual(response.data[0]['member_count'], 1)
+
+    def test_rebuild_restores_team_standings(self):
+        """Test that the rebuild command also repairs team standings."""
+        self.log(self.users[0], 100)
+        TeamStanding.objects.all().delete()
+        call_command('rebuild_leaderboard', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.standings(), [('t1', 100, 2, 1), ('t2', 0, 1, 2)])
+
+
+class WindowedLeaderboardTest(APITestCase):
+    """Test cases for time-windowed leaderboards built from daily buckets."""
+
+    as_of = date(2025, 3, 12)  # a Wednesday
+
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            member(f'u{i}')
+
+    def log(self, user, calories, days_ago):
+        return Activity.objects.create(
+            user_id=member(user), activity_type='Running', duration=30, calories=calories,
+            date=self.as_of - timedelta(days=days_ago))
+
+    def windowed(self, window):
+        response = self.client.get(reverse('leaderboard-list'), {'window': window, 'as_of': str(self.as_of)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['user_name'], row['total_points']) for row in response.data['results']]
+
+    def test_window_bounds(self):
+        """Test the start and end day of each window."""
+        self.assertEqual(rollups.window_bounds('day', self.as_of), (self.as_of, self.as_of))
+        self.assertEqual(rollups.window_bounds('week', self.as_of), (date(2025, 3, 10), self.as_of))
+        self.assertEqual(rollups.window_bounds('month', self.as_of), (date(2025, 3, 1), self.as_of))
+        self.assertEqual(rollups.window_bounds('rolling30', self.as_of), (date(2025, 2, 11), self.as_of))
+
+    def test_windows_sum_only_their_days(self):
+        """Test that each window counts only activities inside it."""
+        self.log('u1', 100, 0)
+        self.log('u2', 300, 5)
+        self.log('u1', 50, 20)
+        self.assertEqual(self.windowed('week'), [('u1', 100)])
+        self.assertEqual(self.windowed('month'), [('u2', 300), ('u1', 100)])
+        self.assertEqual(self.windowed('rolling30'), [('u2', 300), ('u1', 150)])
+
+    def test_invalid_window_is_rejected(self):
+        """Test that an unknown window is a 400."""
+        response = self.client.get(reverse('leaderboard-list'), {'window': 'decade'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_window_is_cached_until_a_write_lands_in_it(self):
+        """Test that cached windows survive unrelated writes and not related ones."""
+        self.log('u1', 100, 0)
+        self.windowed('week')
+        with self.assertNumQueries(0):
+            self.windowed('week')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log('u2', 500, 40)
+        with self.assertNumQueries(0):
+            self.windowed('week')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log('u2', 500, 1)
+        self.assertEqual(self.windowed('week'), [('u2', 500), ('u1', 100)])
+
+    def test_random_writes_match_raw_aggregation(self):
+        """Test that bucket-based windows always equal a scan of raw activities."""
+        rng = random.Random(11)
+        activities = []
+        for _ in range(60):
+            op = rng.random()
+            if op < 0.6 or not activities:
+                activities.append(self.log(f'u{rng.randint(0, 4)}', rng.randint(0, 30) * 10, rng.randint(0, 40)))
+            elif op < 0.8:
+                activity = rng.choice(activities)
+                activity.date = self.as_of - timedelta(days=rng.randint(0, 40))
+                activity.calories = rng.randint(0, 30) * 10
+                activity.save()
+            else:
+                activities.pop(rng.randrange(len(activities))).delete()
+        for window in rollups.WINDOWS:
+            start, end = rollups.window_bounds(window, self.as_of)
+            self.assertEqual(rollups.window_standings(window, self.as_of), rollups.compute_window(start, end))
+        self.assertFalse(DailyPoints.objects.filter(activity_count__lte=0).exists())
+
+    def test_bulk_create_feeds_buckets(self):
+        """Test that bulk ingestion updates the daily buckets."""
+        items = [
+            {'user_id': member('u1'), 'activity_type': 'Yoga', 'duration': 30, 'calories': c,
+             'date': str(self.as_of)}
+            for c in (10, 20)
+        ]
+        self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(self.windowed('day'), [('u1', 30)])
+
+
+class RankWindowTest(APITestCase):
+    """Test cases for the top-k and around-me leaderboard queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [member(f'r{i:02}') for i in range(30)]
+        Activity.objects.bulk_create([
+            Activity(user_id=user_id, activity_type='Running', duration=30, calories=(i * 37) % 30 * 10 + 5,
+                     date=date.today())
+            for i, user_id in enumerate(self.users)
+        ])
+        leaderboard.rebuild()
+        self.board = list(Leaderboard.objects.order_by('rank').values_list('user_id', flat=True))
+
+    def user_ids(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [row['user_id'] for row in response.data]
+
+    def test_top_k(self):
+        """Test that top returns the k best entries in rank order."""
+        self.assertEqual(self.user_ids(reverse('leaderboard-top')), self.board[:10])
+        self.assertEqual(self.user_ids(reverse('leaderboard-top'), {'k': 3}), self.board[:3])
+        self.assertEqual(self.user_ids(reverse('leaderboard-top'), {'k': 100}), self.board)
+
+    def test_around_user(self):
+        """Test that around returns the neighbours of a user's rank, clipped at both ends."""
+        for position, radius in ((14, 5), (0, 5), (29, 3), (2, 0)):
+            url = reverse('leaderboard-around', args=[self.board[position]])
+            expected = self.board[max(position - radius, 0):position + radius + 1]
+            self.assertEqual(self.user_ids(url, {'radius': radius}), expected, (position, radius))
+
+    def test_invalid_requests(self):
+        """Test that out-of-range parameters are 400s and unranked users are 404s."""
+        for params in ({'k': 0}, {'k': 101}, {'k': 'ten'}):
+            response = self.client.get(reverse('leaderboard-top'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn('k', response.data)
+        response = self.client.get(reverse('leaderboard-around', args=[self.board[0]]), {'radius': 51})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('leaderboard-around', args=[member('nobody')]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_cost_does_not_depend_on_board_size(self):
+        """Test that top and around each cost a fixed number of queries."""
+        with self.assertNumQueries(1):
+            self.client.get(reverse('leaderboard-top'), {'k': 5})
+        with self.assertNumQueries(2):
+            self.client.get(reverse('leaderboard-around', args=[self.board[10]]))
+
+    def test_writes_move_the_window(self):
+        """Test that a cached window reflects the next activity write."""
+        last = self.board[-1]
+        self.client.get(reverse('leaderboard-top'), {'k': 1})
+        Activity.objects.create(user_id=last, activity_type='Yoga', duration=10, calories=10000, date=date.today())
+        self.assertEqual(self.user_ids(reverse('leaderboard-top'), {'k': 1}), [last])
+        self.assertEqual(self.user_ids(reverse('leaderboard-around', args=[last]), {'radius': 1}),
+                         [last, self.board[0]])
+
+
+class UserStatsTest(APITestCase):
+    """Test cases for the incrementally maintained per-user stats."""
+
+    as_of = date(2025, 3, 12)
+
+    def setUp(self):
+        self.user = User.objects.create(name='Stats User', email='stats@example.com', password='pw')
+        self.user_id = self.user.pk
+
+    def log(self, days_ago, activity_type='Running', calories=100, duration=30, distance=5.0):
+        return Activity.objects.create(
+            user_id=self.user_id, activity_type=activity_type, duration=duration,
+            distance=distance, calories=calories, date=self.as_of - timedelta(days=days_ago))
+
+    def stats(self):
+        response = self.client.get(reverse('user-stats', args=[self.user.pk]), {'as_of': str(self.as_of)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def assertMatchesRaw(self):
+        self.assertEqual(stats.summary_for(self.user_id, self.as_of), stats.compute_summary(self.user_id, self.as_of))
+
+    def test_totals_and_breakdown(self):
+        """Test totals and the per-type breakdown."""
+        self.log(0, 'Running', calories=300, duration=30, distance=5.0)
+        self.log(1, 'Yoga', calories=100, duration=60, distance=None)
+        data = self.stats()
+        self.assertEqual(data['activity_count'], 2)
+        self.assertEqual(data['total_calories'], 400)
+        self.assertEqual(data['total_duration'], 90)
+        self.assertEqual(data['by_type']['Yoga'], {'activities': 1, 'duration': 60, 'distance': 0, 'calories': 100})
+        self.assertEqual(len(data['weekly']), stats.TREND_WEEKS)
+        self.assertEqual(data['weekly'][-1]['calories'], 400)
+
+    def test_streak(self):
+        """Test that the streak counts consecutive days up to today or yesterday."""
+        for days_ago in (1, 2, 3, 5):
+            self.log(days_ago)
+        self.assertEqual(self.stats()['current_streak'], 3)
+        self.log(4)
+        self.assertEqual(self.stats()['current_streak'], 5)
+        Activity.objects.filter(date=self.as_of - timedelta(days=2)).delete()
+        self.assertEqual(self.stats()['current_streak'], 1)
+
+    def test_streak_lapses_after_a_missed_day(self):
+        """Test that the streak reads as zero once a full day has been missed."""
+        self.log(2)
+        self.assertEqual(self.stats()['current_streak'], 0)
+
+    def test_unknown_user_is_404(self):
+        """Test that stats for a missing user return 404."""
+        response = self.client.get(reverse('user-stats', args=[9999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_stats_read_is_constant_time(self):
+        """Test that serving stats costs the same queries however long the history is."""
+        for days_ago in range(40):
+            self.log(days_ago)
+        with self.assertNumQueries(2):
+            self.stats()
+
+    def test_random_writes_match_raw_aggregation(self):
+        """Test that the summary always matches an aggregation of raw activities."""
+        rng = random.Random(5)
+        activities = []
+        for _ in range(80):
+            op = rng.random()
+            if op < 0.55 or not activities:
+                activities.append(self.log(rng.randint(0, 20), rng.choice(['Running', 'Yoga', 'Boxing']),
+                                           calories=rng.randint(1, 50) * 10, duration=rng.randint(10, 90),
+                                           distance=rng.choice([None, 2.5, 5.0])))
+            elif op < 0.8:
+                activity = rng.choice(activities)
+                activity.date = self.as_of - timedelta(days=rng.randint(0, 20))
+                activity.activity_type = rng.choice(['Running', 'Yoga', 'Boxing'])
+                activity.save()
+            else:
+                activities.pop(rng.randrange(len(activities))).delete()
+            self.assertMatchesRaw()
+
+    def test_bulk_create_and_rebuild(self):
+        """Test that bulk ingestion and the rebuild command agree with raw aggregation."""
+        items = [
+            {'user_id': self.user_id, 'activity_type': 'Cycling', 'duration': 20, 'calories': 50,
+             'date': str(self.as_of - timedelta(days=offset))}
+            for offset in (3, 0, 1, 2)
+        ]
+        self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertMatchesRaw()
+        self.assertEqual(self.stats()['current_streak'], 4)
+        UserStats.objects.all().delete()
+        call_command('rebuild_leaderboard', stdout=StringIO(), stderr=StringIO())
+        self.assertMatchesRaw()
+
+    def test_rebuild_reads_one_aggregate_for_every_user(self):
+        """Test that the rebuild's queries do not grow with the number of users."""
+        rng = random.Random(9)
+        user_ids = [member(f'rebuild{i}') for i in range(6)]
+        Activity.objects.bulk_create([
+            Activity(user_id=rng.choice(user_ids), activity_type=rng.choice(['Running', 'Yoga']),
+                     duration=rng.randint(10, 90), distance=rng.choice([None, 2.5]), calories=rng.randint(1, 50),
+                     date=self.as_of - timedelta(days=rng.randint(0, 10)))
+            for _ in range(60)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            stats.rebuild(batch_size=4)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 2)
+        for user_id in user_ids:
+            self.assertEqual(stats.summary_for(user_id, self.as_of), stats.compute_summary(user_id, self.as_of))
+
+
+class ResponseCacheTest(APITestCase):
+    """Test cases for the versioned response cache."""
+
+    def setUp(self):
+        cache.clear()
+        caching.counters.reset()
+        self.workout = Workout.objects.create(
+            name='Evening Yoga', description='Relaxing yoga session', difficulty='beginner',
+            duration=30, category='Flexibility')
+
+    def test_second_read_is_served_from_cache(self):
+        """Test that a repeated read hits the cache without touching the database."""
+        first = self.client.get(reverse('workout-list'))
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('workout-list'))
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(caching.counters.snapshot(), {'hits': 1, 'misses': 1})
+
+    def test_writes_invalidate_cached_lists_and_details(self):
+        """Test that create, update and delete are visible on the next read."""
+        detail = reverse('workout-detail', args=[self.workout.pk])
+        self.client.get(reverse('workout-list'))
+        self.client.get(detail)
+        self.client.patch(detail, {'duration': 45}, format='json')
+        self.assertEqual(self.client.get(detail).data['duration'], 45)
+        self.client.post(reverse('workout-list'), {
+            'name': 'Core', 'description': 'Planks', 'difficulty': 'beginner', 'duration': 20, 'category': 'Core'
+        }, format='json')
+        self.assertEqual(len(self.client.get(reverse('workout-list')).data), 2)
+        self.client.delete(detail)
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unrelated_writes_keep_entries(self):
+        """Test that writing one model does not evict another model's responses."""
+        self.client.get(reverse('workout-list'))
+        Team.objects.create(name='Team', description='')
+        self.assertEqual(self.client.get(reverse('workout-list'))['X-Cache'], 'HIT')
+
+    def test_activity_writes_refresh_cached_boards(self):
+        """Test that derived boards are refreshed when an activity lands."""
+        user = User.objects.create(name='A', email='a@example.com', password='pw',
+                                   team=Team.objects.create(name='t1'))
+        self.client.get(reverse('leaderboard-list'))
+        self.client.get(reverse('team-leaderboard'))
+        Activity.objects.create(user=user, activity_type='Running', duration=30,
+                                calories=120, date=date.today())
+        self.assertEqual(self.client.get(reverse('leaderboard-list')).data[0]['total_points'], 120)
+        self.assertEqual(self.client.get(reverse('team-leaderboard')).data[0]['total_points'], 120)
+
+    def test_derived_tables_bump_once_per_rebuild(self):
+        """Test that rewriting a derived table bumps its version once rather than once per row."""
+        for day in range(5):
+            DailyPoints.objects.create(user_id=member('u1'), day=date.today() - timedelta(days=day), points=10)
+        self.assertTrue(Collector(using='default').can_fast_delete(DailyPoints.objects.all()))
+        with mock.patch.object(caching, 'bump_model', wraps=caching.bump_model) as bumps, \
+                CaptureQueriesContext(connection) as queries:
+            rollups.rebuild()
+        self.assertEqual(bumps.call_args_list, [mock.call(DailyPoints)])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+
+    def test_file_backend_round_trip(self):
+        """Test that the optional file-based backend serves cached responses too."""
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+            with self.settings(CACHES=file_cache):
+                self.assertEqual(self.client.get(reverse('workout-list'))['X-Cache'], 'MISS')
+                self.assertEqual(self.client.get(reverse('workout-list'))['X-Cache'], 'HIT')
+
+    def test_writes_from_another_process_invalidate(self):
+        """Test that a version bumped by a separate process through a shared cache makes the view miss."""
+        script = (
+            'import django; django.setup()\n'
+            'from octofit_tracker import caching\n'
+            'from octofit_tracker.models import Workout\n'
+            'caching.bump_model(Workout)\n'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+            with self.settings(CACHES=file_cache):
+                self.client.get(reverse('workout-list'))
+                self.assertEqual(self.client.get(reverse('workout-list'))['X-Cache'], 'HIT')
+                subprocess.run([sys.executable, '-c', script], check=True, cwd=settings.BASE_DIR,
+                               env=dict(os.environ, OCTOFIT_CACHE_DIR=directory, OCTOFIT_CACHE_URL=''))
+                self.assertEqual(self.client.get(reverse('workout-list'))['X-Cache'], 'MISS')
+
+    def test_commands_warn_about_a_process_local_cache(self):
+        """Test that writing commands warn when other processes cannot see their invalidations."""
+        stderr = StringIO()
+        call_command('rebuild_leaderboard', stdout=StringIO(), stderr=stderr)
+        self.assertIn('OCTOFIT_CACHE_URL', stderr.getvalue())
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+            with self.settings(CACHES=file_cache):
+                stderr = StringIO()
+                call_command('rebuild_leaderboard', stdout=StringIO(), stderr=stderr)
+                self.assertEqual(stderr.getvalue(), '')
+
+
+class ConditionalGetTest(APITestCase):
+    """Test cases for ETag and Last-Modified on router endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(name='A', email='a@example.com', password='pw')
+        self.team = Team.objects.create(name='Team', description='')
+        self.activity = Activity.objects.create(
+            user=self.user, activity_type='Running', duration=30, calories=100, date=date.today())
+        self.workout = Workout.objects.create(
+            name='Core', description='Planks', difficulty='beginner', duration=20, category='Core')
+
+    def urls(self):
+        entry = Leaderboard.objects.get(user=self.user)
+        yield reverse('user-list'), reverse('user-detail', args=[self.user.pk])
+        yield reverse('team-list'), reverse('team-detail', args=[self.team.pk])
+        yield reverse('activity-list'), reverse('activity-detail', args=[self.activity.pk])
+        yield reverse('leaderboard-list'), reverse('leaderboard-detail', args=[entry.pk])
+        yield reverse('workout-list'), reverse('workout-detail', args=[self.workout.pk])
+
+    def later(self, seconds=2):
+        """Move the clock the validators are computed from ``seconds`` ahead."""
+        return mock.patch('octofit_tracker.caching.time.time', return_value=time.time() + seconds)
+
+    def test_deleting_a_team_refreshes_its_members(self):
+        """Test that user ETags stop matching once the members' team is cleared by deleting it."""
+        self.user.team = self.team
+        self.user.save()
+        urls = [reverse('user-list'), reverse('user-detail', args=[self.user.pk])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.team.delete()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        self.assertIsNone(response.data['team_id'])
+
+    def test_every_endpoint_answers_304_without_queries(self):
+        """Test that a matching If-None-Match gets a 304 with no database work."""
+        for urls in self.urls():
+            for url in urls:
+                with self.later():
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+                self.assertTrue(response['ETag'].startswith('"'), url)
+                self.assertIn('Last-Modified', response)
+                with self.assertNumQueries(0):
+                    again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED, url)
+                self.assertEqual(again.content, b'')
+
+    def test_if_modified_since(self):
+        """Test that If-Modified-Since at the Last-Modified time gets a 304."""
+        with self.later():
+            response = self.client.get(reverse('team-list'))
+            again = self.client.get(reverse('team-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_same_second_write_is_not_hidden_by_if_modified_since(self):
+        """Test that a write in the same second as a read never yields a stale 304."""
+        url = reverse('workout-detail', args=[self.workout.pk])
+        with mock.patch('octofit_tracker.caching.time.time') as clock:
+            clock.return_value = 2000000000.1
+            self.client.patch(url, {'duration': 25}, format='json')
+            clock.return_value = 2000000000.3
+            response = self.client.get(url)
+            self.assertNotIn('Last-Modified', response)
+            clock.return_value = 2000000000.6
+            self.client.patch(url, {'duration': 30}, format='json')
+            clock.return_value = 2000000000.9
+            since = http_date(2000000000)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['duration'], 30)
+            clock.return_value = 2000000001.5
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['Last-Modified'], since)
+
+    def test_write_changes_etag(self):
+        """Test that a write to the model produces a fresh 200 for old validators."""
+        etag = self.client.get(reverse('activity-list'))['ETag']
+        Activity.objects.create(user_id=member('u2'), activity_type='Yoga', duration=10, calories=10,
+                                date=date.today())
+        response = self.client.get(reverse('activity-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_with_query_and_format(self):
+        """Test that different pages and representations get different validators."""
+        base = self.client.get(reverse('activity-list'))['ETag']
+        paged = self.client.get(reverse('activity-list'), {'page_size': 1})['ETag']
+        browsable = self.client.get(reverse('activity-list'), HTTP_ACCEPT='text/html')['ETag']
+        self.assertEqual(len({base, paged, browsable}), 3)
+
+
+class KeysetPaginationTest(APITestCase):
+    """Test cases for cursor pagination on the activity and user lists."""
+
+    def setUp(self):
+        today = date.today()
+        Activity.objects.bulk_create([
+            Activity(
+                user_id=member(f'user{i % 3}'),
+                activity_type='Running',
+                duration=30,
+                calories=100,
+                date=today - timedelta(days=i % 4)
+            )
+            for i in range(25)
+        ])
+        self.expected = list(Activity.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+    def walk(self, url, key):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 7)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data[key]
+        return ids
+
+    def test_forward_pages_cover_every_row_once(self):
+        """Test that following next links visits each activity once, in order."""
+        ids = self.walk(reverse('activity-list') + '?page_size=7', 'next')
+        self.assertEqual(ids, self.expected)
+
+    def test_backward_pages_return_previous_rows(self):
+        """Test that the previous link returns the page before the current one."""
+        first = self.client.get(reverse('activity-list') + '?page_size=7')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual([row['id'] for row in back.data['results']], self.expected[:7])
+        self.assertIsNone(back.data['previous'])
+
+    def test_deep_pages_seek_without_offset(self):
+        """Test that later pages use a keyset predicate rather than OFFSET."""
+        url = self.client.get(reverse('activity-list') + '?page_size=7').data['next']
+        url = self.client.get(url).data['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a malformed cursor returns 404 instead of a server error."""
+        response = self.client.get(reverse('activity-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_users_paginate_by_created_at(self):
+        """Test that the user list pages in sign-up order."""
+        for i in range(5):
+            User.objects.create(name=f'User {i}', email=f'signup{i}@example.com', password='pw')
+        expected = list(User.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        ids = self.walk(reverse('user-list') + '?page_size=2', 'next')
+        self.assertEqual(ids, expected)
+
+
+class FastListTest(APITestCase):
+    """Test cases for the values()-based list path."""
+
+    def setUp(self):
+        cache.clear()
+        team = Team.objects.create(name='Team', description='Blue')
+        for i in range(5):
+            user = User.objects.create(name=f'User {i}', email=f'u{i}@example.com', password='secret', team=team)
+            Activity.objects.create(user=user, activity_type='Running', duration=30 + i,
+                                    distance=None if i == 2 else 5, calories=100 * i,
+                                    date=date.today() - timedelta(days=i))
+        Workout.objects.create(name='Core', description='Planks', difficulty='beginner', duration=20, category='Core')
+
+    def fetch_both(self, url):
+        cache.clear()
+        fast = self.client.get(url)
+        cache.clear()
+        with mock.patch.object(FastListMixin, 'fast_list', False):
+            slow = self.client.get(url)
+        return fast, slow
+
+    def test_output_is_byte_identical(self):
+        """Test that every list endpoint renders the same bytes with and without the fast path."""
+        for name in ('user', 'team', 'activity', 'leaderboard', 'workout'):
+            fast, slow = self.fetch_both(reverse(f'{name}-list'))
+            self.assertEqual(fast.status_code, status.HTTP_200_OK, name)
+            self.assertEqual(fast.content, slow.content, name)
+
+    def test_datetimes_follow_the_active_timezone(self):
+        """Test that timestamps match the serializer outside UTC too."""
+        with timezone.override('Europe/Paris'):
+            fast, slow = self.fetch_both(reverse('team-list'))
+        self.assertEqual(fast.content, slow.content)
+        self.assertIn(b'+0', fast.content)
+
+    def test_pages_are_byte_identical(self):
+        """Test that keyset pages and their cursors match the serializer path."""
+        url = reverse('activity-list') + '?page_size=2'
+        while url:
+            fast, slow = self.fetch_both(url)
+            self.assertEqual(fast.content, slow.content)
+            url = fast.data['next']
+
+    def test_password_is_not_exposed(self):
+        """Test that write-only fields stay out of fast-path output."""
+        self.assertEqual(list(plain_fields(UserSerializer())), ['id', 'name', 'email', 'team_id', 'created_at'])
+        response = self.client.get(reverse('user-list'))
+        self.assertNotIn(b'secret', response.content)
+        self.assertNotIn('password', response.data['results'][0])
+
+    def test_float_columns_render_as_floats(self):
+        """Test that whole-number distances still come out as floats."""
+        response = self.client.get(reverse('activity-list'))
+        self.assertIn(b'"distance":5.0', response.content)
+        self.assertIn(b'"distance":null', response.content)
+
+    def test_non_column_fields_fall_back(self):
+        """Test that a serializer with a computed field falls back to the normal path."""
+        self.assertIsNotNone(plain_fields(TeamStandingSerializer()))
+
+        class Computed(UserSerializer):
+            initials = serializers.SerializerMethodField()
+
+            class Meta(UserSerializer.Meta):
+                fields = UserSerializer.Meta.fields + ['initials']
+
+            def get_initials(self, user):
+                return user.name[:1]
+
+        self.assertIsNone(plain_fields(Computed()))
+
+    def test_uses_a_single_query(self):
+        """Test that an unpaginated list is served from one query."""
+        with self.assertNumQueries(1):
+            self.client.get(reverse('workout-list'))
+
+
+class SparseFieldsetTest(APITestCase):
+    """Test cases for ?fields= and ?exclude=."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(name='A', email='a@example.com', password='secret')
+        for i in range(3):
+            Activity.objects.create(user=self.user, activity_type='Running', duration=30, distance=5,
+                                    calories=100 + i, date=date.today() - timedelta(days=i))
+
+    def test_fields_trims_output_and_columns(self):
+        """Test that only the requested fields are rendered and selected."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('activity-list'), {'fields': 'id,activity_type,calories,date'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'activity_type', 'calories', 'date'])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"distance"', sql)
+        self.assertNotIn('"created_at"', sql)
+
+    def test_exclude(self):
+        """Test that excluded fields are dropped and the rest kept in order."""
+        response = self.client.get(reverse('user-list'), {'exclude': 'email,created_at'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'team_id'])
+
+    def test_retrieve_uses_only(self):
+        """Test that a detail read defers the unselected columns."""
+        activity = Activity.objects.first()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('activity-detail', args=[activity.pk]), {'fields': 'calories'})
+        self.assertEqual(response.data, {'calories': activity.calories})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"activity_type"', queries.captured_queries[0]['sql'])
+
+    def test_pagination_without_ordering_fields(self):
+        """Test that keyset pages still link onward when the ordering fields are not selected."""
+        response = self.client.get(reverse('activity-list'), {'fields': 'calories', 'page_size': 2})
+        self.assertEqual(response.data['results'], [{'calories': 100}, {'calories': 101}])
+        self.assertEqual(self.client.get(response.data['next']).data['results'], [{'calories': 102}])
+
+    def test_unknown_and_write_only_fields_are_rejected(self):
+        """Test that unknown fields and password are refused with a 400."""
+        for params in ({'fields': 'name,nickname'}, {'fields': 'password'}, {'exclude': 'password'}):
+            response = self.client.get(reverse('user-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertNotIn(b'secret', response.content)
+
+    def test_excluding_everything_is_rejected(self):
+        """Test that a selection with no fields left is refused."""
+        response = self.client.get(reverse('workout-list'), {
+            'exclude': 'id,name,description,difficulty,duration,category,created_at'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_honours_fields(self):
+        """Test that the export writes only the selected columns."""
+        response = self.client.get(reverse('activity-export'), {'format': 'csv', 'fields': 'date,calories'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'calories,date')
+
+    def test_writes_ignore_fields(self):
+        """Test that ?fields= does not affect create requests."""
+        response = self.client.post(reverse('user-list') + '?fields=name', {
+            'name': 'B', 'email': 'b@example.com', 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('email', response.data)
+        self.assertEqual(User.objects.get(name='B').password, 'pw')
+
+
+class RendererParserTest(APITestCase):
+    """Test cases for the orjson and MessagePack renderers and parsers."""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(3):
+            Activity.objects.create(user_id=member(f'u{i}'), activity_type='Run \u2028 \u00e9', duration=30,
+                                    distance=5.5 if i else None, calories=100 * i, date=date.today())
+
+    def test_orjson_matches_stock_renderer(self):
+        """Test that serializer output renders to the same bytes as DRF's JSONRenderer."""
+        data = ActivitySerializer(Activity.objects.all(), many=True).data
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertIn(b'\\u2028', ORJSONRenderer().render(data))
+
+    def test_orjson_native_and_fallback_types(self):
+        """Test that dates, decimals and lazy strings encode like the stock renderer."""
+        data = {'day': date(2024, 3, 1), 'amount': Decimal('1.5'), 'label': gettext_lazy('label')}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render({'at': datetime(2024, 3, 1, 8, 30, tzinfo=dt_timezone.utc)}),
+                         b'{"at":"2024-03-01T08:30:00Z"}')
+
+    def test_indent_uses_stock_renderer(self):
+        """Test that an indent= media type parameter still pretty prints."""
+        rendered = ORJSONRenderer().render({'a': 1}, 'application/json; indent=4')
+        self.assertEqual(rendered, b'{\n    "a": 1\n}')
+
+    def test_orjson_parser(self):
+        """Test that the parser reads JSON bodies and rejects invalid ones."""
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO(b'{"a": [1, 2.5, "\xc3\xa9"]}')), {'a': [1, 2.5, '\u00e9']})
+        for body in (b'{"a": NaN}', b'{"a": ', b'\xff'):
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+    def test_non_finite_distances_are_rejected(self):
+        """Test that NaN and infinite floats are refused on input, since orjson would render them as null."""
+        payload = {'user_id': member('u0'), 'activity_type': 'Running', 'duration': 30, 'calories': 100,
+                   'date': str(date.today())}
+        for distance in ('nan', 'inf', '-Infinity'):
+            response = self.client.post(reverse('activity-list'), dict(payload, distance=distance))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, distance)
+            self.assertEqual(response.data['distance'], ['A finite number is required.'])
+        # As MessagePack or bulk items would hand them over, already floats.
+        for distance in (float('nan'), float('inf')):
+            self.assertFalse(ActivitySerializer(data=dict(payload, distance=distance)).is_valid())
+        self.assertEqual(Activity.objects.count(), 3)
+
+    def test_api_accepts_json(self):
+        """Test that JSON requests go through the orjson parser."""
+        response = self.client.post(reverse('workout-list'), json.dumps({
+            'name': 'Core', 'description': 'Planks', 'difficulty': 'beginner', 'duration': 20, 'category': 'Core',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)['name'], 'Core')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        """Test that list responses and request bodies round-trip through MessagePack."""
+        as_json = self.client.get(reverse('activity-list')).json()
+        response = self.client.get(reverse('activity-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), as_json)
+
+        payload = {'user_id': member('u9'), 'activity_type': 'Yoga', 'duration': 15, 'distance': None,
+                   'calories': 40, 'date': str(date.today())}
+        response = self.client.post(reverse('activity-list'), msgpack.packb(payload),
+                                    content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = msgpack.unpackb(response.content)
+        self.assertEqual({key: created[key] for key in payload}, payload)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_parse_error(self):
+        """Test that a malformed MessagePack body is a 400."""
+        response = self.client.post(reverse('activity-list'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncReadPathTest(TransactionTestCase):
+    """Test cases for the async list and detail views."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(name='A', email='a@example.com', password='secret')
+        for i in range(3):
+            Activity.objects.create(user_id=member(f'u{i}'), activity_type='Running', duration=30, distance=5,
+                                    calories=100 * i, date=date.today() - timedelta(days=i))
+        Workout.objects.create(name='Core', description='Planks', difficulty='beginner', duration=20, category='Core')
+        self.async_client = AsyncClient()
+
+    def urls(self):
+        entry = Leaderboard.objects.first()
+        yield 'user', self.user.pk
+        yield 'team', None
+        yield 'activity', Activity.objects.first().pk
+        yield 'leaderboard', entry.pk
+        yield 'workout', Workout.objects.first().pk
+
+    async def fetch(self, path, accept='*/*', **headers):
+        return await self.async_client.get(path, accept=accept, **headers)
+
+    def test_matches_sync_responses(self):
+        """Test that async list and detail bodies equal the sync viewsets'."""
+        for name, pk in self.urls():
+            paths = [(reverse(f'async-{name}-list'), reverse(f'{name}-list'))]
+            if pk is not None:
+                paths.append((reverse(f'async-{name}-detail', args=[pk]), reverse(f'{name}-detail', args=[pk])))
+            for async_path, sync_path in paths:
+                with mock.patch('octofit_tracker.async_views._sync_view', side_effect=AssertionError(async_path)):
+                    response = async_to_sync(self.fetch)(async_path)
+                self.assertEqual(response.status_code, status.HTTP_200_OK, async_path)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.content, self.client.get(sync_path).content, async_path)
+
+    def test_query_parameters(self):
+        """Test that pagination and sparse fieldsets work on the async path."""
+        response = async_to_sync(self.fetch)(reverse('async-activity-list') + '?page_size=2&fields=calories')
+        data = json.loads(response.content)
+        self.assertEqual(data['results'], [{'calories': 0}, {'calories': 100}])
+        self.assertIn('/api/async/activities/', data['next'])
+        self.assertEqual(json.loads(async_to_sync(self.fetch)(data['next']).content)['results'], [{'calories': 200}])
+
+    def test_filters_and_ordering(self):
+        """Test that filters apply on the async path and bad ones are answered by the viewset."""
+        path = reverse('async-activity-list') + f'?ordering=date&user_id={member("u2")}'
+        response = async_to_sync(self.fetch)(path)
+        self.assertEqual([row['calories'] for row in json.loads(response.content)['results']], [200])
+        response = async_to_sync(self.fetch)(reverse('async-activity-list') + '?ordering=date')
+        self.assertEqual([row['calories'] for row in json.loads(response.content)['results']], [200, 100, 0])
+        response = async_to_sync(self.fetch)(reverse('async-activity-list') + '?ordering=calories')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_is_not_exposed(self):
+        """Test that the async user list leaves out write-only fields."""
+        response = async_to_sync(self.fetch)(reverse('async-user-list'))
+        self.assertNotIn(b'secret', response.content)
+
+    def test_falls_back_to_viewset(self):
+        """Test that errors, missing objects and other renderers are answered by the viewset."""
+        response = async_to_sync(self.fetch)(reverse('async-user-detail', args=[self.user.pk + 100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = async_to_sync(self.fetch)(reverse('async-user-detail', args=['abc']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = async_to_sync(self.fetch)(reverse('async-user-list') + '?fields=password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = async_to_sync(self.fetch)(reverse('async-leaderboard-list') + '?window=week')
+        self.assertEqual(json.loads(response.content)['window'], 'week')
+        response = async_to_sync(self.fetch)(reverse('async-workout-list'), accept='text/html')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+    def test_bad_cursor_is_a_404(self):
+        """Test that an invalid cursor gets the viewset's 404 rather than a server error."""
+        response = async_to_sync(self.fetch)(reverse('async-activity-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.content, self.client.get(reverse('activity-list') + '?cursor=garbage').content)
+
+    def test_validators_and_response_cache(self):
+        """Test that the async path answers 304s and serves cached responses like the viewsets."""
+        path = reverse('async-workout-list')
+        response = async_to_sync(self.fetch)(path)
+        with self.assertNumQueries(0):
+            again = async_to_sync(self.fetch)(path, **{'if-none-match': response['ETag']})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        path = reverse('async-leaderboard-list')
+        first = async_to_sync(self.fetch)(path)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = async_to_sync(self.fetch)(path)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+    @override_settings(OCTOFIT_SERVER_TIMING=True)
+    def test_queries_on_database_threads_are_measured(self):
+        """Test that Server-Timing and /metrics count the queries async views run on the thread pool."""
+        label = 'octofit_db_queries_total{view="AsyncReadView[ActivityViewSet].get"}'
+
+        def counted():
+            for line in self.client.get('/metrics').content.decode().splitlines():
+                if line.startswith(f'{label} '):
+                    return float(line.rsplit(' ', 1)[1])
+            return 0.0
+
+        before = counted()
+        response = async_to_sync(self.fetch)(reverse('async-activity-list'))
+        db = dict(param.split('=', 1) for param in response['Server-Timing'].split(', ')[0].split(';')[1:])
+        self.assertGreater(float(db['dur']), 0)
+        self.assertNotEqual(db['desc'], '"0 queries"')
+        self.assertGreaterEqual(counted() - before, 1)
+
+    def test_instrumentation_runs_in_either_mode(self):
+        """Test that the instrumentation middleware is async under ASGI and sync under WSGI."""
+        async def async_view(request):
+            return HttpResponse()
+
+        for middleware in (MetricsMiddleware, ServerTimingMiddleware):
+            self.assertTrue(asyncio.iscoroutinefunction(middleware(async_view)), middleware)
+            self.assertFalse(asyncio.iscoroutinefunction(middleware(lambda request: HttpResponse())), middleware)
+
+    def test_concurrent_requests(self):
+        """Test that many in-flight requests all complete correctly."""
+        async def burst():
+            return await asyncio.gather(*(self.fetch(reverse('async-activity-list')) for _ in range(20)))
+        expected = self.client.get(reverse('activity-list')).content
+        for response in async_to_sync(burst)():
+            self.assertEqual(response.content, expected)
+
+
+class IngestQueueTest(APITestCase):
+    """Test cases for write-behind activity ingestion."""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'ingest.sqlite3')
+        ingest._open.cache_clear()
+        self.addCleanup(ingest._open.cache_clear)
+        override = override_settings(OCTOFIT_INGEST_QUEUE=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.users = [member(f'q{i}') for i in range(3)]
+
+    def payload(self, i):
+        return {'user_id': self.users[i % 3], 'activity_type': 'Running', 'duration': 30,
+                'calories': 10 + i, 'date': str(date.today() - timedelta(days=i % 5))}
+
+    def accept(self, count):
+        response = self.client.post(reverse('activity-bulk'), [self.payload(i) for i in range(count)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return [result['ticket'] for result in response.data['results']]
+
+    def restart(self):
+        """Forget the open queue, as a new worker process would."""
+        ingest._open.cache_clear()
+        return ingest.get_queue()
+
+    def assertDerivedDataMatches(self):
+        self.assertEqual(list(Leaderboard.objects.order_by('rank').values_list('user_id', 'total_points', 'rank')),
+                         leaderboard.compute_standings())
+        buckets = DailyPoints.objects.order_by('user_id', 'day').values_list('user_id', 'day', 'points')
+        raw = Activity.objects.values('user_id', 'date').annotate(total=Sum('calories')).order_by('user_id', 'date')
+        self.assertEqual(list(buckets), [(row['user_id'], row['date'], row['total']) for row in raw])
+
+    def test_create_is_accepted_then_applied(self):
+        """Test that a POST is answered with 202 and written only by the worker."""
+        response = self.client.post(reverse('activity-list'), self.payload(0), format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['data']['user_id'], self.users[0])
+        self.assertFalse(Activity.objects.exists())
+        self.assertEqual(ingest.get_queue().depth(), 1)
+        self.assertEqual(ingest.apply_batch(ingest.get_queue(), 100), 1)
+        self.assertEqual(Activity.objects.get().calories, 10)
+        self.assertEqual(ingest.get_queue().depth(), 0)
+        self.assertDerivedDataMatches()
+
+    def test_bulk_reports_each_item(self):
+        """Test that bulk queues the valid items and rejects the rest."""
+        items = [self.payload(0), {'user_id': self.users[0]}]
+        response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in response.data['results']], [202, 400])
+        self.assertEqual(ingest.get_queue().depth(), 1)
+
+    def test_invalid_activity_is_rejected_up_front(self):
+        """Test that validation still happens in the request."""
+        response = self.client.post(reverse('activity-list'), {'user_id': 9999}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ingest.get_queue().depth(), 0)
+
+    def test_worker_group_commits(self):
+        """Test that the worker writes whole batches and drains the queue."""
+        self.accept(25)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ingest.apply_batch(ingest.get_queue(), 10), 10)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "activities"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Activity.objects.count(), 10)
+        output = StringIO()
+        call_command('ingest_worker', '--once', '--batch-size', '10', stdout=output, stderr=StringIO())
+        self.assertIn('Applied 15 queued activities', output.getvalue())
+        self.assertEqual(Activity.objects.count(), 25)
+        self.assertDerivedDataMatches()
+
+    def test_crash_before_commit_loses_nothing(self):
+        """Test that a worker dying mid-batch leaves every entry queued for the next one."""
+        tickets = self.accept(12)
+        with mock.patch('octofit_tracker.upserts.activities_bulk_created', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                ingest.apply_batch(ingest.get_queue(), 5)
+        self.assertFalse(Activity.objects.exists())
+        queue = self.restart()
+        self.assertEqual(queue.depth(), len(tickets))
+        while ingest.apply_batch(queue, 5):
+            pass
+        self.assertEqual(sorted(Activity.objects.values_list('calories', flat=True)), [10 + i for i in range(12)])
+        self.assertDerivedDataMatches()
+
+    def test_crash_after_commit_applies_once(self):
+        """Test that entries committed but not acknowledged are skipped after a restart."""
+        tickets = self.accept(8)
+        with mock.patch.object(ingest.IngestQueue, 'ack', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                ingest.apply_batch(ingest.get_queue(), 5)
+        self.assertEqual(Activity.objects.count(), 5)
+        queue = self.restart()
+        self.assertEqual(queue.depth(), 8)
+        while ingest.apply_batch(queue, 5):
+            pass
+        self.assertEqual(Activity.objects.count(), 8)
+        self.assertEqual(queue.depth(), 0)
+        self.assertEqual(IngestCheckpoint.objects.get().last_id, tickets[-1])
+        self.assertDerivedDataMatches()
+
+    def test_accepted_entries_survive_a_killed_process(self):
+        """Test that every ticket handed out before a SIGKILL is still in the queue file."""
+        script = (
+            'import django, sys; django.setup()\n'
+            'from octofit_tracker.ingest import IngestQueue\n'
+            'queue = IngestQueue(sys.argv[1])\n'
+            'while True:\n'
+            '    print(queue.put([\'{}\'])[0], flush=True)\n'
+        )
+        process = subprocess.Popen([sys.executable, '-c', script, self.path], stdout=subprocess.PIPE,
+                                   cwd=os.path.dirname(os.path.dirname(__file__)), text=True)
+        try:
+            tickets = [int(process.stdout.readline()) for _ in range(50)]
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
+        stored = {entry_id for entry_id, _, _ in self.restart().take(1000000)}
+        self.assertTrue(set(tickets) <= stored)
+
+    def test_deleted_users_are_dropped(self):
+        """Test that an activity whose user was deleted while queued is skipped."""
+        self.accept(3)
+        User.objects.filter(pk=self.users[1]).delete()
+        ingest.apply_batch(ingest.get_queue(), 10)
+        self.assertEqual(sorted(Activity.objects.values_list('user_id', flat=True)), [self.users[0], self.users[2]])
+        self.assertEqual(ingest.get_queue().depth(), 0)
+
+    def test_depth_and_lag_metrics(self):
+        """Test that /metrics reports the queue depth and the age of the oldest entry."""
+        self.accept(4)
+        time.sleep(0.05)
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('octofit_ingest_queue_depth 4\n', text)
+        lag = float(re.search(r'^octofit_ingest_queue_lag_seconds (\S+)$', text, re.M).group(1))
+        self.assertGreater(lag, 0.04)
+        ingest.apply_batch(ingest.get_queue(), 10)
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('octofit_ingest_queue_depth 0\n', text)
+        self.assertIn('octofit_ingest_queue_lag_seconds 0.0\n', text)
+
+
+@override_settings(OCTOFIT_SYNC_LAG=0)
+class SyncFeedTest(APITestCase):
+    """Test cases for the /api/sync/ change feed."""
+
+    def setUp(self):
+        self.team = Team.objects.create(name='Blue', description='')
+        self.users = [member(f's{i}', self.team) for i in range(3)]
+        self.activities = [
+            Activity.objects.create(user_id=user_id, activity_type='Running', duration=30, calories=100,
+                                    date=date.today())
+            for user_id in self.users
+        ]
+        self.workout = Workout.objects.create(name='Plank', description='', category='Core', difficulty='Easy',
+                                              duration=5)
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(reverse('sync'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def ids(self, data, collection):
+        return sorted(row['id'] for row in data['changes'][collection]['updated'])
+
+    def test_full_sync_from_zero(self):
+        """Test that syncing without a token returns every row of every collection."""
+        data = self.sync()
+        self.assertEqual(data['since'], '0')
+        self.assertFalse(data['more'])
+        self.assertEqual(self.ids(data, 'users'), self.users)
+        self.assertEqual(self.ids(data, 'activities'), [activity.pk for activity in self.activities])
+        self.assertEqual(self.ids(data, 'teams'), [self.team.pk])
+        self.assertEqual(self.ids(data, 'workouts'), [self.workout.pk])
+        self.assertNotIn('password', data['changes']['users']['updated'][0])
+
+    def test_batched_writes_keep_each_rows_last_state(self):
+        """Test that writes held back by a batch leave one entry per row, in its final state."""
+        token = self.sync()['next']
+        activity, pk = self.activities[0], self.activities[0].pk
+        with sync.batched():
+            activity.calories = 150
+            activity.save()
+            activity.delete()
+            Workout.objects.filter(pk=self.workout.pk).update(duration=10)
+            self.workout.save()
+            self.assertEqual(self.sync(token)['next'], token)
+        data = self.sync(token)
+        self.assertEqual(data['changes']['activities'], {'updated': [], 'deleted': [pk]})
+        self.assertEqual(self.ids(data, 'workouts'), [self.workout.pk])
+
+    def test_listed_in_root(self):
+        """Test that the site root links to the feed."""
+        self.assertIn('sync', self.client.get('/').data)
+
+    def test_pruning_replaced_entries_is_a_fast_delete(self):
+        """Test that replacing a row's feed entry deletes the old one without loading it."""
+        self.assertTrue(Collector(using='default').can_fast_delete(Change.objects.all()))
+        with CaptureQueriesContext(connection) as queries:
+            sync.record(Workout, [self.workout.pk])
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'changes' in query['sql']],
+                         ['INSERT', 'DELETE'])
+
+    def test_only_changes_after_the_token(self):
+        """Test that a sync returns just the rows written since the previous one."""
+        token = self.sync()['next']
+        self.assertEqual(self.sync(token)['next'], token)
+        activity = self.activities[1]
+        activity.duration = 45
+        activity.save()
+        created = Activity.objects.create(user_id=self.users[0], activity_type='Yoga', duration=10, calories=5,
+                                          date=date.today())
+        data = self.sync(token)
+        self.assertEqual(self.ids(data, 'activities'), [activity.pk, created.pk])
+        self.assertEqual(data['changes']['activities']['updated'][0]['duration'], 45)
+        self.assertEqual(data['changes']['users'], {'updated': [], 'deleted': []})
+        self.assertGreater(int(data['next']), int(token))
+
+    def test_deletes_leave_tombstones(self):
+        """Test that deleted rows, including cascaded ones, come back as tombstones."""
+        token = self.sync()['next']
+        deleted = [self.activities[0].pk, self.activities[1].pk]
+        self.activities[0].delete()
+        User.objects.filter(pk=self.users[1]).delete()
+        data = self.sync(token)
+        self.assertEqual(data['changes']['users']['deleted'], [self.users[1]])
+        self.assertEqual(sorted(data['changes']['activities']['deleted']), deleted)
+        self.assertEqual(data['changes']['activities']['updated'], [])
+
+    def test_team_delete_updates_members(self):
+        """Test that members of a deleted team are reported with their team cleared."""
+        token = self.sync()['next']
+        team_id = self.team.pk
+        self.team.delete()
+        data = self.sync(token)
+        self.assertEqual(data['changes']['teams']['deleted'], [team_id])
+        self.assertEqual(self.ids(data, 'users'), self.users)
+        self.assertEqual({row['team_id'] for row in data['changes']['users']['updated']}, {None})
+
+    def test_bulk_writes_are_recorded(self):
+        """Test that activities created through the bulk endpoint appear in the feed."""
+        token = self.sync()['next']
+        payload = [
+            {'user_id': self.users[2], 'activity_type': 'Cycling', 'duration': 20, 'calories': 50,
+             'date': date.today().isoformat()}
+            for _ in range(3)
+        ]
+        response = self.client.post(reverse('activity-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        data = self.sync(token)
+        self.assertEqual(len(data['changes']['activities']['updated']), 3)
+
+    def test_one_entry_per_row(self):
+        """Test that rewriting a row replaces its entry instead of growing the feed."""
+        before = Change.objects.count()
+        activity = self.activities[0]
+        for duration in range(10):
+            activity.duration = duration
+            activity.save()
+        self.assertEqual(Change.objects.count(), before)
+        self.assertEqual(Change.objects.filter(collection='activities', object_id=activity.pk).count(), 1)
+
+    def test_paging_walks_every_change(self):
+        """Test that following next while more is set visits every change exactly once."""
+        seen, token, pages = [], '0', 0
+        while True:
+            data = self.sync(token, limit=2)
+            pages += 1
+            for name, changes in data['changes'].items():
+                seen += [(name, row['id']) for row in changes['updated']]
+            token = data['next']
+            if not data['more']:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), Change.objects.count())
+        self.assertEqual(pages, -(-Change.objects.count() // 2))
+
+    def test_collections_filter(self):
+        """Test that collections narrows the feed to the named collections."""
+        data = self.sync(collections='users,workouts')
+        self.assertEqual(set(data['changes']), {'users', 'workouts'})
+        self.assertEqual(self.ids(data, 'users'), self.users)
+
+    def test_cost_depends_on_changes_not_dataset(self):
+        """Test that an incremental sync's queries and payload do not grow with the tables."""
+        def incremental():
+            token = self.sync()['next']
+            Activity.objects.create(user_id=self.users[0], activity_type='Yoga', duration=10, calories=5,
+                                    date=date.today())
+            with CaptureQueriesContext(connection) as queries:
+                data = self.sync(token)
+            return len(queries), len(JSONRenderer().render(data))
+
+        small_queries, small_size = incremental()
+        Activity.objects.bulk_create([
+            Activity(user_id=self.users[i % 3], activity_type='Running', duration=30, calories=10, date=date.today())
+            for i in range(300)
+        ])
+        large_queries, large_size = incremental()
+        self.assertEqual(large_queries, small_queries)
+        # Only the ids and the token get longer.
+        self.assertLess(large_size - small_size, 10)
+
+    def test_recent_changes_are_held_back(self):
+        """Test that the token never passes a change that a slower transaction could still commit below."""
+        token = self.sync()['next']
+        first = Activity.objects.create(user_id=self.users[0], activity_type='Yoga', duration=10, calories=5,
+                                        date=date.today())
+        second = Activity.objects.create(user_id=self.users[1], activity_type='Yoga', duration=10, calories=5,
+                                         date=date.today())
+        Change.objects.filter(collection='activities', object_id=first.pk).update(
+            recorded_at=timezone.now() - timedelta(seconds=60))
+        with self.settings(OCTOFIT_SYNC_LAG=30):
+            data = self.sync(token)
+            self.assertEqual(self.ids(data, 'activities'), [first.pk])
+            # Nothing past an unsettled entry is handed out, even if older.
+            third = Activity.objects.create(user_id=self.users[2], activity_type='Yoga', duration=10, calories=5,
+                                            date=date.today())
+            Change.objects.filter(collection='activities', object_id=third.pk).update(
+                recorded_at=timezone.now() - timedelta(seconds=60))
+            self.assertEqual(self.sync(data['next'])['next'], data['next'])
+        self.assertEqual(len(self.sync(data['next'])['changes']['activities']['updated']), 2)
+
+    def test_invalid_parameters(self):
+        """Test that a bad token, limit or collection name is a 400."""
+        for params in ({'since': '-1'}, {'since': 'abc'}, {'limit': 0}, {'collections': 'users,leaderboard'}):
+            response = self.client.get(reverse('sync'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn(next(iter(params)), response.data)
+
+
+class ServerTimingTest(APITestCase):
+    """Test cases for the Server-Timing middleware."""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(3):
+            Activity.objects.create(user_id=member(f'u{i}'), activity_type='Running', duration=30, calories=100,
+                                    date=date.today())
+
+    def timings(self, response):
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    @override_settings(OCTOFIT_SERVER_TIMING=True)
+    def test_header_breaks_down_request(self):
+        """Test that the header reports queries, db, serializer, render and total time."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('activity-list'))
+        metrics = self.timings(response)
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} queries"')
+        for name in ('db', 'serialize', 'render', 'total'):
+            self.assertGreaterEqual(float(metrics[name]['dur']), 0)
+        self.assertGreater(float(metrics['serialize']['dur']) + float(metrics['render']['dur']), 0)
+        self.assertLessEqual(float(metrics['db']['dur']), float(metrics['total']['dur']))
+
+    @override_settings(OCTOFIT_SERVER_TIMING=True)
+    def test_serializer_time_is_collected(self):
+        """Test that both the serializer and fast list paths report serializer time."""
+        activity = Activity.objects.first()
+        for url in (reverse('activity-detail', args=[activity.pk]), reverse('activity-list')):
+            self.assertGreater(float(self.timings(self.client.get(url))['serialize']['dur']), 0, url)
+
+    @override_settings(OCTOFIT_SERVER_TIMING=False)
+    def test_header_can_be_disabled(self):
+        """Test that no header is sent when OCTOFIT_SERVER_TIMING is off."""
+        self.assertNotIn('Server-Timing', self.client.get(reverse('activity-list')))
+
+    @override_settings(OCTOFIT_MAX_QUERIES=0)
+    def test_query_budget_is_logged(self):
+        """Test that requests over the query limit are logged."""
+        with self.assertLogs('octofit_tracker.performance', 'WARNING') as logs:
+            self.client.get(reverse('activity-list'))
+        self.assertIn('GET /api/activities/', logs.output[0])
+        self.assertIn('queries', logs.output[0])
+
+    @override_settings(OCTOFIT_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        """Test that requests over the time limit are logged."""
+        with self.assertLogs('octofit_tracker.performance', 'WARNING'):
+            self.client.get(reverse('workout-list'))
+
+    @override_settings(OCTOFIT_SLOW_REQUEST_MS=60000, OCTOFIT_MAX_QUERIES=50)
+    def test_requests_within_limits_are_not_logged(self):
+        """Test that nothing is logged for requests under both limits."""
+        with self.assertNoLogs('octofit_tracker.performance', 'WARNING'):
+            self.client.get(reverse('activity-list'))
+
+
+class MetricsTest(APITestCase):
+    """Test cases for the metrics registry and the /metrics endpoint."""
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_counters_sum_across_threads(self):
+        """Test that per-thread shards add up, including those of finished threads."""
+        registry = metrics.Registry()
+        counter = metrics.Counter('test_total', 'Test.', ('kind',), registry=registry)
+
+        def work():
+            for _ in range(1000):
+                counter.inc(('a',))
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(('b',), 5)
+        self.assertEqual(registry.snapshot(), {('test_total', ('a',)): 8000, ('test_total', ('b',)): 5})
+        self.assertEqual(len(registry._live), 1)
+
+    def test_histogram_exposition(self):
+        """Test that histograms render cumulative buckets, sum and count."""
+        registry = metrics.Registry()
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('view',), buckets=(0.1, 1), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('a"b',), value)
+        self.assertEqual(registry.exposition().splitlines(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1.0"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 3.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ])
+
+    def test_requests_are_labelled_by_viewset_and_action(self):
+        """Test that requests, errors, sizes and queries are recorded per viewset action."""
+        before = self.scrape()
+        self.client.get(reverse('activity-list'))
+        self.client.post(reverse('workout-list'), {}, format='json')
+        after = self.scrape()
+
+        def delta(name):
+            return after.get(name, 0) - before.get(name, 0)
+        self.assertEqual(delta('octofit_http_requests_total{view="ActivityViewSet.list",method="GET",status="200"}'), 1)
+        self.assertEqual(delta('octofit_http_errors_total{view="WorkoutViewSet.create",status="400"}'), 1)
+        self.assertEqual(delta('octofit_http_request_duration_seconds_count{view="ActivityViewSet.list"}'), 1)
+        self.assertEqual(delta('octofit_http_response_size_bytes_count{view="ActivityViewSet.list"}'), 1)
+        self.assertGreaterEqual(delta('octofit_db_queries_total{view="ActivityViewSet.list"}'), 1)
+        self.assertIn('octofit_http_requests_total{view="prometheus_metrics",method="GET",status="200"}', after)
+
+    def test_view_labels(self):
+        """Test that function views, viewsets and async views get readable labels."""
+        self.assertEqual(metrics.view_label(resolve('/').func, 'GET'), 'api_root.get')
+        self.assertEqual(metrics.view_label(resolve('/api/users/1/').func, 'PATCH'), 'UserViewSet.partial_update')
+        self.assertEqual(metrics.view_label(resolve('/api/async/users/').func, 'GET'), 'AsyncReadView[UserViewSet].get')
+
+
+class ProfilingTest(APITestCase):
+    """Test cases for on-demand request profiling."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        Activity.objects.create(user_id=member('u1'), activity_type='Running', duration=30, calories=100,
+                                date=date.today())
+
+    def test_profile_is_saved_under_handle(self):
+        """Test that a profiled request writes pstats and folded stacks named by its handle."""
+        with override_settings(OCTOFIT_PROFILE_DIR=self.directory):
+            client = APIClient()
+            for response in (client.get(reverse('activity-list'), HTTP_X_PROFILE='1'),
+                             client.get(reverse('activity-list'), {'profile': '1'})):
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                handle = response['X-Profile-Id']
+                profile = pstats.Stats(os.path.join(self.directory, f'{handle}.pstats'))
+                self.assertTrue(any(name == 'list' for _, _, name in profile.stats))
+                with open(os.path.join(self.directory, f'{handle}.collapsed')) as collapsed:
+                    lines = collapsed.read().splitlines()
+                self.assertTrue(lines)
+                self.assertTrue(all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines))
+                self.assertTrue(any('list (fastpath.py:' in line for line in lines))
+            self.assertNotIn('X-Profile-Id', client.get(reverse('activity-list')))
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_disabled_without_directory(self):
+        """Test that the middleware drops out of the chain when no directory is set."""
+        with override_settings(OCTOFIT_PROFILE_DIR=None), mock.patch('cProfile.Profile') as profile:
+            response = APIClient().get(reverse('activity-list'), {'profile': '1'}, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        profile.assert_not_called()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_collapsed_stacks_share_time_between_callers(self):
+        """Test that a function's time is split between the paths that call it."""
+        def leaf():
+            time.sleep(0.01)
+
+        # Several calls per caller, so one late wake-up cannot skew the split.
+        def left():
+            for _ in range(4):
+                leaf()
+
+        def right():
+            for _ in range(8):
+                leaf()
+
+        def root():
+            left()
+            right()
+        profiler = cProfile.Profile()
+        profiler.runcall(root)
+        stacks = profiling.collapsed_stacks(pstats.Stats(profiler))
+
+        def under(caller):
+            return sum(micros for stack, micros in stacks.items() if f';{caller} (' in stack and ';leaf (' in stack)
+        left_time, right_time = under('left'), under('right')
+        self.assertGreater(left_time, 5000)
+        self.assertAlmostEqual(right_time / left_time, 2, delta=0.5)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class QueryPlanTest(TestCase):
+    """Test that hot queries are served by an index rather than a table scan."""
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset):
+        plan = self.plan(queryset)
+        for step in plan:
+            if step.startswith('SCAN'):
+                self.assertIn('INDEX', step, plan)
+            self.assertNotIn('TEMP B-TREE', step, plan)
+        self.assertTrue(any('INDEX' in step for step in plan), plan)
+
+    def test_activities_for_user_by_date(self):
+        """Test that a user's activity history uses the (user_id, date) index."""
+        self.assertUsesIndex(Activity.objects.filter(user_id=1).order_by('date'))
+
+    def test_activities_keyset_page(self):
+        """Test that an activity page uses the (date, id) index."""
+        self.assertUsesIndex(Activity.objects.order_by('-date', '-id')[:100])
+
+    def test_users_by_team(self):
+        """Test that team membership lookups use the team_id index."""
+        self.assertUsesIndex(User.objects.filter(team_id=1))
+
+    def test_users_keyset_page(self):
+        """Test that a user page uses the (created_at, id) index."""
+        self.assertUsesIndex(User.objects.order_by('created_at', 'id')[:100])
+
+    def test_leaderboard_entry_for_user(self):
+        """Test that a user's leaderboard row is found through the user_id index."""
+        self.assertUsesIndex(Leaderboard.objects.filter(user_id=1))
+
+    def test_leaderboard_top_by_rank(self):
+        """Test that the top of the board is read through the rank index."""
+        self.assertUsesIndex(Leaderboard.objects.order_by('rank')[:10])
+
+    def test_leaderboard_rank_window(self):
+        """Test that a window of ranks is read as a range on the rank index."""
+        self.assertUsesIndex(Leaderboard.objects.filter(rank__gte=5, rank__lte=15).order_by('rank'))
+
+    def test_leaderboard_team_by_rank(self):
+        """Test that a team's standings use the (team_id, rank) index."""
+        self.assertUsesIndex(Leaderboard.objects.filter(team_id=1).order_by('rank'))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class IndexedFilterTest(APITestCase):
+    """Test cases for ?user_id=, ?team_id=, date ranges and ?ordering= on the lists."""
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=f'Team {i}') for i in range(2)]
+        self.users = [
+            User.objects.create(name=f'User {i}', email=f'filter{i}@example.com', password='pw',
+                                team=self.teams[i % 2])
+            for i in range(4)
+        ]
+        self.today = date.today()
+        Activity.objects.bulk_create([
+            Activity(user=self.users[i % 4], activity_type=('Running', 'Yoga', 'Boxing')[i % 3],
+                     duration=30, calories=10 * i, date=self.today - timedelta(days=i % 7))
+            for i in range(30)
+        ])
+        leaderboard.rebuild()
+
+    def ids(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['id'] for row in rows]
+
+    def test_activity_filters(self):
+        """Test that each activity filter returns exactly the matching rows, newest first."""
+        url = reverse('activity-list')
+        user = self.users[1]
+        since = self.today - timedelta(days=2)
+        cases = [
+            ({'user_id': user.pk}, Activity.objects.filter(user=user)),
+            ({'activity_type': 'Yoga'}, Activity.objects.filter(activity_type='Yoga')),
+            ({'date_from': str(since)}, Activity.objects.filter(date__gte=since)),
+            ({'user_id': user.pk, 'date_from': str(since), 'date_to': str(self.today)},
+             Activity.objects.filter(user=user, date__gte=since, date__lte=self.today)),
+        ]
+        for params, expected in cases:
+            self.assertEqual(self.ids(url, params),
+                             list(expected.order_by('-date', '-id').values_list('id', flat=True)), params)
+
+    def test_ordering_pages_through_every_row(self):
+        """Test that ?ordering=date walks the filtered rows oldest first across pages."""
+        user = self.users[2]
+        url = reverse('activity-list') + f'?user_id={user.pk}&ordering=date&page_size=2'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, list(Activity.objects.filter(user=user).order_by('date', 'id')
+                                   .values_list('id', flat=True)))
+
+    def test_team_filters(self):
+        """Test that users and leaderboard rows filter by team."""
+        team = self.teams[1]
+        self.assertEqual(self.ids(reverse('user-list'), {'team_id': team.pk}),
+                         list(User.objects.filter(team=team).order_by('created_at', 'id')
+                              .values_list('id', flat=True)))
+        rows = self.client.get(reverse('leaderboard-list'), {'team_id': team.pk, 'ordering': '-rank'}).data
+        self.assertEqual([row['team_id'] for row in rows], [team.pk] * 2)
+        self.assertGreater(rows[0]['rank'], rows[1]['rank'])
+
+    def test_leaderboard_defaults_to_rank_order(self):
+        """Test that the all-time board comes back in rank order."""
+        ranks = [row['rank'] for row in self.client.get(reverse('leaderboard-list')).data]
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_invalid_parameters_are_rejected(self):
+        """Test that bad values, unknown orderings and unindexed combinations are 400s."""
+        cases = [
+            ('activity-list', {'user_id': 'abc'}, 'user_id'),
+            ('activity-list', {'date_from': 'yesterday'}, 'date_from'),
+            ('activity-list', {'ordering': 'calories'}, 'ordering'),
+            ('user-list', {'ordering': 'name'}, 'ordering'),
+        ]
+        for name, params, key in cases:
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn(key, response.data)
+        response = self.client.get(reverse('activity-list'), {'user_id': self.users[0].pk, 'activity_type': 'Yoga'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not supported', str(response.data[0]))
+
+    def test_every_accepted_combination_uses_an_index(self):
+        """Test that any accepted filter and ordering combination runs without a scan or sort."""
+        values = {
+            'user_id': self.users[0].pk, 'team_id': self.teams[0].pk, 'activity_type': 'Yoga',
+            'date_from': str(self.today - timedelta(days=3)), 'date_to': str(self.today),
+        }
+        for name in ('activity', 'user', 'leaderboard'):
+            view = resolve(reverse(f'{name}-list')).func.cls
+            params = list(view.filter_fields)
+            accepted = 0
+            for size in range(len(params) + 1):
+                for chosen in itertools.combinations(params, size):
+                    for ordering in (None, *view.ordering_fields):
+                        query = {param: values[param] for param in chosen}
+                        if ordering:
+                            query['ordering'] = ordering
+                        cache.clear()
+                        with CaptureQueriesContext(connection) as queries:
+                            response = self.client.get(reverse(f'{name}-list'), query)
+                        if response.status_code == status.HTTP_400_BAD_REQUEST:
+                            continue
+                        self.assertEqual(response.status_code, status.HTTP_200_OK, query)
+                        accepted += 1
+                        table = view.queryset.model._meta.db_table
+                        for captured in queries.captured_queries:
+                            if f'FROM "{table}"' not in captured['sql']:
+                                continue
+                            with connection.cursor() as cursor:
+                                cursor.execute(f'EXPLAIN QUERY PLAN {captured["sql"]}')
+                                plan = [row[-1] for row in cursor.fetchall()]
+                            for step in plan:
+                                if step.startswith('SCAN'):
+                                    self.assertIn('INDEX', step, (query, plan))
+                                self.assertNotIn('TEMP B-TREE', step, (query, plan))
+            self.assertGreater(accepted, len(params), name)
+
+
+class RelationTest(APITestCase):
+    """Test cases for the user and team foreign keys."""
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=f'Team {i}') for i in range(3)]
+
+    def seed(self, count):
+        for i in range(count):
+            user = User.objects.create(name=f'Runner {i}', email=f'runner{i}@example.com', password='pw',
+                                       team=self.teams[i % 3] if i % 4 else None)
+            Activity.objects.create(user=user, activity_type='Running', duration=30, calories=10 * (i + 1),
+                                    date=date.today())
+
+    def queries_for(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_leaderboard_names_cost_constant_queries(self):
+        """Test that a leaderboard page with names costs the same queries for 3 or 30 rows."""
+        self.seed(3)
+        _, few = self.queries_for(reverse('leaderboard-list'))
+        User.objects.all().delete()
+        self.seed(30)
+        response, many = self.queries_for(reverse('leaderboard-list'))
+        self.assertEqual(few, many)
+        rows = {row['rank']: row for row in response.data}
+        self.assertEqual((rows[1]['user_name'], rows[1]['team_name']), ('Runner 29', 'Team 2'))
+        self.assertEqual(rows[1]['team_id'], self.teams[2].pk)
+        self.assertIsNone(rows[2]['team_name'])
+
+    def test_fast_path_reads_names_through_a_join(self):
+        """Test that the fast list path matches the serializer for related names."""
+        self.seed(6)
+        url = reverse('leaderboard-list')
+        cache.clear()
+        fast = self.client.get(url)
+        cache.clear()
+        with mock.patch.object(FastListMixin, 'fast_list', False):
+            slow = self.client.get(url)
+        self.assertEqual(fast.content, slow.content)
+        response, _ = self.queries_for(url + '?fields=rank,user_name')
+        self.assertIn({'rank': 1, 'user_name': 'Runner 5'}, response.data)
+
+    def test_unknown_references_are_rejected(self):
+        """Test that writes naming a missing user or team are validation errors."""
+        response = self.client.post(reverse('activity-list'), {
+            'user_id': 9999, 'activity_type': 'Yoga', 'duration': 10, 'calories': 10, 'date': str(date.today())
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('user_id', response.data)
+        response = self.client.post(reverse('user-list'), {
+            'name': 'A', 'email': 'a@example.com', 'password': 'pw', 'team_id': 9999
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('team_id', response.data)
+
+    def test_bulk_resolves_users_in_one_query(self):
+        """Test that bulk ingestion looks every user up at once."""
+        self.seed(5)
+        users = list(User.objects.values_list('pk', flat=True))
+        items = [
+            {'user_id': users[i % 5], 'activity_type': 'Yoga', 'duration': 10, 'calories': 5,
+             'date': str(date.today())}
+            for i in range(40)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('activity-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user_reads = [query for query in queries if query['sql'].startswith('SELECT') and 'FROM "users"' in query['sql']]
+        self.assertLessEqual(len(user_reads), 1)
+
+    def test_deleting_a_user_removes_their_data(self):
+        """Test that deleting a user cascades to activities and keeps the team board consistent."""
+        self.seed(6)
+        user = User.objects.get(name='Runner 5')
+        user.delete()
+        self.assertFalse(Activity.objects.filter(user_id=user.pk).exists())
+        self.assertFalse(Leaderboard.objects.filter(user_id=user.pk).exists())
+        self.assertFalse(DailyPoints.objects.filter(user_id=user.pk).exists())
+        self.assertFalse(UserStats.objects.filter(user_id=user.pk).exists())
+        self.assertEqual(list(Leaderboard.objects.order_by('rank').values_list('user_id', 'total_points', 'rank')),
+                         leaderboard.compute_standings())
+        self.assertEqual(
+            list(TeamStanding.objects.order_by('rank').values_list('team_id', 'total_points', 'member_count', 'rank')),
+            leaderboard.compute_team_standings())
+
+    def test_deleting_a_team_clears_membership(self):
+        """Test that deleting a team leaves its members teamless on the board."""
+        self.seed(6)
+        team_id = self.teams[1].pk
+        self.teams[1].delete()
+        self.assertFalse(User.objects.filter(team_id=team_id).exists())
+        self.assertFalse(Leaderboard.objects.filter(team_id=team_id).exists())
+        self.assertEqual(list(TeamStanding.objects.order_by('rank').values_list('rank', flat=True)), [1, 2])
+
+    def test_renaming_a_user_refreshes_cached_board(self):
+        """Test that a cached leaderboard picks up a changed user name."""
+        self.seed(2)
+        self.client.get(reverse('leaderboard-list'))
+        User.objects.filter(name='Runner 1').update(name='Renamed')
+        user = User.objects.get(name='Renamed')
+        user.save()
+        names = [row['user_name'] for row in self.client.get(reverse('leaderboard-list')).data]
+        self.assertIn('Renamed', names)
+
+
+class ForeignKeyMigrationTest(TransactionTestCase):
+    """Test cases for the backfill that turns string references into foreign keys."""
+
+    before = [('octofit_tracker', '0005_user_stats')]
+    after = [('octofit_tracker', '0006_foreign_keys')]
+
+    def tearDown(self):
+        call_command('migrate', 'octofit_tracker', verbosity=0)
+
+    def test_references_are_resolved_or_dropped(self):
+        """Test that known ids are kept, unknown nullable ones cleared and orphans deleted."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        OldTeam = apps.get_model('octofit_tracker', 'Team')
+        OldUser = apps.get_model('octofit_tracker', 'User')
+        OldActivity = apps.get_model('octofit_tracker', 'Activity')
+        OldLeaderboard = apps.get_model('octofit_tracker', 'Leaderboard')
+        team = OldTeam.objects.create(name='Blue', description='')
+        user = OldUser.objects.create(name='A', email='a@example.com', password='pw', team_id=f' {team.pk}')
+        stray = OldUser.objects.create(name='B', email='b@example.com', password='pw', team_id='gone')
+        for user_id in (str(user.pk), str(stray.pk), 'ghost'):
+            OldActivity.objects.create(user_id=user_id, activity_type='Running', duration=30, calories=10,
+                                       date=date.today())
+        OldLeaderboard.objects.create(user_id=str(user.pk), team_id='gone', total_points=10, rank=1)
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        NewUser = apps.get_model('octofit_tracker', 'User')
+        NewActivity = apps.get_model('octofit_tracker', 'Activity')
+        NewLeaderboard = apps.get_model('octofit_tracker', 'Leaderboard')
+        self.assertEqual(NewUser.objects.get(pk=user.pk).team_id, team.pk)
+        self.assertIsNone(NewUser.objects.get(pk=stray.pk).team_id)
+        self.assertEqual(sorted(NewActivity.objects.values_list('user_id', flat=True)), sorted([user.pk, stray.pk]))
+        self.assertEqual(list(NewLeaderboard.objects.values_list('user_id', 'team_id')), [(user.pk, None)])
+
+
+class ChangeFeedMigrationTest(TransactionTestCase):
+    """Test cases for the backfill that seeds the change feed."""
+
+    before = [('octofit_tracker', '0008_ingest_checkpoints')]
+    after = [('octofit_tracker', '0009_change_feed')]
+
+    def tearDown(self):
+        call_command('migrate', 'octofit_tracker', verbosity=0)
+
+    def test_existing_rows_are_recorded(self):
+        """Test that every existing row gets one entry, so a sync from zero returns it."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        team = apps.get_model('octofit_tracker', 'Team').objects.create(name='Blue', description='')
+        users = [
+            apps.get_model('octofit_tracker', 'User').objects.create(
+                name=name, email=f'{name}@example.com', password='pw', team_id=team.pk).pk
+            for name in ('a', 'b')
+        ]
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        entries = apps.get_model('octofit_tracker', 'Change').objects.order_by('id')
+        self.assertEqual(list(entries.values_list('collection', 'object_id', 'deleted')),
+                         [('teams', team.pk, False), ('users', users[0], False), ('users', users[1], False)])
+
+
+class BenchmarkRoutesTest(TestCase):
+    """Test cases for the routes scenario of the benchmark command."""
+
+    def run_routes(self, *args):
+        output = StringIO()
+        call_command('benchmark', 'routes', '--rows', '40', '--iterations', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def test_every_route_is_measured(self):
+        """Test that every router route is benchmarked, written as JSON and rolled back."""
+        from .urls import router
+        with tempfile.NamedTemporaryFile(suffix='.json') as results:
+            self.run_routes('--json', results.name)
+            run = json.load(open(results.name))
+        routes = run['results']['routes']
+        for _, viewset, basename in router.registry:
+            self.assertIn(f'GET {basename}-list', routes)
+            self.assertIn(f'GET {basename}-detail', routes)
+            self.assertEqual(f'POST {basename}-list' in routes, hasattr(viewset, 'create'), basename)
+        self.assertIn('GET user-stats', routes)
+        self.assertIn('POST activity-bulk', routes)
+        self.assertIn('GET leaderboard-list?window=week', routes)
+        for label, record in routes.items():
+            self.assertTrue(all(code < 400 for code in record['statuses']), label)
+            self.assertLessEqual(record['p50_ms'], record['p99_ms'])
+            self.assertGreater(record['queries'], 0, label)
+        self.assertFalse(Activity.objects.exists())
+
+    def test_regressions_are_flagged(self):
+        """Test that --compare fails on a slower run and passes against itself."""
+        with tempfile.NamedTemporaryFile(suffix='.json') as results:
+            self.run_routes('--json', results.name)
+            run = json.load(open(results.name))
+            self.assertIn('no regressions', self.run_routes('--compare', results.name, '--threshold', '1000'))
+            for record in run['results']['routes'].values():
+                record['p95_ms'] /= 10000
+            with open(results.name, 'w') as baseline:
+                json.dump(run, baseline)
+            with self.assertRaisesMessage(CommandError, 'regression'):
+                self.run_routes('--compare', results.name)
+
+
+class PopulateDataGenerationTest(TestCase):
+    """Test cases for the seeded data generators used by populate_db."""
+
+    def generate(self, seed, index, per_user=None):
+        from .management.commands.populate_db import generate_activities
+        anchor = datetime(2025, 1, 1)
+        return [
+            {key: value for key, value in activity.items() if key != 'created_at'}
+            for activity in generate_activities(seed, index, 'user', per_user, anchor)
+        ]
+
+    def test_same_seed_yields_same_activities(self):
+        """Test that a seed reproduces the same activities for a user."""
+        self.assertEqual(self.generate(7, 3), self.generate(7, 3))
+        self.assertNotEqual(self.generate(7, 3), self.generate(8, 3))
+
+    def test_activities_per_user_is_honoured(self):
+        """Test that --activities-per-user fixes the count."""
+        self.assertEqual(len(self.generate(1, 0, per_user=25)), 25)
+
+    def test_users_alternate_teams_after_heroes(self):
+        """Test that users beyond the classic heroes become numbered recruits."""
+        from .management.commands.populate_db import hero_for
+        self.assertEqual(hero_for(0), (0, {'name': 'Iron Man', 'email': 'ironman@marvel.com', 'password': 'stark123'}))
+        self.assertEqual(hero_for(13)[0], 1)
+        self.assertEqual(hero_for(13)[1]['email'], 'recruit14@octofit.com')
+
+    def test_feed_entries_stream_upserts_and_tombstones(self):
+        """Test that the rewritten sync feed is merged from sorted id streams without reading them ahead."""
+        from .management.commands.populate_db import feed_entries
+        self.assertEqual(list(feed_entries([2, 3, 5], [1, 3, 4, 6, 7])),
+                         [(1, True), (2, False), (3, False), (4, True), (5, False), (6, True), (7, True)])
+        self.assertEqual(list(feed_entries([], [])), [])
+        entries = feed_entries(itertools.count(1), iter([2]))
+        self.assertEqual(list(itertools.islice(entries, 3)), [(1, False), (2, False), (3, False)])
+
+
 class APIRootTest(APITestCase):
     """Test cases for API root endpoint."""
 
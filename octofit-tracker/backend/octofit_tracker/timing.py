@@ -0,0 +1,65 @@
+"""
+Request-scoped timers.
+
+``ServerTimingMiddleware`` opens a set of named accumulators for each request;
+code that wants its time reported adds to them with ``measure`` or ``add``.
+Outside a request both are no-ops. Every database connection reports its
+queries through ``track_query``; the accumulators live in a context variable,
+which ``sync_to_async`` carries into worker threads, so queries are counted
+whichever thread runs them.
+"""
+from contextvars import ContextVar
+from time import perf_counter
+
+_current = ContextVar('octofit_timings', default=None)
+
+
+def begin():
+    """Start collecting for the current request; returns ``(timings, token)``."""
+    timings = {}
+    return timings, _current.set(timings)
+
+
+def end(token):
+    _current.reset(token)
+
+
+def add(name, seconds):
+    """Add ``seconds`` to the ``name`` timer of the current request."""
+    timings = _current.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def track_query(execute, sql, params, many, context):
+    """Execute wrapper counting and timing a query against the current request."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings['db'] = timings.get('db', 0.0) + perf_counter() - start
+        timings['queries'] = timings.get('queries', 0) + 1
+
+
+def install(connection):
+    """Have ``connection`` report its queries, once however often it reconnects."""
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_query)
+
+
+class measure:
+    """Context manager adding the time spent in its block to the ``name`` timer."""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add(self.name, perf_counter() - self.start)
@@ -0,0 +1,93 @@
+"""
+Idempotent activity writes.
+
+An activity sent with an ``external_id`` is identified by ``(user_id,
+external_id)``, which a unique index enforces. Writing it again updates the
+stored row instead of adding another one, and when nothing changed, as with a
+device retrying a sync, the write is a single indexed lookup. Activities
+without an ``external_id`` are always inserted.
+
+Concurrent writes of one key are only caught by the unique index, which is
+partial (rows without a key stay out of it). SQL backends need partial index
+support for Django to create it; on djongo, which has none, migration 0010
+creates a partial index through the driver instead. ``check_key_index``
+fails the system checks on any other backend.
+"""
+from django.core import checks
+from django.db import IntegrityError, connections, transaction
+
+from . import caching, sync
+from .models import Activity
+from .signals import activities_bulk_created
+
+# What a repeated write may change; the key itself and created_at stay.
+FIELDS = ('activity_type', 'duration', 'distance', 'calories', 'date')
+
+
+def key(activity):
+    return None if activity.external_id is None else (activity.user_id, activity.external_id)
+
+
+@checks.register(checks.Tags.models)
+def check_key_index(app_configs=None, **kwargs):
+    errors = []
+    for connection in connections.all():
+        if connection.vendor != 'djongo' and not connection.features.supports_partial_indexes:
+            errors.append(checks.Error(
+                f'Database "{connection.alias}" cannot create the partial unique index '
+                'activities_user_external_id_uniq, so retried activity writes could be stored twice.',
+                hint='Use a backend with partial index support (SQLite, PostgreSQL) or djongo.',
+                id='octofit_tracker.E001',
+            ))
+    return errors
+
+
+def upsert(activities, attempts=3):
+    """
+    Write the unsaved ``activities``, matching keyed ones against stored rows.
+
+    Returns ``(activity, created)`` per input in input order, where
+    ``activity`` is the stored row. When a concurrent request inserts one of
+    the keys first, the unique index rejects the batch and it is matched
+    again, this time finding that row. However many rows an attempt writes,
+    it records them in the sync feed and bumps their caches once.
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic(), caching.batched(), sync.batched():
+                return _upsert(activities)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+def _upsert(activities):
+    keys = {key(activity) for activity in activities} - {None}
+    rows = {}
+    if keys:
+        stored = Activity.objects.filter(user_id__in={user_id for user_id, _ in keys},
+                                         external_id__in={external_id for _, external_id in keys})
+        rows = {key(row): row for row in stored if key(row) in keys}
+
+    results, new, changed = [], [], {}
+    for activity in activities:
+        row = rows.get(key(activity))
+        if row is None:
+            if key(activity) is not None:
+                rows[key(activity)] = activity
+            new.append(activity)
+            results.append((activity, True))
+            continue
+        # A later copy of a key, from storage or earlier in this batch, wins.
+        for name in FIELDS:
+            if getattr(row, name) != getattr(activity, name):
+                setattr(row, name, getattr(activity, name))
+                if row.pk is not None:
+                    changed[row.pk] = row
+        results.append((row, False))
+
+    for row in changed.values():
+        row.save(update_fields=FIELDS)
+    if new:
+        activities_bulk_created(Activity.objects.bulk_create(new))
+    return results
@@ -17,7 +17,11 @@ import os
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, TeamViewSet, ActivityViewSet, LeaderboardViewSet, WorkoutViewSet, api_root
+from .async_views import AsyncReadView
+from .views import (
+    UserViewSet, TeamViewSet, ActivityViewSet, LeaderboardViewSet, WorkoutViewSet, api_root, prometheus_metrics,
+    sync_changes,
+)
 
 # API endpoint format: https://$CODESPACE_NAME-8000.app.github.dev/api/[component]/
 # Example: https://$CODESPACE_NAME-8000.app.github.dev/api/activities/
@@ -29,8 +33,22 @@ router.register(r'activities', ActivityViewSet)
 router.register(r'leaderboard', LeaderboardViewSet)
 router.register(r'workouts', WorkoutViewSet)
 
+# The same list and detail reads served by async views for ASGI deployments:
+# /api/async/[component]/ and /api/async/[component]/[id]/
+async_urls = []
+for prefix, viewset, basename in router.registry:
+    fallback_params = ('window',) if viewset is LeaderboardViewSet else ()
+    view = AsyncReadView.as_view(viewset=viewset, fallback_params=fallback_params)
+    async_urls += [
+        path(f'{prefix}/', view, name=f'async-{basename}-list'),
+        path(f'{prefix}/<str:pk>/', view, name=f'async-{basename}-detail'),
+    ]
+
 urlpatterns = [
     path('', api_root, name='api-root'),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('admin/', admin.site.urls),
+    path('api/async/', include(async_urls)),
+    path('api/sync/', sync_changes, name='sync'),
     path('api/', include(router.urls)),
 ]
@@ -1,9 +1,27 @@
-from rest_framework import viewsets
-from rest_framework.decorators import api_view
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from .models import User, Team, Activity, Leaderboard, Workout
-from .serializers import UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer
+from rest_framework.settings import api_settings
+from . import ingest, metrics, rollups, sync, upserts
+from .caching import CachedResponseMixin, ConditionalGetMixin
+from .fastpath import FastListMixin, plain_fields
+from .fieldsets import SparseFieldsetMixin
+from .filtering import IndexedFilterMixin
+from .models import User, Team, Activity, Leaderboard, TeamStanding, Workout
+from .pagination import ActivityPagination, UserPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer, join_lines
+from .serializers import (
+    UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, TeamStandingSerializer,
+    WorkoutSerializer, RelatedIdField,
+)
+from .stats import summary_for
 
 
 @api_view(['GET'])
@@ -17,30 +35,309 @@ def api_root(request, format=None):
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
+        'sync': reverse('sync', request=request, format=format),
         'admin': reverse('admin:index', request=request, format=format),
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@require_GET
+def prometheus_metrics(request):
+    """
+    Request, latency, response size, error and database metrics for this
+    process in the Prometheus text format.
+    """
+    return HttpResponse(metrics.REGISTRY.exposition(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+def sync_changes(request, format=None):
+    """
+    Rows created, updated or deleted since ``?since=<token>`` (default 0,
+    i.e. everything), grouped by collection with deletes as tombstones.
+    ``?collections=activities,users`` narrows the feed and ``?limit=`` caps
+    the number of changes per response (default 1000). Pass the returned
+    ``next`` token as ``since`` to continue; ``more`` says whether to.
+    Changes appear ``OCTOFIT_SYNC_LAG`` seconds after they are made.
+    """
+    since = _count(request, 'since', 0, 0, None)
+    limit = _count(request, 'limit', 1000, 1, 10000)
+    collections = [name.strip() for name in request.query_params.get('collections', '').split(',') if name.strip()]
+    unknown = [name for name in collections if name not in sync.COLLECTIONS]
+    if unknown:
+        raise ValidationError({'collections': [f'Unknown collection "{name}".' for name in unknown]})
+    return Response(sync.changes_since(since, collections, limit))
+
+
+def _as_of(request):
+    """Read an optional ``?as_of=YYYY-MM-DD`` parameter, defaulting to today."""
+    as_of = request.query_params.get('as_of')
+    if not as_of:
+        return timezone.localdate()
+    try:
+        return serializers.DateField().to_internal_value(as_of)
+    except ValidationError as exc:
+        raise ValidationError({'as_of': exc.detail})
+
+
+def _count(request, name, default, minimum, maximum):
+    """Read an optional integer ``?name=`` parameter within ``[minimum, maximum]``."""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        return serializers.IntegerField(min_value=minimum, max_value=maximum).run_validation(value)
+    except ValidationError as exc:
+        raise ValidationError({name: exc.detail})
+
+
+class AtomicWriteMixin:
+    """
+    Commit each write together with the leaderboard, rollup and stats
+    updates its signal handlers make, or none of them.
+    """
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
+
+
+class UserViewSet(AtomicWriteMixin, ConditionalGetMixin, SparseFieldsetMixin, FastListMixin, IndexedFilterMixin,
+                  viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserPagination
+    filter_fields = {'team_id': ('team', 'exact')}
+    ordering_fields = {'created_at': ('created_at', 'id'), '-created_at': ('-created_at', '-id')}
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Totals, per-type breakdown, weekly trend and current streak for a user,
+        read from their incrementally maintained summary. ``?as_of=YYYY-MM-DD``
+        (default today) anchors the trend and streak.
+        """
+        user = self.get_object()
+        return Response(summary_for(user.pk, _as_of(request)))
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(AtomicWriteMixin, ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin, FastListMixin,
+                  viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
 
+    @action(detail=False, methods=['get'], serializer_class=TeamStandingSerializer)
+    def leaderboard(self, request):
+        """Team standings, read from the materialized per-team rollup."""
+        def build():
+            standings = TeamStanding.objects.select_related('team').order_by('rank')
+            return Response(self.get_serializer(standings, many=True).data)
+        return self.cached(request, build, models=(TeamStanding, Team))
+
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(AtomicWriteMixin, ConditionalGetMixin, SparseFieldsetMixin, FastListMixin, IndexedFilterMixin,
+                      viewsets.ModelViewSet):
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityPagination
+    filter_fields = {
+        'user_id': ('user', 'exact'),
+        'activity_type': ('activity_type', 'exact'),
+        'date_from': ('date', 'gte'),
+        'date_to': ('date', 'lte'),
+    }
+    ordering_fields = {'date': ('date', 'id'), '-date': ('-date', '-id')}
+    sparse_actions = ('list', 'retrieve', 'export')
+    bulk_max_items = 5000
+    export_chunk_size = 2000
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create an activity, or when the user already has one with the same
+        ``external_id``, update that one and answer 200. With
+        ``OCTOFIT_INGEST_QUEUE`` set validate it, queue it for the ingestion
+        worker and answer 202 with its ticket.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if ingest.get_queue() is not None:
+            ticket, = ingest.enqueue([serializer.validated_data])
+            return Response({'ticket': ticket, 'data': serializer.data}, status=status.HTTP_202_ACCEPTED)
+        (activity, created), = upserts.upsert([Activity(**serializer.validated_data)])
+        data = self.get_serializer(activity).data
+        if not created:
+            return Response(data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+    @action(detail=False, methods=['post'],
+            parser_classes=[*api_settings.DEFAULT_PARSER_CLASSES, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array or NDJSON body in one batch.
+
+        Every item is validated, the valid ones are written with a single
+        ``bulk_create``, and the response lists one result per input item in
+        input order. Items whose ``external_id`` the user already has update
+        that activity and are reported as 200s. Returns 201 when every item
+        was written, 207 when only some were, and 400 when none were. With
+        ``OCTOFIT_INGEST_QUEUE`` set the valid items are queued instead and
+        reported as 202s.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of activities.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'detail': f'At most {self.bulk_max_items} activities per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # One serializer instance validates every item so DRF builds the
+        # field set once rather than once per row.
+        validator = self.get_serializer()
+        for name, field in validator.fields.items():
+            if isinstance(field, RelatedIdField):
+                field.preload(item.get(name) for item in items if isinstance(item, dict))
+        results = [None] * len(items)
+        pending = []
+        for index, item in enumerate(items):
+            try:
+                pending.append((index, validator.run_validation(item)))
+            except ValidationError as exc:
+                results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'errors': exc.detail}
+
+        if ingest.get_queue() is not None:
+            accepted = status.HTTP_202_ACCEPTED
+            tickets = ingest.enqueue([data for _, data in pending]) if pending else []
+            for (index, data), ticket in zip(pending, tickets):
+                results[index] = {'status': accepted, 'ticket': ticket, 'data': validator.to_representation(data)}
+        else:
+            accepted = status.HTTP_201_CREATED
+            written = upserts.upsert([Activity(**data) for _, data in pending])
+            rendered = self.get_serializer([activity for activity, _ in written], many=True).data
+            for (index, _), (_, created), data in zip(pending, written, rendered):
+                results[index] = {'status': accepted if created else status.HTTP_200_OK, 'data': data}
+
+        if len(pending) == len(items):
+            response_status = accepted
+        elif pending:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(pending), 'failed': len(items) - len(pending), 'results': results},
+                        status=response_status)
 
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream activities as NDJSON (default) or CSV, oldest first.
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
-    queryset = Leaderboard.objects.all()
+        ``?format=ndjson|csv`` or the Accept header picks the output,
+        ``?since=YYYY-MM-DD`` limits it to activities on or after a date and
+        ``?fields=``/``?exclude=`` pick the columns. Rows
+        are read through a chunked server-side iterator and written as they
+        arrive, so memory use does not grow with the size of the table.
+        """
+        queryset = self.get_queryset().order_by('date', 'id')
+        since = request.query_params.get('since')
+        if since:
+            try:
+                queryset = queryset.filter(date__gte=serializers.DateField().to_internal_value(since))
+            except ValidationError as exc:
+                raise ValidationError({'since': exc.detail})
+
+        columns = plain_fields(self.get_serializer())
+        rows = queryset.values(*dict.fromkeys(lookup for lookup, _ in columns.values()))
+        represented = (
+            {name: convert(row[lookup]) for name, (lookup, convert) in columns.items()}
+            for row in rows.iterator(chunk_size=self.export_chunk_size)
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            join_lines(renderer.lines(represented, list(columns))),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="activities.{renderer.format}"'
+        return response
+
+
+class LeaderboardViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin, FastListMixin,
+                         IndexedFilterMixin, viewsets.ReadOnlyModelViewSet):
+    # Read-only: points and contiguous ranks are only ever written by
+    # leaderboard.apply_points as activities change.
+    queryset = Leaderboard.objects.select_related('user', 'team')
     serializer_class = LeaderboardSerializer
+    filter_fields = {'team_id': ('team', 'exact')}
+    ordering_fields = {'rank': ('rank',), '-rank': ('-rank',)}
+    default_ordering = 'rank'
+    sparse_actions = ('list', 'retrieve', 'top', 'around')
+    max_top = 100
+    max_radius = 50
+    # Rows carry user and team names.
+    cache_models = (Leaderboard, User, Team)
+
+    def list(self, request, *args, **kwargs):
+        """
+        The all-time board, or with ``?window=day|week|month|rolling30`` (and
+        optionally ``&as_of=YYYY-MM-DD``, default today) the standings for
+        that window, summed from daily point buckets.
+        """
+        window = request.query_params.get('window')
+        if window is None:
+            return super().list(request, *args, **kwargs)
+        if window not in rollups.WINDOWS:
+            raise ValidationError({'window': f'Expected one of {", ".join(rollups.WINDOWS)}.'})
+        as_of = _as_of(request)
+        start, end = rollups.window_bounds(window, as_of)
+        return Response({
+            'window': window,
+            'start': start,
+            'end': end,
+            'results': rollups.window_standings(window, as_of),
+        })
+
+    def ranked(self, request, build):
+        return self.conditional(request, lambda: self.cached(request, build))
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """
+        The ``?k=`` best-ranked entries (default 10), read in order off the
+        rank index, so the cost grows with ``k`` and not with the board.
+        """
+        k = _count(request, 'k', 10, 1, self.max_top)
+
+        def build():
+            entries = self.get_queryset().order_by('rank')[:k]
+            return Response(self.get_serializer(entries, many=True).data)
+        return self.ranked(request, build)
+
+    @action(detail=False, methods=['get'], url_path=r'around/(?P<user_id>[0-9]+)')
+    def around(self, request, user_id=None):
+        """
+        A user's entry with the ``?radius=`` entries (default 5) ranked
+        directly above and below it: one lookup on the user index and one
+        range read on the rank index.
+        """
+        radius = _count(request, 'radius', 5, 0, self.max_radius)
+
+        def build():
+            rank = Leaderboard.objects.filter(user_id=user_id).values_list('rank', flat=True).first()
+            if rank is None:
+                raise NotFound('User is not on the leaderboard.')
+            entries = self.get_queryset().filter(rank__gte=rank - radius, rank__lte=rank + radius).order_by('rank')
+            return Response(self.get_serializer(entries, many=True).data)
+        return self.ranked(request, build)
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin, FastListMixin,
+                     viewsets.ModelViewSet):
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer